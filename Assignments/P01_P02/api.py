@@ -7,11 +7,18 @@ It receives requests from the shell, performs the necessary CRUD operations usin
 sqliteCRUD, and returns the appropriate responses based on the database state.
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from sqliteCRUD import SqliteCRUD
+from grepengine import GrepEngine, compile_pattern
+from batch import BatchRunner
+from pipeline import Pipeline, PipelineError
+from dbexecutor import DbExecutor, Overloaded
+from groupcommit import GroupCommitWriter
 import uvicorn
+import json
 import logging
+import re
 
 description = """🚀
 ## File System Api
@@ -32,6 +39,23 @@ app = FastAPI(    title="File System",
     },
 )
 db = SqliteCRUD()
+grep_engine = GrepEngine(db)
+batch_runner = BatchRunner(db)
+
+# Every route that touches the database is an async handler whose blocking
+# work runs here, on threads of its own rather than Starlette's threadpool
+db_executor = DbExecutor(workers=8, max_pending=128)
+
+# Routes that write go through one writer thread instead, which commits the
+# writes waiting at any moment together (see groupcommit.py)
+db_writer = GroupCommitWriter(db, max_batch=64)
+db.cache_writer = db_writer  # line indexes and wc counts built by readers are saved by the writer too
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Turn a full database queue into 503 so clients back off and retry."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 # Documentation page when visiting root
 @app.get("/")
@@ -93,14 +117,15 @@ def _format_permissions(item):
 
 
 @app.get("/ls/{pid}")
+@db_executor.handler
 def list_directory(pid: int, l: bool = False, a: bool = False, h: bool = False, name: str = None):
     """List the contents of a directory with optional flags, handling both files and directories."""
     try:
-        logging.debug(f"Received request to list directory with pid={pid}, name={name}, flags l={l}, a={a}, h={h}")
+        logging.debug("Listing directory pid=%s, name=%s, flags l=%s, a=%s, h=%s", pid, name, l, a, h)
         
         # Fetch the directory and file contents
         contents = db.list_directory(pid, name)
-        logging.debug(f"Directory and file contents: {contents}")  # Debugging
+        logging.debug("Directory and file contents: %s", contents)
 
         # Build the response data based on flags
         response_data = []
@@ -170,7 +195,7 @@ def list_directory(pid: int, l: bool = False, a: bool = False, h: bool = False,
                     'size': size  # For files, size is relevant
                 })
 
-        logging.debug(f"Returning directory and file contents: {response_data}")
+        logging.debug("Returning directory and file contents: %s", response_data)
         return {"contents": response_data}
 
     except Exception as e:
@@ -182,9 +207,9 @@ def list_directory(pid: int, l: bool = False, a: bool = False, h: bool = False,
 ### 2. Make Directory
 
 @app.post("/mkdir/")
+@db_writer.handler
 def create_directory(name: str, pid: int, oid: int):
     """Create a new directory."""
-    print(f"{name}, {pid}, {oid}")
     try:
         # response = db.create_directory(name, pid, oid) # change here, use griff return package
         dir_id = db.create_directory(name, pid, oid) # change here, use griff return package
@@ -195,59 +220,152 @@ def create_directory(name: str, pid: int, oid: int):
 ### 3. Change Directory
 
 @app.get("/cd/")
+@db_executor.handler
 def change_directory(dir: str, current_pid: int):
     """Change directory and return the new pid."""
     try:
-        print(f"Received request to change directory to: {dir}, current_pid: {current_pid}")  # Debugging
-        
         if dir == "~" or dir == "home":
             # Go to home directory
             new_pid = db.get_home_directory_pid()
-            print(f"Home directory id fetched: {new_pid}")  # Debugging
         elif dir == "..":
             # Go to parent directory
             new_pid = db.get_parent_directory(current_pid)
-            print(f"Parent directory id fetched: {new_pid}")  # Debugging
         else:
             # Go to the specified directory
             new_pid = db.get_directory_pid_by_name(dir, current_pid)
-            print(f"Directory id fetched for {dir}: {new_pid}")  # Debugging
         
         if new_pid:
-            print(f"Changing to directory with pid: {new_pid}")  # Debugging
             return {"new_pid": new_pid}
         else:
             raise HTTPException(status_code=404, detail="Directory not found")
     except Exception as e:
-        print(f"Error in change_directory: {e}")  # Debugging
+        logging.debug("change_directory failed: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
-### 4. Cat
-@app.get("/cat/")
-def read_file(file_name: str, pid: int):
-    """Read the contents of a file in the specified directory."""
+### 3b. Resolve a path
+
+@app.get("/resolve/")
+@db_executor.handler
+def resolve_path(path: str, current_pid: int = 1):
+    """Resolve an absolute or relative path (including .. and ~) in one query.
+
+    Returns the id, parent directory id, type ('dir' or 'file') and canonical path.
+    """
     try:
-        print(f"Received request to read file: {file_name}, in directory pid: {pid}")  # Debugging
-        
-        file_contents = db.read_file(file_name, pid)  # Fetch file contents from the database
-        
-        if file_contents is not None:
-            return {"contents": file_contents}
-        else:
-            raise HTTPException(status_code=404, detail="File not found")
-    
+        target = db.resolve_path(path, current_pid)
     except Exception as e:
-        print(f"Error in read_file: {e}")  # Debugging
         raise HTTPException(status_code=400, detail=str(e))
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"{path}: No such file or directory")
+    return target
+
+### 4. Cat
+
+def parse_range(range_header, length):
+    """Parse a single 'bytes=start-end' Range header into a half-open (start, end) pair.
+
+    Returns None when there is no header; raises HTTPException(416) when the
+    range cannot be satisfied.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPException(status_code=416, detail="Only a single bytes range is supported")
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = max(length - int(last), 0), length
+        else:
+            start = int(first)
+            end = min(int(last) + 1, length) if last else length
+    except ValueError:
+        raise HTTPException(status_code=416, detail=f"Invalid range: {range_header}")
+    if start >= length or start >= end:
+        raise HTTPException(status_code=416, detail=f"Range not satisfiable: {range_header}",
+                            headers={"Content-Range": f"bytes */{length}"})
+    return start, end
+
+
+@app.get("/cat/")
+@db_executor.handler
+def read_file(file_name: str, pid: int, range_header: str = Header(None, alias="Range")):
+    """Stream the contents of a file in the specified directory.
+
+    The file is read from the database in chunks with incremental BLOB I/O, so
+    memory use does not grow with file size. Compressed files are decompressed
+    a frame at a time as they stream; lengths and ranges count uncompressed
+    bytes. A 'Range: bytes=start-end' header returns just that slice with
+    status 206.
+    """
+    info = db.get_file_stream_info(file_name, pid)
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    length = info["length"]
+    byte_range = parse_range(range_header, length)
+    headers = {"Accept-Ranges": "bytes"}
+    if byte_range is None:
+        start, end, status = 0, length, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{length}"
+    headers["Content-Length"] = str(end - start)
+
+    return StreamingResponse(
+        db_executor.iterate(db.iter_file(info["id"], start, end)),
+        status_code=status,
+        headers=headers,
+        media_type="text/plain; charset=utf-8",
+    )
+
+
+### 4b. head, tail and paged reads
+
+def _file_id_or_404(file_name, pid):
+    """Return the id of a file in directory pid, or raise a 404."""
+    info = db.get_file_stream_info(file_name, pid)
+    if info is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return info["id"]
+
+@app.get("/head/")
+@db_executor.handler
+def head_file(file_name: str, pid: int, n: int = 10):
+    """Return the first n lines of a file, read straight from its line-offset index."""
+    if n < 0:
+        raise HTTPException(status_code=400, detail="n must not be negative")
+    file_id = _file_id_or_404(file_name, pid)
+    return {"lines": db.head_lines(file_id, n)}
+
+@app.get("/tail/")
+@db_executor.handler
+def tail_file(file_name: str, pid: int, n: int = 10, skip: int = 0):
+    """Return the last n lines of a file (ending skip lines before the end), located via the line index."""
+    if n < 0 or skip < 0:
+        raise HTTPException(status_code=400, detail="n and skip must not be negative")
+    file_id = _file_id_or_404(file_name, pid)
+    return {"lines": db.tail_lines(file_id, n, skip)}
+
+@app.get("/lines/")
+@db_executor.handler
+def read_lines(file_name: str, pid: int, offset: int = 0, limit: int = 100):
+    """Return one page of lines starting at line number offset, for pagers."""
+    if offset < 0 or limit < 0:
+        raise HTTPException(status_code=400, detail="offset and limit must not be negative")
+    file_id = _file_id_or_404(file_name, pid)
+    lines, eof = db.read_lines(file_id, offset, limit)
+    return {"lines": lines, "offset": offset, "next_offset": offset + len(lines), "eof": eof}
 
 
 #### 5. sort
 @app.get("/sort/")
+@db_executor.handler
 def sort_file(file_name: str, pid: int):
     """Sort the contents of a file in the specified directory."""
     try:
-        print(f"Received request to sort file: {file_name}, in directory pid: {pid}")  # Debugging
-        
         file_contents = db.read_file(file_name, pid)  # Fetch file contents from the database
         
         if file_contents is not None:
@@ -258,16 +376,16 @@ def sort_file(file_name: str, pid: int):
             raise HTTPException(status_code=404, detail="File not found")
     
     except Exception as e:
-        print(f"Error in sort_file: {e}")  # Debugging
+        logging.debug("sort_file failed: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 
 #### Real 6. wc -w
 @app.get("/wc_w/")
+@db_executor.handler
 def wc_w(file_name: str, pid: int):
-    """API endpoint to count words in a file."""
+    """API endpoint to count words in a file, read from its stored counts."""
     try:
-        # Fetch the file contents and count words using sqliteCRUD
         word_count = db.count_words(file_name, pid)
         if word_count is not None:
             return {"word_count": word_count}
@@ -278,78 +396,124 @@ def wc_w(file_name: str, pid: int):
     
 #### wc
 @app.get("/wc/")
+@db_executor.handler
 def wc(file_name: str, pid: int):
-    """API endpoint to count lines, words, and characters in a file."""
+    """API endpoint to count lines, words, characters and bytes in a file, read from its stored counts."""
     try:
-        # Use sqliteCRUD to fetch the counts
-        line_count, word_count, char_count = db.count_lines_words_chars(file_name, pid)
-        if line_count is not None:
-            return {"line_count": line_count, "word_count": word_count, "char_count": char_count}
+        stats = db.get_wc_stats(file_name, pid)
+        if stats is not None:
+            return stats
         else:
             raise HTTPException(status_code=404, detail="File not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-#### Real 7. grep and grep -l
+#### Real 7. grep
 
 @app.get("/grep/")
-def grep_file(pattern: str, file_name: str, l: bool = False):
-    """Search for the pattern in the given file."""
+@db_executor.handler
+def grep(pattern: str, path: str, current_pid: int = 1, F: bool = False, i: bool = False, v: bool = False,
+         c: bool = False, l: bool = False, r: bool = False):
+    """Search a file, or with r a directory subtree, and stream one JSON line per file as it is scanned.
+
+    F takes the pattern literally instead of as a regex; i, v, c and l are grep's
+    ignore-case, invert, count and files-with-matches. Each line is a
+    {"id", "path", "count", "lines"} record with 1-based line numbers.
+    """
+    target = db.resolve_path(path, current_pid)
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"{path}: No such file or directory")
+    if target["type"] == "dir":
+        if not r:
+            raise HTTPException(status_code=400, detail=f"{path}: Is a directory")
+        scope = {"pid": target["id"], "recursive": True}
+    else:
+        scope = {"pid": target["pid"], "name": target["path"].rsplit("/", 1)[-1]}
     try:
-        # Debug: Print input parameters
-        print(f"Received grep request. Pattern: {pattern}, File: {file_name}, Flag -l: {l}")
-        
-        # Call the database layer to grep the file content
-        matched_lines = db.grep_file(pattern, file_name, l)
-        
-        # Debug: Show matched lines
-        print(f"Matched lines: {matched_lines}")
-        
-        return {"matched_lines": matched_lines}
-    except Exception as e:
-        print(f"Error occurred in grep_file: {e}")
+        compile_pattern(pattern, F, i)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid pattern: {e}")
+
+    results = grep_engine.grep(pattern, fixed=F, ignore_case=i, invert=v, count=c, files_only=l, **scope)
+    return StreamingResponse(db_executor.iterate(json.dumps(result) + "\n" for result in results),
+                             media_type="application/x-ndjson")
+
+
+#### 7b. Full-text search (grep -r, grep -l)
+
+@app.get("/search/")
+@db_executor.handler
+def search(pattern: str, pid: int = 1, recursive: bool = True, name: str = None, l: bool = False,
+           limit: int = 100, max_lines: int = 5):
+    """Return ranked files under directory pid containing pattern, with paths and matching lines.
+
+    name restricts the search to one file in pid; max_lines=0 returns every matching line.
+    """
+    if limit < 1 or max_lines < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and max_lines not negative")
+    results = db.search(pattern, pid, recursive=recursive, name=name, names_only=l,
+                        limit=limit, max_lines=max_lines)
+    return {"results": results}
+
+
+#### 7c. Pipelines run next to the database
+
+@app.post("/pipeline/")
+@db_executor.handler
+def run_pipeline(sub_cmds: list[dict], pid: int = 1):
+    """Run a whole shell pipeline here and stream back only the last stage's output.
+
+    sub_cmds is the list the shell's parse() makes of a command line, e.g.
+    [{"cmd": "cat", "flags": [], "params": ["f.txt"]}, {"cmd": "grep", "flags": ["-n"], "params": ["x"]}],
+    with file names relative to directory pid; cat, grep, head, tail, wc and
+    sort can be stages. The response is one JSON line per batch of output,
+    {"lines": [...]}, then {"stages": [{"cmd", "lines", "ms"}], "total_ms"}
+    with each stage's own time and the number of lines it passed on.
+    """
+    try:
+        pipeline = Pipeline(db, grep_engine, sub_cmds, pid)
+    except PipelineError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
+    return StreamingResponse(db_executor.iterate(json.dumps(record) + "\n" for record in pipeline.records()),
+                             media_type="application/x-ndjson")
 
 
 #### Real 8. rm
 @app.delete("/rm/")
-def remove_item(target: str, recursive: bool = False, force: bool = False):
-    """Remove the specified file or directory, with optional recursive and force flags."""
-    try:
-        print(f"Received request to remove: {target}, recursive: {recursive}, force: {force}")  # Debugging
-
-        # Determine the type (file or directory)
-        target_info = db.get_target_info(target)
-        if not target_info:
-            if force:
-                print(f"Warning: {target} does not exist, but continuing because of -f flag.")
-                return {"detail": f"{target} does not exist, but continuing because of -f flag."}
-            else:
-                raise HTTPException(status_code=404, detail=f"{target} does not exist.")
-
-        is_directory = target_info["type"] == "dir"
+@db_writer.handler
+def remove_item(target: str, pid: int = 1, recursive: bool = False, force: bool = False):
+    """Remove a file or directory (resolved from directory pid), with optional recursive and force flags.
+
+    A recursive delete removes the whole subtree in one transaction; the response
+    holds the number of files and directories removed.
+    """
+    target_info = db.resolve_path(target, pid)
+    if target_info is None:
+        if force:
+            return {"detail": f"{target} does not exist, but continuing because of -f flag.", "files": 0, "directories": 0}
+        raise HTTPException(status_code=404, detail=f"{target} does not exist.")
 
+    try:
         # Handle file removal
-        if not is_directory:
-            db.remove_file(target)
-            return {"detail": f"File {target} has been removed."}
+        if target_info["type"] == "file":
+            removed = db.remove_file(target_info["path"].rsplit("/", 1)[-1], target_info["pid"])
+            return {"detail": f"File {target} has been removed.", "files": removed, "directories": 0}
 
         # Handle directory removal with -r flag
-        if is_directory:
-            if recursive:
-                db.remove_directory(target, recursive=True)
-                return {"detail": f"Directory {target} and its contents have been removed."}
-            else:
-                raise HTTPException(status_code=400, detail=f"{target} is a directory. Use the -r flag to remove it.")
-
+        if not recursive:
+            raise HTTPException(status_code=400, detail=f"{target} is a directory. Use the -r flag to remove it.")
+        counts = db.remove_tree(target_info["id"])
+        return {"detail": f"Directory {target} and its contents have been removed.", **counts}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 ### 4. Create new file
 
 @app.post("/create_file/")
+@db_writer.handler
 def create_file(name: str, contents: str, pid: int, oid: int, size: int):
     """Create a new file."""
     try:
@@ -361,6 +525,7 @@ def create_file(name: str, contents: str, pid: int, oid: int, size: int):
 ### 5. Move File
 
 @app.post("/mv/")
+@db_writer.handler
 def move_file(file_name: str, src_pid: int, dest_pid: int, dest_name: str):
     """Move or rename a file."""
     try:
@@ -373,10 +538,12 @@ def move_file(file_name: str, src_pid: int, dest_pid: int, dest_name: str):
 ### 6. Delete a file
 
 @app.post("/rm/")
+@db_writer.handler
 def delete_file(file_name: str, pid: int):
     """Delete a file."""
     try:
-        db.delete_file(file_name, pid)
+        if not db.remove_file(file_name, pid):
+            raise Exception(f"File {file_name} not found.")
         return {"detail": f"Deleted {file_name}"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -385,6 +552,7 @@ def delete_file(file_name: str, pid: int):
 ### 8. Change file permissions
 
 @app.get("/is_dir_or_file/")
+@db_executor.handler
 def is_dir_or_file(file_name: str, pid: int):
     """Check if the target is a file or directory."""
     try:
@@ -397,6 +565,7 @@ def is_dir_or_file(file_name: str, pid: int):
 
 
 @app.post("/chmod/")
+@db_writer.handler
 def chmod(file_name: str, pid: int, target: str, permissions: dict):
     """Change the permissions of a file or directory."""
     try:
@@ -414,27 +583,45 @@ def chmod(file_name: str, pid: int, target: str, permissions: dict):
     
 ### 9. Copy files
 
-
-def copy_directory_contents(src_pid, dest_pid):
-    """Recursively copy all contents of a directory."""
-    files = db.list_directory(src_pid)
-
 @app.post("/cp/")
-def copy_file_or_directory(file_name: str, src_pid: int, dest_pid: int, dest_name: str):
-    """Copy a file or directory."""
+@db_writer.handler
+def copy_file_or_directory(file_name: str, src_pid: int, dest_pid: int, dest_name: str, recursive: bool = False):
+    """Copy a file, or with recursive a whole directory tree, inside the database."""
     try:
         dir_id = db.get_directory_pid_by_name(file_name, src_pid)
         if dir_id:
-            # Copy all file contents to the directory
-            copy_directory_contents(dir_id, dest_pid)
-            return {"detail": f"Copied directory {file_name} to {dest_name}"}
+            if not recursive:
+                raise HTTPException(status_code=400, detail=f"-r not specified; omitting directory '{file_name}'")
+            counts = db.copy_tree(dir_id, dest_pid, dest_name)
+            return {"detail": f"Copied directory {file_name} to {dest_name}", **counts}
         else:
             db.copy_file(file_name, src_pid, dest_pid, dest_name)
-            return {"detail": f"Copied file {file_name} to {dest_name}"}
+            return {"detail": f"Copied file {file_name} to {dest_name}", "files": 1, "directories": 0}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+### 9b. Batch of operations
+
+@app.post("/batch/")
+@db_writer.handler
+def run_batch(operations: list[dict], pid: int = 1, oid: int = 1, atomic: bool = False):
+    """Run an ordered list of mkdir, touch, write, mv, cp, rm and chmod operations in one transaction.
+
+    Each operation is a JSON object such as {"op": "mkdir", "path": "a/b", "parents": true},
+    {"op": "touch", "path": "a/b/f.txt"}, {"op": "write", "path": "f.txt", "contents": "..."},
+    {"op": "mv", "src": "f.txt", "dest": "a"}, {"op": "cp", "src": "a", "dest": "b", "recursive": true},
+    {"op": "rm", "path": "b", "recursive": true, "force": false} or
+    {"op": "chmod", "path": "f.txt", "permissions": {...}}, with paths relative to directory pid.
+    Failed operations are undone one by one and reported in their result; with
+    atomic the first failure rolls back the whole batch. Everything else is
+    committed once, at the end.
+    """
+    return batch_runner.run(operations, pid, oid, atomic)
+
+
 ### 10. Read current directory
 
 @app.get("/pwd/")
@@ -443,11 +630,51 @@ def get_current_directory():
     # This is a placeholder as the API doesn't maintain state
     return {"current_directory": "Placeholder for pwd. Do not use unless necessary."}
 
-### Close database connections
+### 11. Path cache statistics
+
+@app.get("/path_cache/")
+def path_cache_stats():
+    """Return hit/miss counters for the path-resolution cache."""
+    return db.path_cache.stats()
+
+### 11b. Database executor statistics
+
+@app.get("/db_executor/")
+async def db_executor_stats():
+    """Return the database executor's queue depth and call counters."""
+    return db_executor.stats()
+
+### 11c. Group commit statistics
+
+@app.get("/db_writer/")
+async def db_writer_stats():
+    """Return the writer's queue depth and how many writes it committed in how many groups."""
+    return db_writer.stats()
+
+### 12. Blob deduplication report
+
+@app.get("/blobs/")
+@db_executor.handler
+def blob_stats():
+    """Return logical vs stored bytes of file contents, the dedup ratio and the space saved."""
+    return db.blob_stats()
+
+### Database lifecycle
+
+@app.on_event("startup")
+def startup():
+    """Bring the database schema up to date before serving requests."""
+    applied = db.migrate()
+    if applied:
+        logging.info(f"Applied schema migrations: {applied}")
+
 
 @app.on_event("shutdown")
 def shutdown():
-    """Close the database connection on API shutdown."""
+    """Stop the grep and database workers and close every pooled database connection on API shutdown."""
+    grep_engine.close()
+    db_executor.close()
+    db_writer.close()
     db.close()
 
 if __name__ == "__main__":
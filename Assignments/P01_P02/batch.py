@@ -0,0 +1,169 @@
+# batch.py
+
+"""
+This file runs the operations sent to the API's /batch endpoint. A batch is an
+ordered list of operations (mkdir, touch, write, mv, cp, rm, chmod), each
+naming its targets by path relative to the batch's directory, so an operation
+can use what an earlier one created. The whole list runs in one SQLite
+transaction and is committed once. Each operation gets its own savepoint: a
+failing one is undone on its own and reported in its result, unless the batch
+is atomic, in which case the first failure rolls back everything.
+"""
+
+from sqliteCRUD import ROOT_ID
+
+OPERATIONS = ("mkdir", "touch", "write", "mv", "cp", "rm", "chmod")
+
+
+class BatchError(Exception):
+    """An operation in a batch could not be carried out."""
+
+
+class BatchRunner:
+    def __init__(self, crud):
+        """Run batches of operations against crud's database."""
+        self.crud = crud
+
+    def run(self, operations, pid=ROOT_ID, oid=1, atomic=False):
+        """Run operations in order in one transaction; return {'committed', 'results'}.
+
+        Each operation is a dict with an 'op' key and that operation's
+        arguments. Each result is {'index', 'op', 'ok'} plus what the
+        operation returned, or 'error' when it failed. In an atomic batch the
+        first failure rolls back everything, committed is False and the
+        operations after it are reported as not run.
+        """
+        results = []
+        try:
+            with self.crud.batch() as conn:
+                for index, operation in enumerate(operations):
+                    name = operation.get("op")
+                    conn.execute("SAVEPOINT batch_op")
+                    try:
+                        if name not in OPERATIONS:
+                            raise BatchError(f"Unknown operation: {name}")
+                        args = {key: value for key, value in operation.items() if key != "op"}
+                        result = getattr(self, f"_{name}")(pid=pid, oid=oid, **args)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO batch_op")
+                        conn.execute("RELEASE batch_op")
+                        results.append({"index": index, "op": name, "ok": False, "error": str(e)})
+                        if atomic:
+                            raise BatchError(str(e))
+                        continue
+                    conn.execute("RELEASE batch_op")
+                    results.append({"index": index, "op": name, "ok": True, **result})
+        except BatchError:
+            skipped = [{"index": index, "op": operation.get("op"), "ok": False, "error": "not run"}
+                       for index, operation in enumerate(operations[len(results):], start=len(results))]
+            return {"committed": False, "results": results + skipped}
+        return {"committed": True, "results": results}
+
+    ### Path helpers
+    def _resolve(self, path, pid):
+        """Return resolve_path()'s info for path, or raise if it does not exist."""
+        info = self.crud.resolve_path(path, pid)
+        if info is None:
+            raise BatchError(f"{path} does not exist.")
+        return info
+
+    def _parent_and_name(self, path, pid):
+        """Split path into (id of the directory that holds it, last component)."""
+        parent, _, name = path.rstrip("/").rpartition("/")
+        if not name or name in (".", ".."):
+            raise BatchError(f"Invalid path: {path}")
+        if not parent:
+            return (ROOT_ID if path.startswith("/") else pid), name
+        info = self._resolve(parent, pid)
+        if info["type"] != "dir":
+            raise BatchError(f"{parent} is not a directory.")
+        return info["id"], name
+
+    def _destination(self, dest, src_name, pid):
+        """Return (directory id, name) for a mv/cp destination; an existing directory receives src_name."""
+        info = self.crud.resolve_path(dest, pid)
+        if info is not None and info["type"] == "dir":
+            return info["id"], src_name
+        return self._parent_and_name(dest, pid)
+
+    ### Operations
+    def _mkdir(self, path, pid, oid, parents=False):
+        """Create a directory; with parents, create missing parents and accept existing ones."""
+        if not parents:
+            parent_id, name = self._parent_and_name(path, pid)
+            return {"id": self.crud.create_directory(name, parent_id, oid)}
+
+        dir_id = ROOT_ID if path.startswith("/") else pid
+        for part in (part for part in path.split("/") if part not in ("", ".")):
+            found = self.crud.resolve_path(part, dir_id)
+            if found is not None and found["type"] != "dir":
+                raise BatchError(f"{part} exists and is not a directory.")
+            dir_id = found["id"] if found else self.crud.create_directory(part, dir_id, oid)
+        return {"id": dir_id}
+
+    def _touch(self, path, pid, oid, contents=""):
+        """Create a file if it does not exist yet."""
+        info = self.crud.resolve_path(path, pid)
+        if info is not None:
+            if info["type"] != "file":
+                raise BatchError(f"{path} is a directory.")
+            return {"id": info["id"], "created": False}
+        parent_id, name = self._parent_and_name(path, pid)
+        return {"id": self.crud.create_file(name, contents, parent_id, oid), "created": True}
+
+    def _write(self, path, pid, oid, contents=""):
+        """Replace a file's contents, creating the file if needed."""
+        info = self.crud.resolve_path(path, pid)
+        if info is None:
+            parent_id, name = self._parent_and_name(path, pid)
+            return {"id": self.crud.create_file(name, contents, parent_id, oid), "created": True}
+        if info["type"] != "file":
+            raise BatchError(f"{path} is a directory.")
+        self.crud.write_file(info["path"].rsplit("/", 1)[-1], info["pid"], contents)
+        return {"id": info["id"], "created": False}
+
+    def _mv(self, src, dest, pid, oid):
+        """Move or rename a file."""
+        info = self._resolve(src, pid)
+        if info["type"] != "file":
+            raise BatchError(f"{src} is a directory; only files can be moved.")
+        src_name = info["path"].rsplit("/", 1)[-1]
+        dest_pid, dest_name = self._destination(dest, src_name, pid)
+        self.crud.move_file(src_name, info["pid"], dest_pid, dest_name)
+        return {"id": info["id"]}
+
+    def _cp(self, src, dest, pid, oid, recursive=False):
+        """Copy a file, or with recursive a directory tree."""
+        info = self._resolve(src, pid)
+        if info["type"] == "dir":
+            if not recursive:
+                raise BatchError(f"-r not specified; omitting directory '{src}'")
+            dest_pid, dest_name = self._destination(dest, info["path"].rstrip("/").rsplit("/", 1)[-1], pid)
+            return self.crud.copy_tree(info["id"], dest_pid, dest_name)
+        src_name = info["path"].rsplit("/", 1)[-1]
+        dest_pid, dest_name = self._destination(dest, src_name, pid)
+        self.crud.copy_file(src_name, info["pid"], dest_pid, dest_name)
+        return {"files": 1, "directories": 0}
+
+    def _rm(self, path, pid, oid, recursive=False, force=False):
+        """Remove a file, or with recursive a directory tree; force ignores missing paths."""
+        info = self.crud.resolve_path(path, pid)
+        if info is None:
+            if force:
+                return {"files": 0, "directories": 0}
+            raise BatchError(f"{path} does not exist.")
+        if info["type"] == "file":
+            return {"files": self.crud.remove_file(info["path"].rsplit("/", 1)[-1], info["pid"]), "directories": 0}
+        if not recursive:
+            raise BatchError(f"{path} is a directory. Use the -r flag to remove it.")
+        return self.crud.remove_tree(info["id"])
+
+    def _chmod(self, path, permissions, pid, oid):
+        """Set the permission bits of a file or directory, as /chmod/ takes them."""
+        info = self._resolve(path, pid)
+        if info["type"] == "file":
+            self.crud.chmod_file(info["path"].rsplit("/", 1)[-1], info["pid"], permissions)
+        else:
+            name = info["path"].rstrip("/").rsplit("/", 1)[-1]
+            self.crud.chmod_directory(name, info["pid"], permissions)
+        return {}
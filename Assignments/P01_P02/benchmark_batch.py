@@ -0,0 +1,60 @@
+# benchmark_batch.py
+
+"""
+Benchmark for the /batch endpoint's runner. touch with many names used to
+send one /create_file/ request per name, each committed on its own; now the
+whole list is one batch, run in one transaction. Both ways are timed here in
+process (so HTTP round-trips, which only add to the per-file cost, are left
+out), creating the same files in a fresh scratch database each time.
+
+Usage: python benchmark_batch.py [files]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from batch import BatchRunner
+from sqliteCRUD import SqliteCRUD, ROOT_ID
+
+
+def create_per_file(crud, names):
+    """One create_file call, and one commit, per file."""
+    for name in names:
+        crud.create_file(name, "", ROOT_ID, 1)
+
+
+def create_batch(crud, names):
+    """Every file in one batch and one commit."""
+    result = BatchRunner(crud).run([{"op": "touch", "path": name} for name in names])
+    assert result["committed"] and all(op["ok"] for op in result["results"])
+
+
+def timed(create, db_path, names):
+    """Create names in a fresh database; return seconds."""
+    crud = SqliteCRUD(db_path)
+    crud.migrate()
+    start = time.perf_counter()
+    create(crud, names)
+    elapsed = time.perf_counter() - start
+    assert crud._connect().execute("SELECT COUNT(*) FROM files").fetchone()[0] == len(names)
+    crud.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    names = [f"file{i}.txt" for i in range(files)]
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        per_file = timed(create_per_file, os.path.join(tmp_dir, "per_file.db"), names)
+        batch = timed(create_batch, os.path.join(tmp_dir, "batch.db"), names)
+        print(f"{files} files")
+        print(f"per file   {per_file * 1000:>9.1f} ms  ({files} commits)")
+        print(f"batch      {batch * 1000:>9.1f} ms  (1 commit)")
+        print(f"speedup    {per_file / batch:>9.1f}x")
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,108 @@
+# benchmark_compression.py
+
+"""
+Benchmark for compressed file contents. The bundled texts from ApiStarter/data
+are loaded into two scratch databases, one with compression turned off and one
+with the default codec choice. The size of each database is reported after
+VACUUM, next to the bytes the blobs themselves take (most of the rest is the
+full-text index, built from the uncompressed text). Then each file is streamed
+whole (what /cat/ does) and random windows of lines are fetched (what less and
+more do) from both, to show what decompressing on the fly costs in reads.
+
+Usage: python benchmark_compression.py [data_dir] [windows]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import blobcodec
+from sqliteCRUD import SqliteCRUD
+
+DATA_DIR = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data")
+WINDOW_SIZE = 40
+STREAM_PASSES = 5
+
+
+def load(db_path, data_dir, names, compress):
+    """Load the texts into a fresh database; return (crud, {name: file_id}, database bytes, blob bytes)."""
+    threshold = blobcodec.MIN_COMPRESS_SIZE
+    if not compress:
+        blobcodec.MIN_COMPRESS_SIZE = float("inf")  # every blob is stored as it is
+    try:
+        crud = SqliteCRUD(db_path)
+        crud.migrate()
+        file_ids = {}
+        for name in names:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                file_ids[name] = crud.create_file(name, f.read(), 1, 1)
+    finally:
+        blobcodec.MIN_COMPRESS_SIZE = threshold
+
+    conn = crud._connect()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    blob_bytes = conn.execute("SELECT SUM(length(contents)) FROM blobs").fetchone()[0]
+    return crud, file_ids, page_count * page_size, blob_bytes
+
+
+def stream_mb_per_s(crud, file_ids):
+    """Return MB/s for streaming every file from start to end."""
+    total = 0
+    start = time.perf_counter()
+    for _ in range(STREAM_PASSES):
+        for file_id in file_ids.values():
+            total += sum(len(chunk) for chunk in crud.iter_file(file_id))
+    return total / (time.perf_counter() - start) / 1e6
+
+
+def window_ms(crud, file_ids, windows):
+    """Return the average milliseconds to fetch one random window of lines."""
+    rng = random.Random(5143)
+    requests = []
+    for file_id in file_ids.values():
+        count = crud._line_count(crud._connect(), file_id)
+        requests += [(file_id, rng.randrange(count)) for _ in range(windows)]
+    start = time.perf_counter()
+    for file_id, offset in requests:
+        crud.read_lines(file_id, offset, WINDOW_SIZE)
+    return (time.perf_counter() - start) * 1000 / len(requests)
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    windows = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    names = sorted(name for name in os.listdir(data_dir) if name.endswith(".txt"))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        raw, raw_ids, *raw_sizes = load(os.path.join(tmp_dir, "raw.db"), data_dir, names, compress=False)
+        packed, packed_ids, *packed_sizes = load(os.path.join(tmp_dir, "packed.db"), data_dir, names, compress=True)
+
+        # Same bytes must come back either way
+        for name in names:
+            assert b"".join(raw.iter_file(raw_ids[name])) == b"".join(packed.iter_file(packed_ids[name]))
+
+        codecs = packed._connect().execute("SELECT codec, COUNT(*) FROM blobs GROUP BY codec").fetchall()
+        print("codecs: " + ", ".join(f"{codec or 'none'} x{count}" for codec, count in codecs))
+        print(f"{'':<14}{'db size':>12}{'blobs':>12}{'stream MB/s':>13}{'window ms':>11}")
+        rows = [("raw", raw, raw_ids, raw_sizes), ("compressed", packed, packed_ids, packed_sizes)]
+        results = {}
+        for label, crud, file_ids, (db_size, blob_size) in rows:
+            mb_per_s = stream_mb_per_s(crud, file_ids)
+            ms = window_ms(crud, file_ids, windows)
+            results[label] = (db_size, blob_size, mb_per_s, ms)
+            print(f"{label:<14}{db_size / 1e6:>10.2f}MB{blob_size / 1e6:>10.2f}MB{mb_per_s:>13.1f}{ms:>11.3f}")
+        (raw_db, raw_blobs, raw_mb, raw_ms) = results["raw"]
+        (packed_db, packed_blobs, packed_mb, packed_ms) = results["compressed"]
+        print(f"db size -{1 - packed_db / raw_db:.0%}, blobs -{1 - packed_blobs / raw_blobs:.0%}, "
+              f"stream throughput x{packed_mb / raw_mb:.2f}, window latency x{packed_ms / raw_ms:.2f}")
+        raw.close()
+        packed.close()
+    finally:
+        shutil.rmtree(tmp_dir)
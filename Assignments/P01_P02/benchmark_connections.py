@@ -0,0 +1,97 @@
+# benchmark_connections.py
+
+"""
+Microbenchmark for SqliteCRUD's connection handling. It runs the same mix of
+read queries that ls, cd and cat issue, once with a connection opened and
+closed for every call (the old behaviour) and once with the pooled per-thread
+connections, and reports operations per second for each.
+
+Usage: python benchmark_connections.py [ops] [threads]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import schema
+from sqliteCRUD import SqliteCRUD
+
+
+class ConnectPerCallCRUD(SqliteCRUD):
+    """SqliteCRUD that opens a fresh connection for every call, like before pooling."""
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        schema.register_functions(conn)  # read_file needs blob_text()
+        return conn
+
+
+def run_ops(crud, ops):
+    """Issue a fixed mix of the hot read queries."""
+    for i in range(ops):
+        step = i % 4
+        if step == 0:
+            crud.list_directory(1)
+        elif step == 1:
+            crud.get_directory_id("bob", 1)
+        elif step == 2:
+            crud.get_directory_info(2)
+        else:
+            crud.read_file("somefile.txt", 2)
+
+
+def measure(crud, ops, threads):
+    """Return operations per second for `ops` calls spread over `threads` threads.
+
+    Raises RuntimeError if any worker thread failed, since its time would not
+    cover the operations it was meant to run.
+    """
+    per_thread = ops // threads
+    errors = []
+
+    def worker_ops():
+        try:
+            run_ops(crud, per_thread)
+        except BaseException as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=worker_ops) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {threads} worker(s) failed") from errors[0]
+    return (per_thread * threads) / elapsed
+
+
+if __name__ == "__main__":
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    # Work on a copy so the benchmark never touches the real database
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "filesystem.db")
+    shutil.copy("filesystem.db", db_path)
+    conn = sqlite3.connect(db_path)
+    schema.migrate(conn)  # both variants read through the current schema (blobs etc.)
+    conn.close()
+
+    try:
+        before = measure(ConnectPerCallCRUD(db_path), ops, threads)
+        pooled = SqliteCRUD(db_path)
+        after = measure(pooled, ops, threads)
+        pooled.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print(f"{ops} ops on {threads} thread(s)")
+    print(f"connect per call: {before:10.0f} ops/sec")
+    print(f"pooled:           {after:10.0f} ops/sec")
+    print(f"speedup:          {after / before:10.1f}x")
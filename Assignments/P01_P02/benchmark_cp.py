@@ -0,0 +1,65 @@
+# benchmark_cp.py
+
+"""
+Benchmark for cp -r. Trees with 10k files (built as in benchmark_rm.py) are
+copied by walking them from Python and copying each file through Python, the
+way cp worked before (read the BLOB, write it back with create_file), and with
+copy_tree(), which clones the subtree inside SQLite in one transaction. The
+server-side copy is run for small and larger files to show how it scales.
+
+Usage: python benchmark_cp.py [files]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmark_rm import DEPTH, FANOUT, build_tree
+from sqliteCRUD import SqliteCRUD, ROOT_ID
+
+TEXT = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data", "moby_dick.txt")
+
+
+def copy_per_file(crud, dir_id, dest_pid, dest_name):
+    """Walk the tree from Python, recreating directories and copying file contents one by one."""
+    conn = crud._connect()
+    new_id = crud.create_directory(dest_name, dest_pid, 1)
+    for file_name, contents in conn.execute("""
+            SELECT f.name, blob_text(b.codec, b.contents, b.frames) FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.pid = ?
+            """, (dir_id,)).fetchall():
+        crud.create_file(file_name, contents, new_id, 1, len(contents))
+    for child_id, child_name in conn.execute("SELECT id, name FROM directories WHERE pid = ?", (dir_id,)).fetchall():
+        copy_per_file(crud, child_id, new_id, child_name)
+
+
+def timed_copy(template, db_path, copy, tree_id):
+    """Copy the tree in a fresh copy of template; return seconds."""
+    shutil.copy(template, db_path)
+    crud = SqliteCRUD(db_path)
+    start = time.perf_counter()
+    copy(crud, tree_id, ROOT_ID, "tree_copy")
+    elapsed = time.perf_counter() - start
+    crud.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    dirs = sum(FANOUT ** level for level in range(DEPTH + 1))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'file size':>10}{'per file ms':>13}{'copy_tree ms':>14}{'speedup':>9}")
+        with open(TEXT, "rb") as f:
+            text = f.read()
+        for size in (100, 1024):
+            template = os.path.join(tmp_dir, f"template_{size}.db")
+            tree_id = build_tree(template, files + dirs, contents=text[-size:])
+
+            per_file = timed_copy(template, os.path.join(tmp_dir, "per_file.db"), copy_per_file, tree_id)
+            server = timed_copy(template, os.path.join(tmp_dir, "copy_tree.db"), SqliteCRUD.copy_tree, tree_id)
+            print(f"{size:>9}B{per_file * 1000:>13.1f}{server * 1000:>14.1f}{per_file / server:>8.1f}x")
+    finally:
+        shutil.rmtree(tmp_dir)
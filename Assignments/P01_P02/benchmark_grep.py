@@ -0,0 +1,88 @@
+# benchmark_grep.py
+
+"""
+Latency benchmark for the grep engine. The bundled texts from ApiStarter/data
+are loaded into a scratch database (each copied a few times, so the tree has
+more than a handful of files), then every pattern is searched for with the
+previous grep_file (one file at a time, whole BLOB decoded, literal match) and
+with GrepEngine over the whole directory, using one worker and a pool.
+
+Usage: python benchmark_grep.py [data_dir] [copies] [workers]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from grepengine import GrepEngine
+from sqliteCRUD import SqliteCRUD
+
+DATA_DIR = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data")
+PATTERNS = ["Ishmael", "whale", "the", "xyzzy"]
+
+
+def old_grep_file(crud, pattern, file_name):
+    """The grep_file this engine replaced, minus its debug prints."""
+    conn = crud._connect()
+    result = conn.execute("""
+        SELECT blob_text(b.codec, b.contents, b.frames) FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.name = ?
+    """, (file_name,)).fetchone()
+    contents = result[0].decode("utf-8")
+    return [line for line in contents.splitlines() if pattern in line]
+
+
+def old_grep_tree(crud, pattern, file_names):
+    """What grep over a directory cost before: one grep_file per file."""
+    return sum(len(old_grep_file(crud, pattern, name)) for name in file_names)
+
+
+def engine_grep_tree(engine, pattern, pid):
+    """Count matching lines under pid with the engine."""
+    return sum(result["count"] for result in engine.grep(pattern, pid, recursive=True, fixed=True))
+
+
+def timed(func, *args):
+    """Return (milliseconds, result) for one call."""
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    names = sorted(name for name in os.listdir(data_dir) if name.endswith(".txt"))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        crud = SqliteCRUD(os.path.join(tmp_dir, "bench.db"))
+        crud.migrate()
+        pid = crud.create_directory("home", 0, 1)
+
+        file_names = []
+        for name in names:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                data = f.read()
+            for copy in range(copies):
+                file_names.append(f"{copy}_{name}")
+                crud.create_file(file_names[-1], data, pid, 1, len(data))
+
+        single = GrepEngine(crud, workers=1)
+        pooled = GrepEngine(crud, workers=workers)
+        print(f"{len(file_names)} files, {workers} workers\n")
+        print(f"{'pattern':<10}{'lines':>8}{'old ms':>10}{'1 worker':>10}{'pool ms':>10}{'speedup':>9}")
+        for pattern in PATTERNS:
+            old_ms, old_count = timed(old_grep_tree, crud, pattern, file_names)
+            single_ms, single_count = timed(engine_grep_tree, single, pattern, pid)
+            pooled_ms, pooled_count = timed(engine_grep_tree, pooled, pattern, pid)
+            assert old_count == single_count == pooled_count, pattern
+            print(f"{pattern:<10}{old_count:>8}{old_ms:>10.1f}{single_ms:>10.1f}{pooled_ms:>10.1f}"
+                  f"{old_ms / pooled_ms:>8.1f}x")
+        single.close()
+        pooled.close()
+        crud.close()
+    finally:
+        shutil.rmtree(tmp_dir)
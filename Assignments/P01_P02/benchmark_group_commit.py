@@ -0,0 +1,87 @@
+# benchmark_group_commit.py
+
+"""
+Benchmark for the group-commit writer. A number of threads (standing in for
+the API's workers) each create files as fast as they can, first by calling
+create_file directly, each write committing on its own and competing for the
+write lock, then by handing every create_file to one GroupCommitWriter. Both
+runs start from a fresh scratch database; sustained writes/sec, the number of
+'database is locked' errors and, for the writer, the average group size are
+reported. The run is repeated with synchronous=FULL, where every commit is
+an fsync, which is what group commit saves most on.
+
+Usage: python benchmark_group_commit.py [threads] [files_per_thread]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import schema
+from groupcommit import GroupCommitWriter
+from sqliteCRUD import SqliteCRUD, ROOT_ID
+
+
+def run_threads(threads, files, write):
+    """Call write(name) files times on each of threads threads; return (seconds, errors)."""
+    errors = []
+
+    def worker(index):
+        for i in range(files):
+            try:
+                write(f"t{index}_file{i}.txt")
+            except sqlite3.Error as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, errors
+
+
+def timed(db_path, threads, files, grouped):
+    """Create threads * files files in a fresh database; return (writes/sec, errors, writer stats)."""
+    crud = SqliteCRUD(db_path)
+    crud.migrate()
+    writer = GroupCommitWriter(crud) if grouped else None
+    if grouped:
+        seconds, errors = run_threads(threads, files, lambda name: writer.call(crud.create_file, name, name, ROOT_ID, 1))
+        stats = writer.stats()
+        writer.close()
+    else:
+        seconds, errors = run_threads(threads, files, lambda name: crud.create_file(name, name, ROOT_ID, 1))
+        stats = None
+    written = crud._connect().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    crud.close()
+    return written / seconds, errors, stats
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    pragmas = list(schema.PRAGMAS)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{threads} threads x {files} files")
+        print(f"{'synchronous':<13}{'mode':<16}{'writes/s':>10}{'locked':>8}{'avg group':>11}")
+        for synchronous in ("NORMAL", "FULL"):
+            schema.PRAGMAS[0] = f"PRAGMA synchronous = {synchronous}"
+            rates = {}
+            for label, grouped in (("per-write", False), ("group commit", True)):
+                db_path = os.path.join(tmp_dir, f"{synchronous}_{grouped}.db")
+                rate, errors, stats = timed(db_path, threads, files, grouped)
+                rates[label] = rate
+                group = f"{stats['average_group']:.1f}" if stats else "-"
+                print(f"{synchronous:<13}{label:<16}{rate:>10.0f}{len(errors):>8}{group:>11}")
+            print(f"{synchronous:<13}{'speedup':<16}{rates['group commit'] / rates['per-write']:>9.1f}x")
+    finally:
+        schema.PRAGMAS[:] = pragmas
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,93 @@
+# benchmark_http_session.py
+
+"""
+Benchmark for the shell's HTTP session. The shell used to send every request
+with module-level requests.get/post, so each one opened (and closed) its own
+TCP connection; DbApi now sends them through one pooled keep-alive session.
+A few commands are replayed as the requests the shell makes for them, both
+ways, against the running API, and the average latency per command is
+reported. Last, wc over several files is timed with the per-file lookups sent
+one after another and side by side. Start the API first ('python api.py').
+
+Usage: python benchmark_http_session.py [api_url] [repeats]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from shell import HTTP_PARALLEL, make_session
+
+API_URL = "http://localhost:8080"
+
+
+def setup(client, api_url):
+    """Create /bench/a/b/c with a few files in it; return the id of c."""
+    client.post(f"{api_url}/batch/", json=[{"op": "rm", "path": "bench", "recursive": True, "force": True},
+                                           {"op": "mkdir", "path": "bench/a/b/c", "parents": True}] +
+                [{"op": "write", "path": f"bench/a/b/c/f{i}.txt", "contents": "one two\nthree\n" * 50}
+                 for i in range(8)])
+    return client.get(f"{api_url}/resolve/", params={"path": "/bench/a/b/c"}).json()["id"]
+
+
+def commands(client, api_url, dir_id):
+    """Return {command: function sending the requests the shell sends for it}."""
+    def cd():
+        client.get(f"{api_url}/resolve/", params={"path": "/bench/a/b/c", "current_pid": 1})
+
+    def ls():
+        client.get(f"{api_url}/ls/{dir_id}", params={"l": True})
+
+    def cat():
+        info = client.get(f"{api_url}/resolve/", params={"path": "f0.txt", "current_pid": dir_id}).json()
+        client.get(f"{api_url}/cat/", params={"file_name": "f0.txt", "pid": info["pid"]}).content
+
+    def touch():
+        client.post(f"{api_url}/batch/", params={"pid": dir_id},
+                    json=[{"op": "touch", "path": f"t{i}.txt"} for i in range(4)])
+
+    return {"cd a/b/c": cd, "ls -l": ls, "cat f0.txt": cat, "touch x4": touch}
+
+
+def wc_one(client, api_url, dir_id, name):
+    """The two requests the shell makes per file for wc."""
+    info = client.get(f"{api_url}/resolve/", params={"path": name, "current_pid": dir_id}).json()
+    return client.get(f"{api_url}/wc/", params={"file_name": name, "pid": info["pid"]}).json()
+
+
+def average_ms(fn, repeats):
+    """Return the average milliseconds per call of fn."""
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+if __name__ == "__main__":
+    api_url = sys.argv[1] if len(sys.argv) > 1 else API_URL
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    session = make_session()
+    dir_id = setup(session, api_url)
+    per_request = commands(requests, api_url, dir_id)
+    pooled = commands(session, api_url, dir_id)
+
+    print(f"{'command':<14}{'new conn ms':>13}{'session ms':>12}{'speedup':>9}")
+    for name in per_request:
+        before = average_ms(per_request[name], repeats)
+        after = average_ms(pooled[name], repeats)
+        print(f"{name:<14}{before:>13.2f}{after:>12.2f}{before / after:>8.1f}x")
+
+    names = [f"f{i}.txt" for i in range(8)]
+    pool = ThreadPoolExecutor(HTTP_PARALLEL)
+    serial = average_ms(lambda: [wc_one(session, api_url, dir_id, name) for name in names], repeats // 4)
+    parallel = average_ms(lambda: list(pool.map(lambda name: wc_one(session, api_url, dir_id, name), names)),
+                          repeats // 4)
+    print(f"{'wc 8 files':<14}{serial:>13.2f}{parallel:>12.2f}{serial / parallel:>8.1f}x  (one after another / side by side)")
+
+    session.post(f"{api_url}/batch/", json=[{"op": "rm", "path": "bench", "recursive": True}])
+    pool.shutdown()
+    session.close()
@@ -0,0 +1,115 @@
+# benchmark_indexes.py
+
+"""
+Benchmark for the (pid, name) indexes added by the schema migrations. It loads
+a synthetic tree into a fully migrated scratch database, drops the two
+(pid, name) indexes, measures the lookups that cd, cat and ls issue, then
+recreates the indexes as the first migration does and measures the same
+lookups again.
+
+Usage: python benchmark_indexes.py [files] [lookups]
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import schema
+from sqliteCRUD import SqliteCRUD
+
+FILES_PER_DIR = 100
+PID_NAME_INDEXES = ("idx_files_pid_name", "idx_directories_pid_name")
+
+
+def load_tree(db_path, file_count):
+    """Create the schema without the (pid, name) indexes and fill it with file_count files."""
+    conn = sqlite3.connect(db_path)
+    schema.create_schema(conn)
+    for index in PID_NAME_INDEXES:
+        conn.execute(f"DROP INDEX {index};")
+    blob_id = schema.store_blob(conn, b"data\n")
+    dir_count = file_count // FILES_PER_DIR
+    conn.execute("INSERT INTO directories (id, pid, oid, name) VALUES (1, 0, 1, 'home')")
+    conn.executemany(
+        "INSERT INTO directories (id, pid, oid, name) VALUES (?, 1, 1, ?)",
+        ((2 + d, f"dir{d}") for d in range(dir_count)),
+    )
+    conn.executemany(
+        "INSERT INTO files (pid, oid, name, size, blob_id) VALUES (?, 1, ?, 5, ?)",
+        ((2 + f // FILES_PER_DIR, f"file{f}.txt", blob_id) for f in range(file_count)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return dir_count
+
+
+def add_indexes(db_path):
+    """Recreate the (pid, name) indexes the way the first migration does."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        schema.MIGRATIONS[0](conn)
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def time_lookups(crud, dir_count, lookups):
+    """Return mean latency in microseconds for each kind of lookup."""
+    rng = random.Random(5143)
+    targets = []
+    for _ in range(lookups):
+        d = rng.randrange(dir_count)
+        f = d * FILES_PER_DIR + rng.randrange(FILES_PER_DIR)
+        targets.append((2 + d, f"dir{d}", f"file{f}.txt"))
+
+    results = {}
+    start = time.perf_counter()
+    for _, dir_name, _ in targets:
+        crud.get_directory_id(dir_name, 1)
+    results["cd  (get_directory_id)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for pid, _, file_name in targets:
+        crud.read_file(file_name, pid)
+    results["cat (read_file)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for pid, _, _ in targets:
+        crud.list_directory(pid)
+    results["ls  (list_directory)"] = time.perf_counter() - start
+
+    return {name: elapsed / lookups * 1e6 for name, elapsed in results.items()}
+
+
+if __name__ == "__main__":
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "bench.db")
+    try:
+        start = time.perf_counter()
+        dir_count = load_tree(db_path, file_count)
+        print(f"Loaded {file_count} files in {dir_count} directories in {time.perf_counter() - start:.1f}s")
+
+        crud = SqliteCRUD(db_path)
+        before = time_lookups(crud, dir_count, lookups)
+        crud.close()
+
+        start = time.perf_counter()
+        add_indexes(db_path)
+        print(f"Built the (pid, name) indexes in {time.perf_counter() - start:.1f}s")
+
+        crud = SqliteCRUD(db_path)
+        after = time_lookups(crud, dir_count, lookups)
+        crud.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print(f"{'lookup':<24}{'no index (us)':>16}{'indexed (us)':>16}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<24}{before[name]:>16.1f}{after[name]:>16.1f}{before[name] / after[name]:>9.0f}x")
@@ -0,0 +1,80 @@
+# benchmark_line_index.py
+
+"""
+Latency benchmark for the line-offset index. The bundled texts from
+ApiStarter/data are loaded into a scratch database, then random windows of
+lines (what less/more and /lines/ ask for) and tails are fetched with the index
+and by scanning the BLOB for newlines.
+
+Usage: python benchmark_line_index.py [data_dir] [windows] [window_size]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqliteCRUD import SqliteCRUD
+
+DATA_DIR = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data")
+
+
+def time_windows(crud, file_id, offsets, window_size):
+    """Return the average milliseconds to fetch one window starting at each offset."""
+    start = time.perf_counter()
+    for offset in offsets:
+        crud.read_lines(file_id, offset, window_size)
+    return (time.perf_counter() - start) * 1000 / len(offsets)
+
+
+def time_tails(crud, file_id, skips, window_size):
+    """Return the average milliseconds to fetch one tail window skipping each count."""
+    start = time.perf_counter()
+    for skip in skips:
+        crud.tail_lines(file_id, window_size, skip)
+    return (time.perf_counter() - start) * 1000 / len(skips)
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    windows = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    window_size = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    names = sorted(name for name in os.listdir(data_dir) if name.endswith(".txt"))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        indexed = SqliteCRUD(db_path)
+        indexed.migrate()
+        scanning = SqliteCRUD(db_path, use_line_index=False)
+
+        file_ids = {}
+        for name in names:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                data = f.read()
+            file_ids[name] = indexed.create_file(name, data, 1, 1, len(data))
+
+        rng = random.Random(5143)
+        print(f"{'file':<18}{'lines':>8}{'scan ms':>10}{'index ms':>10}{'speedup':>9}"
+              f"{'tail scan':>11}{'tail index':>12}")
+        for name in names:
+            file_id = file_ids[name]
+            lines, _ = indexed.read_lines(file_id)
+            offsets = [rng.randrange(len(lines)) for _ in range(windows)]
+
+            # Same windows must come back either way
+            assert all(indexed.read_lines(file_id, o, window_size) == scanning.read_lines(file_id, o, window_size)
+                       for o in offsets[:10])
+
+            scan_ms = time_windows(scanning, file_id, offsets, window_size)
+            index_ms = time_windows(indexed, file_id, offsets, window_size)
+            tail_scan_ms = time_tails(scanning, file_id, offsets, window_size)
+            tail_index_ms = time_tails(indexed, file_id, offsets, window_size)
+            print(f"{name:<18}{len(lines):>8}{scan_ms:>10.3f}{index_ms:>10.3f}{scan_ms / index_ms:>8.0f}x"
+                  f"{tail_scan_ms:>11.3f}{tail_index_ms:>12.3f}")
+        indexed.close()
+        scanning.close()
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,73 @@
+# benchmark_path_cache.py
+
+"""
+Benchmark for the path cache in 'pathcache.py'. It builds a chain of nested
+directories in a scratch database, then resolves the deepest path and rebuilds
+its prompt path repeatedly, first with the cache cleared before every lookup
+(one query per component) and then with a warm cache.
+
+Usage: python benchmark_path_cache.py [depth] [lookups]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqliteCRUD import SqliteCRUD
+
+
+def build_chain(crud, depth):
+    """Create home/d1/d2/.../d<depth> and return the relative path to the deepest one."""
+    pid = 1
+    parts = []
+    for level in range(1, depth + 1):
+        pid = crud.create_directory(f"d{level}", pid, 1)
+        parts.append(f"d{level}")
+    return "/".join(parts), pid
+
+
+def time_lookups(crud, path, deepest, lookups, cold):
+    """Return mean microseconds for cd-style path resolution and pwd-style path rebuilding."""
+    resolve = rebuild = 0.0
+    for _ in range(lookups):
+        if cold:
+            crud.path_cache.invalidate()
+        start = time.perf_counter()
+        crud.get_directory_id_by_path(path, 1)
+        resolve += time.perf_counter() - start
+
+        if cold:
+            crud.path_cache.invalidate()
+        start = time.perf_counter()
+        crud.get_directory_path(deepest)
+        rebuild += time.perf_counter() - start
+    return resolve / lookups * 1e6, rebuild / lookups * 1e6
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        crud = SqliteCRUD(os.path.join(tmp_dir, "bench.db"))
+        crud.migrate()
+        crud.create_directory("home", 0, 1)
+        path, deepest = build_chain(crud, depth)
+
+        cold = time_lookups(crud, path, deepest, lookups, cold=True)
+        crud.path_cache.invalidate()
+        crud.path_cache.hits = crud.path_cache.misses = 0
+        warm = time_lookups(crud, path, deepest, lookups, cold=False)
+        stats = crud.path_cache.stats()
+        crud.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print(f"{lookups} lookups of a path {depth} levels deep")
+    print(f"{'operation':<16}{'cold (us)':>12}{'warm (us)':>12}{'speedup':>10}")
+    print(f"{'resolve path':<16}{cold[0]:>12.1f}{warm[0]:>12.2f}{cold[0] / warm[0]:>9.0f}x")
+    print(f"{'current path':<16}{cold[1]:>12.1f}{warm[1]:>12.2f}{cold[1] / warm[1]:>9.0f}x")
+    print(f"warm cache: {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.2%}")
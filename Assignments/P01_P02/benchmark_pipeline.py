@@ -0,0 +1,85 @@
+# benchmark_pipeline.py
+
+"""
+Benchmark for the shell's pipelines. Piped commands used to hand each other
+whole lists, so 'cat big | grep x | head -5' downloaded and held the whole
+file; stages are now generators that pass lines along one at a time, and
+head closes the stages feeding it as soon as it has its lines. A few
+pipelines are run through the shell over files of growing size, and the time
+and peak Python memory (tracemalloc) of each are reported: the peak should
+stay flat as the file grows (except for sort, which must hold its input).
+Each pipeline is also timed run on the API (/pipeline/), where it reads the
+file next to the database and only its output crosses the network.
+Start the API first ('python api.py').
+
+Usage: python benchmark_pipeline.py [api_url] [max_lines]
+"""
+
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+import requests
+
+from shell import DbApi
+
+API_URL = "http://localhost:8080"
+PIPELINES = [
+    "cat big.txt | grep needle | head -n 5",
+    "cat big.txt | head -n 5",
+    "cat big.txt | grep -c needle",
+    "cat big.txt | tail -n 5",
+    "cat big.txt | wc",
+    "cat big.txt | sort | head -n 5",
+]
+
+
+def make_file(api_url, lines):
+    """Write /bench_pipe/big.txt with lines lines, every 1000th containing 'needle'."""
+    contents = "".join(f"line {i} some filler text for the pipeline benchmark {'needle' if i % 1000 == 7 else 'hay'}\n"
+                       for i in range(lines))
+    requests.post(f"{api_url}/batch/", json=[{"op": "rm", "path": "bench_pipe", "recursive": True, "force": True},
+                                             {"op": "mkdir", "path": "bench_pipe", "parents": True},
+                                             {"op": "write", "path": "bench_pipe/big.txt", "contents": contents}])
+    return len(contents)
+
+
+def run_quietly(db_api, line, on_server):
+    """Run a command line in the shell with its output discarded; return milliseconds."""
+    db_api.server_pipelines = on_server
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_api.run_line(line)
+    return (time.perf_counter() - start) * 1000
+
+
+def peak_mb(db_api, line):
+    """Return the peak MB of Python memory while the shell runs line itself."""
+    tracemalloc.start()
+    run_quietly(db_api, line, on_server=False)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+if __name__ == "__main__":
+    api_url = sys.argv[1] if len(sys.argv) > 1 else API_URL
+    max_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 400000
+
+    db_api = DbApi()
+    db_api.url = api_url
+    for lines in (max_lines // 16, max_lines // 4, max_lines):
+        size = make_file(api_url, lines)
+        db_api.run_line("cd /bench_pipe")
+        print(f"\n{lines} lines, {size / 1e6:.1f} MB")
+        print(f"{'pipeline':<40}{'shell ms':>10}{'peak MB':>9}{'api ms':>9}")
+        for line in PIPELINES:
+            ms = run_quietly(db_api, line, on_server=False)
+            api_ms = run_quietly(db_api, line, on_server=True)
+            peak = peak_mb(db_api, line)
+            print(f"{line:<40}{ms:>10.0f}{peak:>9.1f}{api_ms:>9.0f}")
+        db_api.run_line("cd /")
+
+    requests.post(f"{api_url}/batch/", json=[{"op": "rm", "path": "bench_pipe", "recursive": True}])
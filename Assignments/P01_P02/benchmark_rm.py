@@ -0,0 +1,99 @@
+# benchmark_rm.py
+
+"""
+Benchmark for rm -r. A synthetic tree of directories (FANOUT wide, DEPTH deep)
+with files spread over its leaves is loaded into a scratch database, then it
+is deleted node by node from Python (one statement and one commit per node,
+the way a client-side walk would do it) and with remove_tree(), which deletes
+the whole subtree in one transaction. Each run starts from a fresh copy.
+
+Usage: python benchmark_rm.py [nodes]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from schema import register_functions, store_blob
+from sqliteCRUD import SqliteCRUD
+
+FANOUT = 10
+DEPTH = 3
+
+
+def build_tree(db_path, nodes, contents=b"some data\n"):
+    """Create a tree of about nodes directories and files under /tree; return its directory id."""
+    crud = SqliteCRUD(db_path)
+    crud.migrate()
+    crud.close()
+
+    conn = sqlite3.connect(db_path)
+    register_functions(conn)  # the blobs triggers call blob_text()
+    conn.execute("INSERT INTO directories (id, pid, oid, name) VALUES (1, 0, 1, 'home')")
+    tree_id = conn.execute("INSERT INTO directories (pid, oid, name) VALUES (1, 1, 'tree')").lastrowid
+    level = [tree_id]
+    dir_count = 1
+    for depth in range(DEPTH):
+        next_level = []
+        for parent in level:
+            for i in range(FANOUT):
+                next_level.append(conn.execute(
+                    "INSERT INTO directories (pid, oid, name) VALUES (?, 1, ?)", (parent, f"d{depth}_{i}")).lastrowid)
+        level = next_level
+        dir_count += len(level)
+
+    per_leaf = max((nodes - dir_count) // len(level), 0)
+    blob_id = store_blob(conn, contents)
+    conn.executemany(
+        "INSERT INTO files (pid, oid, name, size, blob_id) VALUES (?, 1, ?, ?, ?)",
+        ((leaf, f"file{f}.txt", len(contents), blob_id) for leaf in level for f in range(per_leaf)),
+    )
+    conn.commit()
+    conn.close()
+    return tree_id
+
+
+def remove_per_node(crud, dir_id):
+    """Walk the tree from Python and delete every node with its own commit."""
+    conn = crud._connect()
+    for (child_id,) in conn.execute("SELECT id FROM directories WHERE pid = ?", (dir_id,)).fetchall():
+        remove_per_node(crud, child_id)
+    for (file_id,) in conn.execute("SELECT id FROM files WHERE pid = ?", (dir_id,)).fetchall():
+        with conn:
+            conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+    with conn:
+        conn.execute("DELETE FROM directories WHERE id = ?", (dir_id,))
+
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        template = os.path.join(tmp_dir, "template.db")
+        tree_id = build_tree(template, nodes)
+
+        timings = {}
+        for label, remove in (("per node", remove_per_node), ("remove_tree", SqliteCRUD.remove_tree)):
+            db_path = os.path.join(tmp_dir, f"{label.replace(' ', '_')}.db")
+            shutil.copy(template, db_path)
+            crud = SqliteCRUD(db_path)
+            conn = crud._connect()
+            total = conn.execute("SELECT (SELECT COUNT(*) FROM files) + (SELECT COUNT(*) FROM directories)").fetchone()[0]
+
+            start = time.perf_counter()
+            remove(crud, tree_id)
+            timings[label] = time.perf_counter() - start
+
+            left = conn.execute("SELECT (SELECT COUNT(*) FROM files) + (SELECT COUNT(*) FROM directories)").fetchone()[0]
+            assert left == 1, left  # only /home is left
+            crud.close()
+        print(f"{total - 1} nodes removed")
+        for label, seconds in timings.items():
+            print(f"{label:<12}{seconds * 1000:>10.1f} ms")
+        print(f"speedup     {timings['per node'] / timings['remove_tree']:>10.1f}x")
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,78 @@
+# benchmark_search.py
+
+"""
+Latency benchmark for tree-wide search. The bundled texts from ApiStarter/data
+are cut into small files spread over a few directories of a scratch database,
+then each pattern is searched for the old way (decode every file and test each
+line, as the old grep_file did for one file) and through the FTS5 index with search().
+
+Usage: python benchmark_search.py [data_dir] [lines_per_file]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqliteCRUD import SqliteCRUD, ROOT_ID
+
+DATA_DIR = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data")
+PATTERNS = ["Ishmael", "Grendel", "Frankenstein", "harpoon", "xyzzy", "the"]
+
+
+def scan_tree(crud, pattern):
+    """The old way: every file in the tree is decoded and split to look for pattern."""
+    conn = crud._connect()
+    hits = []
+    for file_id, contents in conn.execute("""
+            SELECT f.id, blob_text(b.codec, b.contents, b.frames) FROM files f JOIN blobs b ON b.id = f.blob_id
+            """):
+        if any(pattern in line for line in contents.decode("utf-8").splitlines()):
+            hits.append(file_id)
+    return hits
+
+
+def search_tree(crud, pattern):
+    """The new way: the full-text index picks the matching files."""
+    return [result["id"] for result in crud.search(pattern, ROOT_ID, names_only=True, limit=1_000_000)]
+
+
+def timed(func, crud, pattern):
+    """Return (milliseconds, result) for one search."""
+    start = time.perf_counter()
+    result = func(crud, pattern)
+    return (time.perf_counter() - start) * 1000, result
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    lines_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    names = sorted(name for name in os.listdir(data_dir) if name.endswith(".txt"))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        crud = SqliteCRUD(os.path.join(tmp_dir, "bench.db"))
+        crud.migrate()
+        crud.create_directory("home", 0, 1)  # id 1, the root
+
+        files = 0
+        for name in names:
+            dir_id = crud.create_directory(name[:-4], ROOT_ID, 1)
+            with open(os.path.join(data_dir, name), "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+            for part, start in enumerate(range(0, len(lines), lines_per_file)):
+                data = b"".join(lines[start:start + lines_per_file])
+                crud.create_file(f"part{part:05d}.txt", data, dir_id, 1, len(data))
+                files += 1
+        print(f"{files} files of {lines_per_file} lines\n")
+
+        print(f"{'pattern':<14}{'files':>7}{'scan ms':>10}{'search ms':>11}{'speedup':>9}")
+        for pattern in PATTERNS:
+            scan_ms, scanned = timed(scan_tree, crud, pattern)
+            search_ms, found = timed(search_tree, crud, pattern)
+            assert sorted(scanned) == sorted(found), pattern
+            print(f"{pattern:<14}{len(found):>7}{scan_ms:>10.1f}{search_ms:>11.1f}{scan_ms / search_ms:>8.0f}x")
+        crud.close()
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,77 @@
+# benchmark_streaming.py
+
+"""
+Memory/latency benchmark for streaming file reads. The bundled texts from
+ApiStarter/data are loaded into a scratch database, then each one is read the
+old way (whole BLOB -> JSON document -> decoded and split by the shell) and the
+new way (incremental BLOB I/O in chunks, decoded as it streams). Peak Python
+memory is measured with tracemalloc.
+
+Usage: python benchmark_streaming.py [data_dir]
+"""
+
+import codecs
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqliteCRUD import SqliteCRUD
+
+DATA_DIR = os.path.join("..", "Shell_Project", "File_systems", "ApiStarter", "data")
+
+
+def read_whole(crud, file_name, pid):
+    """The old /cat/ path: load the BLOB, wrap it in JSON, decode it in the shell."""
+    contents = crud.read_file(file_name, pid).decode("utf-8")
+    body = json.dumps({"contents": contents})
+    return len(json.loads(body)["contents"].splitlines())
+
+
+def read_streaming(crud, file_name, pid):
+    """The new /cat/ path: stream chunks and decode them incrementally."""
+    info = crud.get_file_stream_info(file_name, pid)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    newlines = 0
+    for chunk in crud.iter_file(info["id"]):
+        newlines += decoder.decode(chunk).count("\n")
+    return newlines
+
+
+def measure(func, crud, file_name, pid):
+    """Return (seconds, peak bytes) for one read."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(crud, file_name, pid)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    names = sorted(name for name in os.listdir(data_dir) if name.endswith(".txt"))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        crud = SqliteCRUD(os.path.join(tmp_dir, "bench.db"))
+        crud.migrate()
+        for name in names:
+            with open(os.path.join(data_dir, name), "rb") as f:
+                data = f.read()
+            crud.create_file(name, data, 1, 1, len(data))
+
+        print(f"{'file':<18}{'size':>10}{'whole ms':>10}{'whole peak':>12}{'stream ms':>11}{'stream peak':>13}")
+        for name in names:
+            size = os.path.getsize(os.path.join(data_dir, name))
+            whole_time, whole_peak = measure(read_whole, crud, name, 1)
+            stream_time, stream_peak = measure(read_streaming, crud, name, 1)
+            print(f"{name:<18}{size / 1024:>8.0f}KB{whole_time * 1000:>10.1f}{whole_peak / 1024:>10.0f}KB"
+                  f"{stream_time * 1000:>11.1f}{stream_peak / 1024:>11.0f}KB")
+        crud.close()
+    finally:
+        shutil.rmtree(tmp_dir)
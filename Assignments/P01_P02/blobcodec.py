@@ -0,0 +1,176 @@
+# blobcodec.py
+
+"""
+This file holds the compression codecs for stored file contents (see schema.py,
+v7). A blob is compressed in independent frames of its codec's frame size, and
+the end offset of each compressed frame is kept next to it, so a read at any
+offset only decompresses the frames it covers. CompressedBlob wraps such a blob
+with the seek/read/len interface of sqlite3.Blob, which is all the streaming,
+line-index and grep paths use. Whether and how a blob is compressed is chosen
+from its size and type by choose_codec(); new codecs are added with
+register_codec().
+"""
+
+import lzma
+import os
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+Codec = namedtuple("Codec", "name compress decompress frame_size")
+
+MIN_COMPRESS_SIZE = 4 * 1024         # smaller contents are stored as they are
+LZMA_THRESHOLD = 1024 * 1024         # contents at least this big use lzma, the rest zlib
+MAX_STORED_RATIO = 0.9               # keep the raw bytes unless compression saves 10%
+TYPE_SAMPLE = 4096                   # bytes looked at to tell text from binary
+INCOMPRESSIBLE = {".gz", ".tgz", ".zip", ".bz2", ".xz", ".7z", ".png", ".jpg", ".jpeg", ".gif", ".mp3", ".mp4"}
+LZMA_FRAME_SIZE = 256 * 1024
+# A frame never refers back further than its own start, so a dictionary the
+# size of a frame loses nothing; preset 6 alone would allocate 8 MiB for every
+# frame decompressed. Frames written with the bigger dictionary still decode.
+LZMA_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6, "dict_size": LZMA_FRAME_SIZE}]
+
+CODECS = {}
+
+
+def register_codec(name, compress, decompress, frame_size):
+    """Make a codec available by name.
+
+    The frame size is part of the stored format: never change it for a name
+    already used in a database, register the new settings under a new name.
+    """
+    CODECS[name] = Codec(name, compress, decompress, frame_size)
+
+
+register_codec("zlib", lambda data: zlib.compress(data, 6), zlib.decompress, 64 * 1024)
+register_codec("lzma",
+               lambda data: lzma.compress(data, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS),
+               lambda data: lzma.decompress(data, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS),
+               LZMA_FRAME_SIZE)
+
+
+def pack_frames(ends):
+    """Pack compressed frame end offsets as little-endian uint32s."""
+    packed = array("I", ends)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_frames(data):
+    """Unpack frame end offsets written by pack_frames()."""
+    ends = array("I")
+    ends.frombytes(data or b"")
+    if sys.byteorder == "big":
+        ends.byteswap()
+    return ends
+
+
+def looks_like_text(contents, name=None):
+    """Guess whether contents are worth compressing from the file name and a sample."""
+    if name and os.path.splitext(name)[1].lower() in INCOMPRESSIBLE:
+        return False
+    sample = contents[:TYPE_SAMPLE]
+    if b"\0" in sample:
+        return False
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return e.start >= len(sample) - 3  # only a character cut off by the sample's end
+    return True
+
+
+def choose_codec(contents, name=None):
+    """Return the name of the codec to store contents with, or None to store them raw."""
+    if len(contents) < MIN_COMPRESS_SIZE or not looks_like_text(contents, name):
+        return None
+    return "lzma" if len(contents) >= LZMA_THRESHOLD else "zlib"
+
+
+def compress(contents, name=None):
+    """Return (codec, stored bytes, packed frame ends) for contents.
+
+    codec is None, and the bytes are contents themselves, when compression was
+    not tried or would not save enough.
+    """
+    codec = choose_codec(contents, name)
+    if codec is None:
+        return None, contents, None
+    frame_size = CODECS[codec].frame_size
+    frames = [CODECS[codec].compress(contents[start:start + frame_size])
+              for start in range(0, len(contents), frame_size)]
+    stored = b"".join(frames)
+    if len(stored) > len(contents) * MAX_STORED_RATIO:
+        return None, contents, None
+    ends, total = [], 0
+    for frame in frames:
+        total += len(frame)
+        ends.append(total)
+    return codec, stored, pack_frames(ends)
+
+
+def decompress(codec, stored, frames):
+    """Return the original contents of a stored blob."""
+    if codec is None:
+        return stored
+    decode = CODECS[codec].decompress
+    ends = unpack_frames(frames)
+    return b"".join(decode(stored[start:end]) for start, end in zip([0, *ends], ends))
+
+
+class CompressedBlob:
+    """Read-only view of a compressed blob with the seek/read/len interface of sqlite3.Blob.
+
+    Offsets are in the original contents. Frames are read from the stored blob
+    and decompressed on demand; the last one is kept, so sequential reads
+    decompress each frame once.
+    """
+
+    def __init__(self, blob, codec, size, frames):
+        self.blob = blob
+        self.codec = CODECS[codec]
+        self.size = size
+        self.ends = unpack_frames(frames)
+        self.pos = 0
+        self._frame = (None, b"")  # (index, decompressed bytes)
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.blob.close()
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, origin=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: self.size}[origin]
+        self.pos = min(max(base + offset, 0), self.size)
+
+    def _load(self, index):
+        """Return the decompressed bytes of frame index."""
+        if self._frame[0] != index:
+            start = self.ends[index - 1] if index else 0
+            self.blob.seek(start)
+            self._frame = (index, self.codec.decompress(self.blob.read(self.ends[index] - start)))
+        return self._frame[1]
+
+    def read(self, length=-1):
+        end = self.size if length is None or length < 0 else min(self.pos + length, self.size)
+        parts = []
+        frame_size = self.codec.frame_size
+        while self.pos < end:
+            index, skip = divmod(self.pos, frame_size)
+            data = self._load(index)[skip:skip + end - self.pos]
+            if not data:
+                break  # frames shorter than size says: stop rather than spin
+            parts.append(data)
+            self.pos += len(data)
+        return b"".join(parts)
@@ -4,60 +4,18 @@
 
 import sqlite3
 from datetime import datetime
+from schema import TABLES, migrate, store_blob
+from wc_stats import backfill
 
 # Connect to (or create) the database
 conn = sqlite3.connect('filesystem.db')
 cursor = conn.cursor()
 
-# Create tables
-tables = [
-    """
-    CREATE TABLE IF NOT EXISTS files (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        pid INTEGER,
-        oid INTEGER,
-        name TEXT,
-        size INTEGER DEFAULT 0,
-        creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        modified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        contents BLOB,
-        read_permission INTEGER DEFAULT 1,
-        write_permission INTEGER DEFAULT 0,
-        execute_permission INTEGER DEFAULT 1,
-        world_read INTEGER DEFAULT 1,
-        world_write INTEGER DEFAULT 0,
-        world_execute INTEGER DEFAULT 1
-    );
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS directories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,   -- parent directory
-        pid INTEGER,                            -- parent directory
-        oid INTEGER,                            -- owner
-        name TEXT NOT NULL,                     -- directory name
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        read_permission INTEGER DEFAULT 1,
-        write_permission INTEGER DEFAULT 0,
-        execute_permission INTEGER DEFAULT 1,
-        world_read INTEGER DEFAULT 1,
-        world_write INTEGER DEFAULT 0,
-        world_execute INTEGER DEFAULT 1
-    );
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """
-]
-
-# Execute table creation
-for table in tables:
+# Execute table creation, then bring the schema up to date (indexes, WAL, blobs table)
+for table in TABLES:
     cursor.execute(table)
+conn.commit()
+migrate(conn)
 
 # Insert initial users
 cursor.execute("""
@@ -79,13 +37,18 @@ INSERT INTO directories (pid, oid, name) VALUES
     (3, 3, 'docs');         -- Directory created by Mia
 """)
 
-# Insert files
-cursor.execute("""
-INSERT INTO files (pid, oid, name, size, contents, read_permission, write_permission, execute_permission) VALUES
-    (2, 2, 'somefile.txt', 1024, 'This is Bob''s file.', 1, 1, 0), -- File in Bob's directory
-    (6, 3, 'report.txt', 2048, 'Mia''s report data.', 1, 1, 0);    -- File in Mia's docs directory
-""")
+# Insert files; contents are stored once in blobs and the file points at them
+files = [
+    (2, 2, 'somefile.txt', 1024, b"This is Bob's file.", 1, 1, 0),  # File in Bob's directory
+    (6, 3, 'report.txt', 2048, b"Mia's report data.", 1, 1, 0),     # File in Mia's docs directory
+]
+cursor.executemany("""
+INSERT INTO files (pid, oid, name, size, blob_id, read_permission, write_permission, execute_permission)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+""", [(pid, oid, name, size, store_blob(conn, contents), *permissions)
+      for pid, oid, name, size, contents, *permissions in files])
 
-# Commit changes and close connection
+# Commit changes
 conn.commit()
+backfill(conn)  # store the wc counts of the files inserted above
 conn.close()
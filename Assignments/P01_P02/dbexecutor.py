@@ -0,0 +1,139 @@
+# dbexecutor.py
+
+"""
+This file provides the executor the API's async handlers hand their database
+work to. sqlite3 calls block, so they run on a fixed pool of worker threads
+owned by the API instead of Starlette's shared threadpool, and the event loop
+stays free to accept requests. At most max_pending calls may be queued or
+running at once: further requests wait up to admit_timeout seconds for a slot
+and are then turned away (the API answers 503), so a burst of clients builds
+a bounded queue instead of an unbounded one. stats() reports the queue depth.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """Raised when no slot in the executor frees up in time."""
+
+
+class DbExecutor:
+    def __init__(self, workers=8, max_pending=128, admit_timeout=5.0):
+        """Run database calls on workers threads, with at most max_pending queued or running."""
+        self.workers = workers
+        self.max_pending = max_pending
+        self.admit_timeout = admit_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._slots = None  # asyncio.Semaphore, made on first use inside the event loop
+        self._lock = threading.Lock()
+        self.pending = 0       # calls submitted and not finished (queued + running)
+        self.running = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _call(self, fn, args, kwargs):
+        """Run fn on a worker thread, keeping the counters."""
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread and return its result.
+
+        Raises Overloaded if no slot frees up within admit_timeout. A slot is
+        given back when the call finishes, not when the caller stops waiting,
+        so calls left running by disconnected clients still count.
+        """
+        return await asyncio.wrap_future(await self._submit(fn, args, kwargs))
+
+    async def _submit(self, fn, args, kwargs):
+        """Wait for a slot, then submit fn to a worker thread; return its concurrent Future."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.admit_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(f"Database busy: {self.pending} calls pending")
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        future = self.executor.submit(self._call, fn, args, kwargs)
+        future.add_done_callback(lambda _: self._release(loop))
+        return future
+
+    def _release(self, loop):
+        """Give a slot back once a call finished, or was cancelled before it started."""
+        with self._lock:
+            self.pending -= 1
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            pass  # the event loop is already closed (shutdown)
+
+    async def iterate(self, iterable):
+        """Async iterator over a blocking iterable, fetching each item on a worker thread.
+
+        If the consumer goes away (a client disconnects) while a worker is
+        still inside next(), the iterator is only closed once that call has
+        returned, since a generator cannot be closed while it is running.
+        """
+        iterator = iter(iterable)
+        done = object()
+        future = None
+        try:
+            while True:
+                future = await self._submit(next, (iterator, done), {})
+                item = await asyncio.wrap_future(future)
+                future = None
+                if item is done:
+                    return
+                yield item
+        finally:
+            if future is not None and not future.done():
+                # asyncio.wait does not cancel what it waits for, nor raise its exception
+                await asyncio.wait({asyncio.wrap_future(future)})
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()  # a generator's cleanup (closing its connection) is quick
+
+    def handler(self, fn):
+        """Decorate a blocking route function so it runs as an async handler on this executor.
+
+        The signature is kept (functools.wraps), so FastAPI still reads the
+        parameters off the original function.
+        """
+        @functools.wraps(fn)
+        async def run_handler(*args, **kwargs):
+            return await self.run(fn, *args, **kwargs)
+        return run_handler
+
+    def stats(self):
+        """Return the pool size and the queue depth counters."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "running": self.running,
+                "queue_depth": self.pending - self.running,
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def close(self):
+        """Stop the worker threads once the calls already submitted are done."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
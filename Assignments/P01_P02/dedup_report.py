@@ -0,0 +1,40 @@
+# dedup_report.py
+
+"""
+Prints how much space content-addressed storage saves in a filesystem
+database (see schema.py, v6 and v7): how many files share how many blobs, the
+bytes the files would take with a copy each, the bytes of the distinct
+contents, the bytes the blobs take after compression, both ratios and the
+space saved. The same numbers are served by the API at /blobs/.
+
+Usage: python dedup_report.py [db_path]
+"""
+
+import sys
+
+from sqliteCRUD import SqliteCRUD
+
+
+def format_bytes(count):
+    """Return count as a human readable size."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(count) < 1024 or unit == "GB":
+            return f"{count:.1f} {unit}" if unit != "B" else f"{count} B"
+        count /= 1024
+
+
+if __name__ == "__main__":
+    crud = SqliteCRUD(sys.argv[1] if len(sys.argv) > 1 else "filesystem.db")
+    crud.migrate()
+    stats = crud.blob_stats()
+    crud.close()
+
+    print(f"Files:         {stats['files']}")
+    print(f"Blobs:         {stats['blobs']} ({stats['shared_blobs']} shared by more than one file, "
+          f"{stats['compressed_blobs']} compressed)")
+    print(f"Logical size:  {format_bytes(stats['logical_bytes'])}")
+    print(f"Unique size:   {format_bytes(stats['unique_bytes'])}")
+    print(f"Stored size:   {format_bytes(stats['stored_bytes'])}")
+    print(f"Space saved:   {format_bytes(stats['bytes_saved'])}")
+    print(f"Dedup ratio:   {stats['dedup_ratio']:.2f}x")
+    print(f"Compression:   {stats['compression_ratio']:.2f}x")
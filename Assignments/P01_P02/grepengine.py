@@ -0,0 +1,150 @@
+# grepengine.py
+
+"""
+This file is the grep engine behind the API's /grep/ endpoint. A pattern is
+compiled once per request (as a regular expression, or escaped for -F), the
+files to search are picked with one query (the full-text index rules out files
+that cannot match a literal pattern), and the files are scanned concurrently
+by a thread pool. Each file is read in line-aligned blocks straight from its
+BLOB, and its result is handed back as soon as it is ready, in path order.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from sqliteCRUD import CHUNK_SIZE, ROOT_ID, read_chunks
+
+REGEX_SPECIALS = set(".^$*+?{}[]\\|()")
+DENSITY_SAMPLE = 4096  # characters looked at to decide whether a literal is on most lines
+
+
+def compile_pattern(pattern, fixed=False, ignore_case=False):
+    """Compile a grep pattern once: a regex, or a literal string with -F."""
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    return re.compile(re.escape(pattern) if fixed else pattern, flags)
+
+
+def literal_text(pattern, fixed=False):
+    """Return the text every match must contain, or None if the pattern is a real regex."""
+    if fixed or not REGEX_SPECIALS.intersection(pattern):
+        return pattern
+    return None
+
+
+def line_blocks(chunks):
+    """Regroup a chunk stream into decoded blocks that only end on line boundaries."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        cut = pending.rfind(b"\n")
+        if cut != -1:
+            yield pending[:cut + 1].decode("utf-8", errors="replace")
+            pending = pending[cut + 1:]
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def _split_block(text):
+    """Split a block into lines, the way split_lines does."""
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()  # trailing newline does not start another line
+    return lines
+
+
+def match_lines(regex, text, invert=False, first_line=1, literal=None):
+    """Yield (line_number, line) for each line of text that is selected.
+
+    Without invert the regex is run over the whole block and only the lines it
+    lands on are looked at; each is checked again on its own, so a match may
+    never span two lines. With invert every line has to be tested, and so does
+    a case-sensitive literal (passed as literal) that shows up on most lines,
+    where testing each line with 'in' is cheaper than jumping between matches.
+    """
+    if invert:
+        yield from [(number, line.rstrip("\r")) for number, line in enumerate(_split_block(text), start=first_line)
+                    if not regex.search(line.rstrip("\r"))]
+        return
+
+    if literal and text.count(literal, 0, DENSITY_SAMPLE) * 8 > text.count("\n", 0, DENSITY_SAMPLE):
+        yield from [(number, line.rstrip("\r")) for number, line in enumerate(_split_block(text), start=first_line)
+                    if literal in line]
+        return
+
+    pos = counted = 0
+    number = first_line
+    while True:
+        match = regex.search(text, pos)
+        if match is None:
+            return
+        start = text.rfind("\n", 0, match.start()) + 1
+        if start >= len(text):
+            return  # an empty match after the final newline is not a line
+        end = text.find("\n", match.start())
+        if end == -1:
+            end = len(text)
+        number += text.count("\n", counted, start)
+        counted = start
+        line = text[start:end].rstrip("\r")
+        if literal or regex.search(line):  # a literal cannot run over a newline
+            yield number, line
+        if end >= len(text):
+            return
+        pos = end + 1
+
+
+class GrepEngine:
+    def __init__(self, crud, workers=4):
+        """Scan files from crud's database with a pool of worker threads."""
+        self.crud = crud
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grep")
+
+    def grep(self, pattern, pid=ROOT_ID, recursive=False, name=None, fixed=False,
+             ignore_case=False, invert=False, count=False, files_only=False):
+        """Search the files in directory pid (or its subtree) and yield one result per file.
+
+        Each result is {'id', 'path', 'count', 'lines'}, where lines holds
+        {'line_number', 'line'} dicts (left empty with count or files_only).
+        Files with no selected lines are skipped unless count is set.
+        """
+        regex = compile_pattern(pattern, fixed, ignore_case)
+        literal = literal_text(pattern, fixed)
+        contains = None if invert or count else literal  # -c reports 0s too
+        if ignore_case or (literal and "\n" in literal):
+            literal = None  # only an exact, single-line literal may skip the regex
+        files = self.crud.find_files(pid, recursive, name, contains)
+
+        keep_lines = not (count or files_only)
+        futures = [self.executor.submit(self._grep_file, regex, literal, file_id, invert, keep_lines, files_only)
+                   for file_id, _ in files]
+        try:
+            for (file_id, path), future in zip(files, futures):
+                matched, lines = future.result()
+                if matched or count:
+                    yield {"id": file_id, "path": path, "count": matched, "lines": lines}
+        finally:
+            for future in futures:
+                future.cancel()  # the client went away; skip the files not started yet
+
+    def _grep_file(self, regex, literal, file_id, invert, keep_lines, stop_at_first):
+        """Scan one file; return (number of selected lines, selected lines)."""
+        matched = 0
+        lines = []
+        conn = self.crud._connect()  # this worker thread's own pooled connection
+        with self.crud._open_blob(conn, file_id) as blob:
+            number = 1
+            for text in line_blocks(read_chunks(blob, chunk_size=CHUNK_SIZE)):
+                selected = match_lines(regex, text, invert, number, literal)
+                if stop_at_first:
+                    if next(selected, None) is not None:
+                        return 1, lines
+                elif keep_lines:
+                    lines.extend({"line_number": line_number, "line": line} for line_number, line in selected)
+                else:
+                    matched += sum(1 for _ in selected)
+                number += text.count("\n")
+        return matched + len(lines), lines
+
+    def close(self):
+        """Stop the worker threads."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
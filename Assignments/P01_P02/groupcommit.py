@@ -0,0 +1,151 @@
+# groupcommit.py
+
+"""
+This file is the single writer the API's mutating endpoints go through. Each
+write (mkdir, touch, mv, rm, cp, chmod, a /batch list) is queued as a call
+and run on one writer thread, so API workers never compete for SQLite's
+write lock. The writer takes whatever calls are waiting, up to max_batch,
+waiting at most max_latency seconds for more to arrive, and runs them in one
+transaction (SqliteCRUD.batch()) that is committed once for the whole group.
+By default it does not wait at all: a group is whatever queued up while the
+previous one was being committed, so a lone write is not held back and a
+burst of writes shares one commit. Each call gets its own savepoint: one that
+raises is undone on its own and its caller gets the exception, the others are
+committed. A caller is only handed its result after the group's commit.
+"""
+
+import asyncio
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, crud, max_batch=64, max_latency=0.0):
+        """Run writes against crud's database on one thread, committing up to max_batch at a time."""
+        self.crud = crud
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.groups = 0
+        self.writes = 0
+        self.failed = 0
+        self.largest_group = 0
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for the writer thread; return a Future for its result."""
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on the writer thread and wait for its result, once it is committed."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the writer thread without blocking the event loop; return its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def handler(self, fn):
+        """Decorate a route function that writes, so it runs as an async handler on the writer.
+
+        Like DbExecutor.handler, the signature is kept for FastAPI. The whole
+        function runs on the writer thread, so the lookups it makes before
+        writing see the same state the write does.
+        """
+        @functools.wraps(fn)
+        async def run_handler(*args, **kwargs):
+            return await self.run(fn, *args, **kwargs)
+        return run_handler
+
+    def _next_group(self):
+        """Block for the first call, then gather more until max_batch or max_latency; None after close()."""
+        first = self._queue.get()
+        if first is STOP:
+            return None
+        group = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(group) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is STOP:
+                self._queue.put(STOP)  # stop after this group
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        """Writer thread: commit groups of queued calls until close()."""
+        while True:
+            group = self._next_group()
+            if group is None:
+                return
+            self._commit(group)
+
+    def _commit(self, group):
+        """Run a group of calls in one transaction, then hand each caller its result."""
+        outcomes = []
+        try:
+            with self.crud.batch() as conn:
+                for fn, args, kwargs, future in group:
+                    if not future.set_running_or_notify_cancel():
+                        outcomes.append(None)
+                        continue
+                    conn.execute("SAVEPOINT group_write")
+                    try:
+                        result = fn(*args, **kwargs)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO group_write")
+                        conn.execute("RELEASE group_write")
+                        outcomes.append((False, e))
+                        continue
+                    conn.execute("RELEASE group_write")
+                    outcomes.append((True, result))
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in the group was written
+            outcomes = [None if outcome is None else (False, e) for outcome in outcomes]
+            for _, _, _, future in group[len(outcomes):]:
+                outcomes.append((False, e) if future.set_running_or_notify_cancel() else None)
+
+        with self._lock:
+            self.groups += 1
+            self.writes += len(group)
+            self.failed += sum(1 for outcome in outcomes if outcome and not outcome[0])
+            self.largest_group = max(self.largest_group, len(group))
+        for (_, _, _, future), outcome in zip(group, outcomes):
+            if outcome is None:
+                continue
+            ok, value = outcome
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        """Return the queue depth and how many writes were committed in how many groups."""
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_latency": self.max_latency,
+                "queue_depth": self._queue.qsize(),
+                "groups": self.groups,
+                "writes": self.writes,
+                "failed": self.failed,
+                "largest_group": self.largest_group,
+                "average_group": round(self.writes / self.groups, 2) if self.groups else 0,
+            }
+
+    def close(self):
+        """Finish the calls already queued, then stop the writer thread."""
+        self._queue.put(STOP)
+        self._thread.join()
@@ -0,0 +1,105 @@
+# loadtest.py
+
+"""
+Load test for the running API. Each simulated client is a thread with its own
+HTTP session that sends a mix of read requests (ls, resolve, head, wc) back to
+back. The same number of requests per client is sent at 1, 16 and 64
+concurrent clients, and the p50/p99 latency, the throughput and any 503s
+(requests turned away by the database executor) are printed for each level,
+together with the deepest queue /db_executor/ saw. Start the API first
+('python api.py') on a loaded database.
+
+Usage: python loadtest.py [api_url] [requests_per_client]
+"""
+
+import random
+import sys
+import threading
+import time
+
+import requests
+
+API_URL = "http://localhost:8080"
+CLIENT_LEVELS = (1, 16, 64)
+ROOT_ID = 1
+
+
+def pick_targets(api_url):
+    """Return (directory ids, (file name, pid) pairs) from the root and its subdirectories."""
+    dirs, files = [ROOT_ID], []
+    for entry in requests.get(f"{api_url}/ls/{ROOT_ID}").json()["contents"]:
+        if entry["type"] == "dir":
+            info = requests.get(f"{api_url}/resolve/", params={"path": entry["name"]}).json()
+            dirs.append(info["id"])
+        else:
+            files.append((entry["name"], ROOT_ID))
+    for dir_id in dirs[1:]:
+        for entry in requests.get(f"{api_url}/ls/{dir_id}").json()["contents"]:
+            if entry["type"] == "file":
+                files.append((entry["name"], dir_id))
+    return dirs, files
+
+
+def make_requests(api_url, dirs, files, rng):
+    """Yield (url, params) for an endless mix of read requests."""
+    while True:
+        kind = rng.choice(("ls", "resolve", "head", "wc") if files else ("ls", "resolve"))
+        if kind == "ls":
+            yield f"{api_url}/ls/{rng.choice(dirs)}", {}
+        elif kind == "resolve":
+            yield f"{api_url}/resolve/", {"path": "/", "current_pid": rng.choice(dirs)}
+        else:
+            name, pid = rng.choice(files)
+            yield f"{api_url}/{kind}/", {"file_name": name, "pid": pid}
+
+
+def client(api_url, dirs, files, count, seed, latencies, errors):
+    """Send count requests one after another, recording each latency in seconds."""
+    session = requests.Session()
+    mix = make_requests(api_url, dirs, files, random.Random(seed))
+    for _ in range(count):
+        url, params = next(mix)
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    session.close()
+
+
+def percentile(values, fraction):
+    """Return the value below which fraction of the sorted values lie."""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_level(api_url, dirs, files, clients, count):
+    """Run clients concurrent clients; return (latencies, errors, seconds)."""
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(api_url, dirs, files, count, seed, latencies, errors))
+               for seed in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    api_url = sys.argv[1] if len(sys.argv) > 1 else API_URL
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    dirs, files = pick_targets(api_url)
+    print(f"{len(dirs)} directories, {len(files)} files, {count} requests per client")
+    print(f"{'clients':>8}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}{'503s':>7}{'peak queue':>12}")
+    for clients in CLIENT_LEVELS:
+        latencies, errors, seconds = run_level(api_url, dirs, files, clients, count)
+        stats = requests.get(f"{api_url}/db_executor/").json()
+        peak_queue = max(stats["peak_pending"] - stats["workers"], 0)  # peak since the API started
+        print(f"{clients:>8}{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}"
+              f"{len(latencies) / seconds:>10.0f}{len(errors):>8}{errors.count(503):>7}{peak_queue:>12}")
@@ -0,0 +1,96 @@
+# pathcache.py
+
+"""
+This file provides the path cache used by both the API and the shell. Resolving
+a path like 'bob/a/b/c' costs one query per component, and rebuilding the prompt
+walks parent pointers with one query per level. PathCache remembers resolved
+paths (LRU), each directory's (name, parent) pair, and the full path of each
+directory id, so repeated lookups are answered without touching the database.
+Any command that adds, moves or removes entries must call invalidate().
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class PathCache:
+    def __init__(self, maxsize=4096):
+        """Set up empty caches holding at most maxsize resolved paths."""
+        self.maxsize = maxsize
+        self._ids = OrderedDict()    # (start_pid, path) -> directory id
+        self._paths = OrderedDict()  # directory id -> absolute path
+        self._parents = {}           # directory id -> (name, parent id)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _lru_get(self, cache, key):
+        """Look up key in an LRU dict, counting the hit or miss."""
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                self.hits += 1
+                return cache[key]
+            self.misses += 1
+            return None
+
+    def _lru_put(self, cache, key, value):
+        """Store key in an LRU dict, evicting the least recently used entry."""
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+    def get_id(self, start_pid, path):
+        """Return the cached id of path resolved from start_pid, or None."""
+        return self._lru_get(self._ids, (start_pid, path))
+
+    def put_id(self, start_pid, path, dir_id):
+        """Remember that path resolved from start_pid is dir_id."""
+        self._lru_put(self._ids, (start_pid, path), dir_id)
+
+    def get_path(self, dir_id):
+        """Return the cached absolute path of dir_id, or None."""
+        return self._lru_get(self._paths, dir_id)
+
+    def put_path(self, dir_id, path):
+        """Remember the absolute path of dir_id."""
+        self._lru_put(self._paths, dir_id, path)
+
+    def get_parent(self, dir_id):
+        """Return the cached (name, parent id) of dir_id, or None."""
+        with self._lock:
+            info = self._parents.get(dir_id)
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return info
+
+    def put_parent(self, dir_id, name, pid):
+        """Remember the name and parent id of dir_id."""
+        with self._lock:
+            self._parents[dir_id] = (name, pid)
+
+    def invalidate(self):
+        """Forget everything; called after mkdir, mv, rm and cp."""
+        with self._lock:
+            self._ids.clear()
+            self._paths.clear()
+            self._parents.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Return hit/miss counters and current cache sizes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "paths": len(self._ids),
+                "parents": len(self._parents),
+            }
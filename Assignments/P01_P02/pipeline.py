@@ -0,0 +1,378 @@
+# pipeline.py
+
+"""
+This file holds the stages of the shell's pipelines: cat, grep, head, tail, wc
+and sort as generators that take the previous stage's lines and yield their
+own, one at a time, so a pipeline holds about one buffer of text however big
+its input is. The shell chains them when it runs a pipeline itself; the API's
+/pipeline/ endpoint runs whole pipelines with them next to the database
+(Pipeline), so only the last stage's output crosses the network, and reports
+how long each stage took.
+"""
+
+import codecs
+import itertools
+import re
+import time
+from collections import deque
+
+from grepengine import compile_pattern, match_lines
+from sqliteCRUD import CHUNK_SIZE, ROOT_ID
+
+STAGES = ("cat", "grep", "head", "tail", "wc", "sort")
+
+
+class PipelineError(Exception):
+    """A pipeline cannot be run: an unknown command, a bad argument or a missing file."""
+
+
+### Lines from chunks
+
+def decode_chunks(chunks):
+    """Decode a stream of UTF-8 byte chunks, even where a character is split between two."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def text_lines(chunks):
+    """Regroup a stream of text chunks into lines, yielded without their line endings."""
+    pending = ""
+    for chunk in chunks:
+        if "\n" not in chunk:
+            pending += chunk
+            continue
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def text_blocks(lines, size=CHUNK_SIZE):
+    """Join lines into blocks of about size characters; yield (first line number, block)."""
+    block, length, first_line = [], 0, 1
+    for line in lines:
+        block.append(line)
+        length += len(line) + 1
+        if length >= size:
+            yield first_line, "\n".join(block)
+            first_line += len(block)
+            block, length = [], 0
+    if block:
+        yield first_line, "\n".join(block)
+
+
+def close_lines(lines):
+    """Stop a pipeline stage early: close it (and whatever it is still reading) if it is a generator."""
+    close = getattr(lines, "close", None)
+    if close is not None:
+        close()
+
+
+### Stages
+
+def line_count(cmd, piped):
+    """Return the number of lines head or tail should show; raise ValueError if -n is not followed by one."""
+    if '-n' not in cmd["flags"]:
+        return 10  # Default number of lines
+    try:
+        # Piped input has no file name, so the count is the first parameter
+        return max(int(cmd["params"][0] if piped else cmd["params"][1]), 0)
+    except (IndexError, ValueError):
+        raise ValueError("Invalid number of lines specified.")
+
+
+def grep_output(result, letters, show_path, mark=None):
+    """Format one file's grep result the way grep prints it (-l, -c, -n, path prefixes).
+
+    mark, if given, is applied to each selected line (the shell highlights
+    the matches with it).
+    """
+    if 'l' in letters:
+        return [result["path"]]
+    prefix = f"{result['path']}:" if show_path else ""
+    if 'c' in letters:
+        return [f"{prefix}{result['count']}"]
+
+    lines = []
+    for match in result["lines"]:
+        line = mark(match["line"]) if mark else match["line"]
+        number = f"{match['line_number']}:" if 'n' in letters else ""
+        lines.append(f"{prefix}{number}{line}")
+    return lines
+
+
+def grep_stage(lines, regex, letters, mark=None):
+    """Yield grep's output for piped lines.
+
+    The lines are searched a block at a time with the same matcher the API
+    uses, so matches are passed on before the input ends; -l stops reading at
+    the first match.
+    """
+    count = 0
+    for first_line, text in text_blocks(lines):
+        selected = [{"line_number": number, "line": line}
+                    for number, line in match_lines(regex, text, 'v' in letters, first_line)]
+        count += len(selected)
+        if 'l' in letters:
+            if selected:
+                yield "(standard input)"
+                return
+        elif 'c' not in letters:
+            yield from grep_output({"path": "(standard input)", "lines": selected, "count": len(selected)},
+                                   letters, False, mark)
+    if 'c' in letters:
+        yield str(count)
+
+
+def head_stage(lines, num_lines):
+    """Yield the first num_lines lines, then close the input so the stages feeding it stop."""
+    try:
+        yield from itertools.islice(lines, num_lines)
+    finally:
+        close_lines(lines)
+
+
+def tail_stage(lines, num_lines):
+    """Yield the last num_lines lines; only that many are held at a time."""
+    yield from deque(lines, maxlen=num_lines)
+
+
+def sort_stage(lines):
+    """Yield the lines sorted. It has to see every line first: the one stage that holds all its input."""
+    yield from sorted(lines)
+
+
+def wc_line(counts, suffix=""):
+    """Format wc's line, word and character counts, followed by suffix (a path, or 'total')."""
+    line = (f"Line count: {counts['line_count']}, Word count: {counts['word_count']}, "
+            f"Character count: {counts['char_count']}")
+    return f"{line} {suffix}" if suffix else line
+
+
+def wc_stage(lines, words_only=False):
+    """Yield wc's counts for piped lines, counted in one pass."""
+    counts = {"line_count": 0, "word_count": 0, "char_count": 0}
+    for line in lines:
+        counts["line_count"] += 1
+        counts["word_count"] += len(line.split())
+        counts["char_count"] += len(line)
+    yield f"Word count from piped input: {counts['word_count']}" if words_only else wc_line(counts)
+
+
+def wc_files(found, words_only=False, several=False):
+    """Yield wc's output for the [(path, counts)] of the files found.
+
+    Several files named (several) get one line each, with its path, and a total.
+    """
+    if words_only:
+        for _, counts in found[:1]:
+            yield f"Word count from file: {counts['word_count']}"
+        return
+    if not several:
+        for _, counts in found[:1]:
+            yield wc_line(counts)
+        return
+    for path, counts in found:
+        yield wc_line(counts, path)
+    if found:
+        totals = {key: sum(counts[key] for _, counts in found) for key in ("line_count", "word_count", "char_count")}
+        yield wc_line(totals, "total")
+
+
+### Pipelines run by the API
+
+class Pipeline:
+    def __init__(self, crud, grep_engine, sub_cmds, pid=ROOT_ID):
+        """Check a parsed pipeline and set up its stages against crud's database.
+
+        sub_cmds is the list the shell's parse() makes of a command line. The
+        first stage reads the files it names, relative to directory pid; each
+        later one reads the stage before it. Raises PipelineError for anything
+        that would fail, before any output is produced.
+        """
+        self.crud = crud
+        self.grep_engine = grep_engine
+        self.pid = pid
+        self.stages = []
+        if not sub_cmds:
+            raise PipelineError("Empty pipeline")
+        lines = None
+        for cmd in sub_cmds:
+            name = cmd.get("cmd")
+            if name not in STAGES:
+                raise PipelineError(f"{name}: cannot run in a pipeline on the server")
+            cmd = {"cmd": name, "flags": list(cmd.get("flags", [])), "params": list(cmd.get("params", []))}
+            try:
+                lines = getattr(self, f"_{name}")(cmd, lines)
+            except ValueError as e:
+                raise PipelineError(f"{name}: {e}")
+            self.stages.append({"cmd": " ".join([name] + cmd["flags"] + cmd["params"]), "lines": 0, "seconds": 0.0})
+            lines = self._timed(self.stages[-1], lines)
+        self.output = lines
+
+    def records(self, size=CHUNK_SIZE):
+        """Yield the output as {'lines'} records of about size characters, then a {'stages', 'total_ms'} record.
+
+        Each stage's ms is the time spent in its own code, not waiting on the
+        stage before it. An error part way through ends the output with an
+        {'error'} record.
+        """
+        batch, length = [], 0
+        try:
+            for line in self.output:
+                batch.append(line)
+                length += len(line) + 1
+                if length >= size:
+                    yield {"lines": batch}
+                    batch, length = [], 0
+        except Exception as e:
+            yield {"error": str(e)}
+            return
+        finally:
+            close_lines(self.output)
+        if batch:
+            yield {"lines": batch}
+        yield {"stages": self.timings(), "total_ms": round(self.stages[-1]["seconds"] * 1000, 3)}
+
+    def timings(self):
+        """Return [{'cmd', 'lines', 'ms'}] for the stages, ms being each stage's own time."""
+        timings = []
+        for index, stage in enumerate(self.stages):
+            upstream = self.stages[index - 1]["seconds"] if index else 0.0
+            timings.append({"cmd": stage["cmd"], "lines": stage["lines"],
+                            "ms": round(max(stage["seconds"] - upstream, 0.0) * 1000, 3)})
+        return timings
+
+    @staticmethod
+    def _timed(stage, lines):
+        """Pass lines through, adding the time spent producing them (upstream included) to stage."""
+        clock = time.perf_counter
+        seconds, count = 0.0, 0
+        try:
+            start = clock()
+            for line in lines:
+                seconds += clock() - start
+                count += 1
+                yield line
+                start = clock()
+            seconds += clock() - start
+        finally:
+            stage["seconds"] += seconds
+            stage["lines"] += count
+            close_lines(lines)
+
+    ### Sources: the first stage reads files from the database
+    def _file(self, path):
+        """Return resolve_path()'s info for a file, or raise ValueError."""
+        info = self.crud.resolve_path(path, self.pid)
+        if info is None:
+            raise ValueError(f"{path}: No such file or directory")
+        if info["type"] != "file":
+            raise ValueError(f"{path}: Is a directory")
+        return info
+
+    def _file_lines(self, file_id):
+        """Yield a file's lines, read a chunk at a time from its BLOB."""
+        chunks = self.crud.iter_file(file_id)
+        try:
+            yield from text_lines(decode_chunks(chunks))
+        finally:
+            chunks.close()
+
+    def _files_lines(self, file_ids):
+        """Yield the lines of several files, one after another."""
+        for file_id in file_ids:
+            yield from self._file_lines(file_id)
+
+    def _stored_lines(self, read, *args):
+        """Yield the lines read(*args) returns, fetched when the stage first runs."""
+        yield from read(*args)
+
+    def _wc_files(self, infos, words_only):
+        """Yield wc's output for files from their stored counts, fetched when the stage first runs."""
+        found = [(path, self.crud.get_wc_stats(info["path"].rsplit("/", 1)[-1], info["pid"])) for path, info in infos]
+        yield from wc_files(found, words_only, several=len(infos) > 1)
+
+    ### Stages, called with the previous stage's lines (None for the first)
+    def _cat(self, cmd, lines):
+        if lines is not None:
+            return lines
+        if not cmd["params"]:
+            raise ValueError("No file specified.")
+        return self._files_lines([self._file(path)["id"] for path in cmd["params"]])
+
+    def _grep(self, cmd, lines):
+        if not cmd["params"]:
+            raise ValueError("grep requires at least a pattern")
+        pattern = cmd["params"][0]
+        letters = set("".join(flag.lstrip('-') for flag in cmd["flags"]))
+        try:
+            regex = compile_pattern(pattern, 'F' in letters, 'i' in letters)
+        except re.error as e:
+            raise ValueError(f"invalid pattern: {e}")
+        if lines is not None:
+            return grep_stage(lines, regex, letters)
+
+        targets = cmd["params"][1:] or (['.'] if 'r' in letters else [])
+        if not targets:
+            raise ValueError("grep requires a pattern and a file")
+        scopes = []
+        for path in targets:
+            target = self.crud.resolve_path(path, self.pid)
+            if target is None:
+                raise ValueError(f"{path}: No such file or directory")
+            if target["type"] == "dir":
+                if 'r' not in letters:
+                    raise ValueError(f"{path}: Is a directory")
+                scopes.append({"pid": target["id"], "recursive": True})
+            else:
+                scopes.append({"pid": target["pid"], "name": target["path"].rsplit("/", 1)[-1]})
+        return self._grep_files(pattern, letters, scopes, 'r' in letters or len(targets) > 1)
+
+    def _grep_files(self, pattern, letters, scopes, show_path):
+        """Yield grep's output for files and directories, run by the grep engine."""
+        for scope in scopes:
+            results = self.grep_engine.grep(pattern, fixed='F' in letters, ignore_case='i' in letters,
+                                            invert='v' in letters, count='c' in letters, files_only='l' in letters,
+                                            **scope)
+            try:
+                for result in results:
+                    yield from grep_output(result, letters, show_path)
+            finally:
+                results.close()
+
+    def _head(self, cmd, lines):
+        num_lines = line_count(cmd, lines is not None)
+        if lines is not None:
+            return head_stage(lines, num_lines)
+        if not cmd["params"]:
+            raise ValueError("No file specified.")
+        return self._stored_lines(self.crud.head_lines, self._file(cmd["params"][0])["id"], num_lines)
+
+    def _tail(self, cmd, lines):
+        num_lines = line_count(cmd, lines is not None)
+        if lines is not None:
+            return tail_stage(lines, num_lines)
+        if not cmd["params"]:
+            raise ValueError("No file specified.")
+        return self._stored_lines(self.crud.tail_lines, self._file(cmd["params"][0])["id"], num_lines)
+
+    def _wc(self, cmd, lines):
+        words_only = "-w" in cmd["flags"]
+        if lines is not None:
+            return wc_stage(lines, words_only)
+        if not cmd["params"]:
+            raise ValueError("wc requires a file or input")
+        infos = [(path, self._file(path)) for path in cmd["params"]]
+        return self._wc_files(infos, words_only)
+
+    def _sort(self, cmd, lines):
+        if lines is not None:
+            return sort_stage(lines)
+        if not cmd["params"]:
+            raise ValueError("No file specified.")
+        return sort_stage(self._file_lines(self._file(cmd["params"][0])["id"]))
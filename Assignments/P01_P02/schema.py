@@ -0,0 +1,407 @@
+# schema.py
+
+"""
+This file holds the filesystem database schema. TABLES is the base layout that
+'create_and_load_db.py' creates, and MIGRATIONS is an ordered list of upgrades
+on top of it. The number of migrations already applied is kept in SQLite's
+user_version pragma, so migrate() can be run on any database, old or new, and
+only applies the steps it is missing.
+"""
+
+import hashlib
+import sqlite3
+
+import blobcodec
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pid INTEGER,
+        oid INTEGER,
+        name TEXT,
+        size INTEGER DEFAULT 0,
+        creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        modified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        contents BLOB,
+        read_permission INTEGER DEFAULT 1,
+        write_permission INTEGER DEFAULT 0,
+        execute_permission INTEGER DEFAULT 1,
+        world_read INTEGER DEFAULT 1,
+        world_write INTEGER DEFAULT 0,
+        world_execute INTEGER DEFAULT 1
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS directories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,   -- parent directory
+        pid INTEGER,                            -- parent directory
+        oid INTEGER,                            -- owner
+        name TEXT NOT NULL,                     -- directory name
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        read_permission INTEGER DEFAULT 1,
+        write_permission INTEGER DEFAULT 0,
+        execute_permission INTEGER DEFAULT 1,
+        world_read INTEGER DEFAULT 1,
+        world_write INTEGER DEFAULT 0,
+        world_execute INTEGER DEFAULT 1
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+]
+
+# Per-connection settings, applied every time a connection is opened
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",   # safe with WAL, one fsync per checkpoint instead of per commit
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",    # 16 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+]
+
+
+def apply_pragmas(conn):
+    """Apply the per-connection tuning pragmas."""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    register_functions(conn)
+
+
+def register_functions(conn):
+    """Register the SQL functions the schema's views and triggers call.
+
+    blob_text(codec, contents, frames) returns a blob's original contents,
+    decompressing them if needed. Every connection that writes blobs or
+    reads blob_texts must have it.
+    """
+    conn.create_function("blob_text", 3, blobcodec.decompress, deterministic=True)
+
+
+### Content-addressed storage
+
+def content_hash(contents):
+    """Return the key a file's contents are stored under in blobs."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def store_blob(conn, contents, name=None):
+    """Return the id of the blob holding contents, adding one if none does yet.
+
+    New contents are compressed when blobcodec.choose_codec() says so (name
+    helps tell their type). Reference counts are kept by triggers on files, so
+    a blob stored here and never pointed at stays at refcount 0 until the
+    transaction is rolled back.
+    """
+    digest = content_hash(contents)
+    row = conn.execute("SELECT id FROM blobs WHERE hash = ?;", (digest,)).fetchone()
+    if row:
+        return row[0]
+    codec, stored, frames = blobcodec.compress(contents, name)
+    return conn.execute("""
+        INSERT INTO blobs (hash, size, codec, frames, contents) VALUES (?, ?, ?, ?, ?);
+    """, (digest, len(contents), codec, frames, stored)).lastrowid
+
+
+### Migrations
+
+def _v1_pid_name_indexes(conn):
+    """Index (pid, name) on files and directories.
+
+    Every hot lookup filters on (name, pid) or on pid alone, and both are served
+    by a composite index with pid first. The index is unique, so any duplicate
+    names left in one directory by older versions are renamed to name~id first.
+    """
+    for table in ("files", "directories"):
+        conn.execute(f"""
+            UPDATE {table} SET name = name || '~' || id
+            WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY pid, name);
+        """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_pid_name ON files (pid, name);")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_directories_pid_name ON directories (pid, name);")
+
+
+def _v2_blob_contents(conn):
+    """Store every file's contents as a BLOB.
+
+    Older rows hold TEXT (or NULL), which incremental BLOB I/O cannot open, so
+    streaming reads would have to load them whole.
+    """
+    conn.execute("UPDATE files SET contents = CAST(contents AS BLOB) WHERE typeof(contents) = 'text';")
+    conn.execute("UPDATE files SET contents = X'' WHERE contents IS NULL;")
+
+
+def _v3_line_index(conn):
+    """Add the per-file line-offset index used for random line access.
+
+    offsets holds the start offset of every line as packed little-endian
+    uint32s. Rows are built when a file is created (or lazily on first read)
+    and dropped by triggers whenever the contents change or the file goes away.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS line_index (
+            file_id INTEGER PRIMARY KEY,    -- files.id
+            line_count INTEGER NOT NULL,
+            offsets BLOB NOT NULL           -- packed start offset of each line
+        );
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS line_index_on_write AFTER UPDATE OF contents ON files
+        BEGIN
+            DELETE FROM line_index WHERE file_id = old.id;
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS line_index_on_delete AFTER DELETE ON files
+        BEGIN
+            DELETE FROM line_index WHERE file_id = old.id;
+        END;
+    """)
+
+
+def _v4_full_text_search(conn):
+    """Add an FTS5 index over file contents for tree-wide search.
+
+    files_fts is an external-content table, so the text is not stored twice;
+    triggers keep it in step with files. The trigram tokenizer lets MATCH find
+    any substring of three or more characters, which is what grep needs.
+    """
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+            contents, content='files', content_rowid='id', tokenize='trigram'
+        );
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_fts_on_insert AFTER INSERT ON files
+        BEGIN
+            INSERT INTO files_fts (rowid, contents) VALUES (new.id, new.contents);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_fts_on_delete AFTER DELETE ON files
+        BEGIN
+            INSERT INTO files_fts (files_fts, rowid, contents) VALUES ('delete', old.id, old.contents);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_fts_on_write AFTER UPDATE OF contents ON files
+        BEGIN
+            INSERT INTO files_fts (files_fts, rowid, contents) VALUES ('delete', old.id, old.contents);
+            INSERT INTO files_fts (rowid, contents) VALUES (new.id, new.contents);
+        END;
+    """)
+    conn.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild');")  # index existing rows
+
+
+def _v5_wc_columns(conn):
+    """Store wc's line, word, char and byte counts with each file.
+
+    The counts are filled in when a file is written; NULL means not counted yet
+    (rows from before this migration, see 'wc_stats.py') or stale, which a
+    trigger marks whenever the contents change.
+    """
+    for column in ("line_count", "word_count", "char_count", "byte_count"):
+        conn.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER;")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_wc_on_write AFTER UPDATE OF contents ON files
+        BEGIN
+            UPDATE files SET line_count = NULL, word_count = NULL, char_count = NULL, byte_count = NULL
+            WHERE id = new.id;
+        END;
+    """)
+
+
+def _v6_content_addressed_blobs(conn):
+    """Move file contents into a content-addressed, reference-counted blobs table.
+
+    Identical contents are stored once, keyed by their SHA-256, and files point
+    at them through blob_id, so cp only copies metadata and a write stores (or
+    reuses) another blob. Triggers on files keep refcount equal to the number of
+    files using a blob and delete a blob once nothing refers to it. The line
+    index, full-text index and their triggers follow the contents to blobs.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            id INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,              -- sha256 of contents
+            size INTEGER NOT NULL,                  -- length of contents in bytes
+            refcount INTEGER NOT NULL DEFAULT 0,    -- files pointing at this blob
+            contents BLOB NOT NULL
+        );
+    """)
+    conn.execute("ALTER TABLE files ADD COLUMN blob_id INTEGER REFERENCES blobs (id);")
+
+    # Everything below hangs off files.contents and has to go before the column can
+    for trigger in ("line_index_on_write", "line_index_on_delete", "files_fts_on_insert",
+                    "files_fts_on_delete", "files_fts_on_write", "files_wc_on_write"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    conn.execute("DROP TABLE IF EXISTS files_fts;")
+    conn.execute("DROP TABLE IF EXISTS line_index;")
+
+    # One file at a time, so the whole corpus is never in memory at once
+    for (file_id,) in conn.execute("SELECT id FROM files;").fetchall():
+        contents = conn.execute("SELECT contents FROM files WHERE id = ?;", (file_id,)).fetchone()[0] or b""
+        digest = content_hash(contents)
+        conn.execute("INSERT OR IGNORE INTO blobs (hash, size, contents) VALUES (?, ?, ?);",
+                     (digest, len(contents), contents))
+        conn.execute("UPDATE files SET blob_id = (SELECT id FROM blobs WHERE hash = ?) WHERE id = ?;",
+                     (digest, file_id))
+    conn.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM files WHERE files.blob_id = blobs.id);")
+    conn.execute("ALTER TABLE files DROP COLUMN contents;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_blob_id ON files (blob_id);")
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_ref_on_insert AFTER INSERT ON files WHEN new.blob_id IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_ref_on_delete AFTER DELETE ON files WHEN old.blob_id IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+            DELETE FROM blobs WHERE id = old.blob_id AND refcount <= 0;
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_ref_on_write AFTER UPDATE OF blob_id ON files
+        WHEN old.blob_id IS NOT new.blob_id
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+            UPDATE blobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+            DELETE FROM blobs WHERE id = old.blob_id AND refcount <= 0;
+        END;
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS line_index (
+            blob_id INTEGER PRIMARY KEY,    -- blobs.id
+            line_count INTEGER NOT NULL,
+            offsets BLOB NOT NULL           -- packed start offset of each line
+        );
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS blobs_fts USING fts5(
+            contents, content='blobs', content_rowid='id', tokenize='trigram'
+        );
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_fts_on_insert AFTER INSERT ON blobs
+        BEGIN
+            INSERT INTO blobs_fts (rowid, contents) VALUES (new.id, new.contents);
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_on_delete AFTER DELETE ON blobs
+        BEGIN
+            INSERT INTO blobs_fts (blobs_fts, rowid, contents) VALUES ('delete', old.id, old.contents);
+            DELETE FROM line_index WHERE blob_id = old.id;
+        END;
+    """)
+    conn.execute("INSERT INTO blobs_fts (blobs_fts) VALUES ('rebuild');")  # index existing blobs
+
+
+def _v7_compressed_blobs(conn):
+    """Compress blob contents, recording the codec used in blobs.codec.
+
+    codec is NULL for contents stored as they are; otherwise contents holds
+    independently compressed frames whose end offsets are packed in frames,
+    so reads can start anywhere (see 'blobcodec.py'). size stays the original
+    length. The full-text index now reads the original text through the
+    blob_texts view, which decompresses with the blob_text() SQL function.
+    """
+    conn.execute("ALTER TABLE blobs ADD COLUMN codec TEXT;")
+    conn.execute("ALTER TABLE blobs ADD COLUMN frames BLOB;")
+    for trigger in ("blobs_fts_on_insert", "blobs_on_delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    conn.execute("DROP TABLE IF EXISTS blobs_fts;")
+
+    for (blob_id,) in conn.execute("SELECT id FROM blobs;").fetchall():
+        contents = conn.execute("SELECT contents FROM blobs WHERE id = ?;", (blob_id,)).fetchone()[0]
+        name = conn.execute("SELECT name FROM files WHERE blob_id = ? LIMIT 1;", (blob_id,)).fetchone()
+        codec, stored, frames = blobcodec.compress(contents, name[0] if name else None)
+        if codec is not None:
+            conn.execute("UPDATE blobs SET codec = ?, frames = ?, contents = ? WHERE id = ?;",
+                         (codec, frames, stored, blob_id))
+
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS blob_texts (id, contents) AS
+        SELECT id, blob_text(codec, contents, frames) FROM blobs;
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS blobs_fts USING fts5(
+            contents, content='blob_texts', content_rowid='id', tokenize='trigram'
+        );
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_fts_on_insert AFTER INSERT ON blobs
+        BEGIN
+            INSERT INTO blobs_fts (rowid, contents) VALUES (new.id, blob_text(new.codec, new.contents, new.frames));
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS blobs_on_delete AFTER DELETE ON blobs
+        BEGIN
+            INSERT INTO blobs_fts (blobs_fts, rowid, contents)
+            VALUES ('delete', old.id, blob_text(old.codec, old.contents, old.frames));
+            DELETE FROM line_index WHERE blob_id = old.id;
+        END;
+    """)
+    conn.execute("INSERT INTO blobs_fts (blobs_fts) VALUES ('rebuild');")
+
+
+MIGRATIONS = [
+    _v1_pid_name_indexes,
+    _v2_blob_contents,
+    _v3_line_index,
+    _v4_full_text_search,
+    _v5_wc_columns,
+    _v6_content_addressed_blobs,
+    _v7_compressed_blobs,
+]
+
+
+def get_version(conn):
+    """Return the number of migrations applied to the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the database up to the latest schema version.
+
+    Each missing migration runs in its own transaction together with the
+    user_version bump, so an interrupted upgrade resumes where it stopped.
+    Returns the list of versions that were applied.
+    """
+    conn.execute("PRAGMA journal_mode = WAL")  # persistent, readers no longer block the writer
+    register_functions(conn)
+    applied = []
+    version = get_version(conn)
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        applied.append(number)
+
+    if applied:
+        conn.execute("ANALYZE")  # refresh planner statistics for the new indexes
+    return applied
+
+
+def create_schema(conn):
+    """Create the base tables and apply every migration."""
+    for table in TABLES:
+        conn.execute(table)
+    conn.commit()
+    return migrate(conn)
@@ -7,21 +7,112 @@ This file is about capturing the user input so that you can mimic shell behavior
 """
 
 
+import json
 import os
+import re
 import sys
-from time import sleep
-from fastapi import FastAPI, HTTPException
-from sqliteCRUD import SqliteCRUD # REVISIT THIS
+from collections import namedtuple
+import time
+from collections import deque
+from sqliteCRUD import SqliteCRUD, CHUNK_SIZE # REVISIT THIS
+from grepengine import compile_pattern
+from pipeline import (STAGES, close_lines, decode_chunks, grep_output, grep_stage, head_stage, line_count,
+                      sort_stage, tail_stage, text_lines, wc_files, wc_stage)
 import sqlite3
 import shutil
 import random
 import logging
+import threading
 
 from getch import Getch
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_TIMEOUT = (3.05, 30)  # seconds to connect, seconds to wait for each read
+HTTP_PARALLEL = 4  # keep-alive connections kept to the API, and independent calls sent at once
+TIMINGS_KEPT = 20  # recent command timings shown by a bare 'time'
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request sent through it."""
+
+    def __init__(self, timeout=HTTP_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class TimedSession(requests.Session):
+    """requests.Session that adds up the time spent in requests and how many were sent.
+
+    For a streamed response (cat, grep) the time runs until the headers are in;
+    reading the body is counted wherever it is read.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.api_seconds = 0.0
+        self.api_calls = 0
+        self._count_lock = threading.Lock()  # map_requests sends from several threads
+
+    def request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            with self._count_lock:
+                self.api_seconds += time.perf_counter() - start
+                self.api_calls += 1
+
+
+class ResponseChunks:
+    """Iterator of the decoded text chunks of a streamed response.
+
+    close() releases the response (and its pooled connection) whether or not
+    iteration has started, which a generator's finally cannot promise: a stage
+    closed before pulling its first chunk would leave the response open.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self._chunks = decode_chunks(response.iter_content(chunk_size=CHUNK_SIZE))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()  # the end of the body, or a failed read
+            raise
+
+    def close(self):
+        self._chunks.close()
+        self.response.close()
+
+
+def make_session():
+    """Return a requests.Session that keeps connections to the API alive and retries with backoff.
+
+    Failed connects are retried for every method. Reads that time out and 502/503/504
+    answers (503 is what the API sends when its database queue is full) are only
+    retried for GET and DELETE, since repeating a POST could apply a write twice.
+    """
+    retries = Retry(total=3, backoff_factor=0.1, status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({"GET", "HEAD", "DELETE"}), raise_on_status=False)
+    adapter = TimeoutHTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=HTTP_PARALLEL)
+    session = TimedSession()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-app = FastAPI()
-db = SqliteCRUD()
 
 # Core global functions #
 
@@ -87,11 +178,16 @@ def human_readable_size(size_in_bytes):
 class DbApi:
     def __init__(self):
         self.url = "http://localhost:8080"
+        self.session = make_session()  # one pooled, keep-alive connection set for every command
+        self.http_pool = ThreadPoolExecutor(max_workers=HTTP_PARALLEL)
         self.conn = SqliteCRUD("filesystem.db")
         self.current_pid = 1
         self.history_file = "command_history.txt"  # Path to history file
         self.history = self.load_history()
         self.history_index = len(self.history)  # Start at the end of the history
+        self.timings = deque(maxlen=TIMINGS_KEPT)  # per-stage timings of recent commands
+        self.server_pipelines = True  # run pipelines of cat/grep/head/tail/wc/sort on the API
+        self.pipeline_stages = None  # the API's stage timings for the last pipeline it ran
 
     def save_to_history(self, cmd):
         """Save the command to history and append it to the history file."""
@@ -105,6 +201,10 @@ class DbApi:
         for index, command in enumerate(self.history, start=1):
             print(f"{index}: {command}")
 
+    def run_history(self, cmd):
+        """Execute the history command."""
+        return self.show_history()
+
     def load_history(self):
         """Load history from file if it exists."""
         if os.path.exists(self.history_file):
@@ -119,28 +219,91 @@ class DbApi:
             os.remove(self.history_file)            
 
     
-    # def getId(self, name, pid=1):
-    #     """Retrieve the directory ID (pid) based on the directory name using sqliteCRUD."""
-    #     return self.conn.get_directory_id(name, pid)
-    
-    def getId(self, path, start_pid=1):
+    def resolve(self, path, start_pid=None):
+        """Resolve a path (absolute, relative, '..' or '~') with a single /resolve/ request.
+
+        Returns the API's {'id', 'pid', 'type', 'path'} dict, or None if the path does not exist.
         """
-        Retrieve the directory ID (pid) based on the full path.
-        The start_pid is the root directory or current directory to start searching from.
+        if start_pid is None:
+            start_pid = self.current_pid
+        response = self.session.get(f"{self.url}/resolve/", params={"path": path, "current_pid": start_pid})
+        if response.status_code != 200:
+            return None
+        target = response.json()
+        if target["type"] == "dir":
+            self.conn.path_cache.put_path(target["id"], target["path"])  # prompt rebuilds for free
+        return target
+
+    def _resolve_destination(self, src_name, dest_path):
+        """Work out (dest_pid, dest_name) for mv/cp, or None if the destination directory is missing.
+
+        An existing directory receives the source under its own name; otherwise the last
+        component is the new name inside the (resolved) parent directory.
         """
-        parts = path.strip('/').split('/')  # Split the path into parts (e.g., ['raj', 'cp_standalone.txt'])
-        
-        pid = start_pid  # Start with the root or current directory
-        for part in parts:
-            # Get the next directory's ID based on the current pid
-            result = self.conn.get_directory_id(part, pid)
-            if result is None:
-                return None  # Directory not found at this level
-            pid = result['id']  # Update the pid to the next level
+        dest = self.resolve(dest_path)
+        if dest is not None and dest["type"] == "dir":
+            return dest["id"], src_name  # Keep the original name when targeting a directory
+        if dest_path.endswith('/'):
+            print(f"Error: Destination directory {dest_path} not found.")
+            return None
+
+        dest_dir_name, _, dest_name = dest_path.rpartition('/')
+        if not dest_dir_name and not dest_path.startswith('/'):
+            return self.current_pid, dest_name  # Just a new name in the current directory
+        parent = self.resolve(dest_dir_name or '/')
+        if parent is None or parent["type"] != "dir":
+            print(f"Error: Destination directory {dest_dir_name} not found.")
+            return None
+        return parent["id"], dest_name
+
+    def map_requests(self, fn, items):
+        """Return [fn(item) for item in items], running the calls side by side.
+
+        For independent calls (one per file, say): each gets its own pooled
+        connection, so their round-trips overlap instead of adding up.
+        """
+        if len(items) < 2:
+            return [fn(item) for item in items]
+        return list(self.http_pool.map(fn, items))
+
+    def invalidate_paths(self):
+        """Drop cached paths after a command that changed the directory tree."""
+        self.conn.path_cache.invalidate()
+
+    def run_batch(self, operations, atomic=False):
+        """Send operations to /batch/ as one request (and one transaction); return the per-op results.
+
+        Paths in the operations are relative to the current directory. Returns
+        None, after printing the error, if the request itself failed.
+        """
+        response = self.session.post(f"{self.url}/batch/", json=operations,
+                                 params={"pid": self.current_pid, "oid": 1, "atomic": atomic})
+        if response.status_code != 200:
+            print(f"Error: {response.json().get('detail', 'Unknown error')}")
+            return None
+        self.invalidate_paths()
+        return response.json()["results"]
+
+    def _write_lines(self, lines, redirect=None, append=False):
+        """Print lines as they are produced, or write them to the redirect target.
+
+        This is where every pipeline ends: lines are pulled from the last stage
+        one at a time, so nothing is held here however long the output is.
+        """
+        if not redirect:
+            for line in lines:
+                print(line)
+            return
+        try:
+            with open(redirect, 'a' if append else 'w') as f:
+                for line in lines:
+                    f.write(line + "\n")
+        except IOError as e:
+            print(f"Error writing to file {redirect}: {e}")
+            return
+        print(f"Output successfully written to {redirect}")
 
-        return {'id': pid}  # Return the final directory ID
 
-    
     # ls command #
 
     def _format_permissions(item):
@@ -236,15 +399,6 @@ class DbApi:
             # By default, use the current directory (current_pid)
             pid = self.current_pid  
 
-            # If a directory name is passed, get its pid
-            if params:
-                dir_name = params[0]
-                result = self.getId(dir_name)
-                if result is None:
-                    print(f"Error: Directory '{dir_name}' not found.")
-                    return []
-                pid = result.get("id", self.current_pid)  # Update to new directory's pid if specified
-
             # Build the query parameters based on flags
             flags = cmd["flags"]
             query_params = {
@@ -253,8 +407,22 @@ class DbApi:
                 'h': '-h' in flags,
             }
 
+            # If a path is passed, resolve it in one round-trip
+            if params:
+                dir_name = params[0]
+                target = self.resolve(dir_name)
+                if target is None:
+                    print(f"Error: Directory '{dir_name}' not found.")
+                    return []
+                if target["type"] == "dir":
+                    pid = target["id"]
+                else:
+                    # A file lists just itself, from its parent directory
+                    pid = target["pid"]
+                    query_params['name'] = target["path"].rsplit('/', 1)[-1]
+
             # Send a request to the API to list the directory contents
-            response = requests.get(f"{self.url}/ls/{pid}", params=query_params)
+            response = self.session.get(f"{self.url}/ls/{pid}", params=query_params)
             if response.status_code == 200:
                 contents = response.json().get('contents', [])
             else:
@@ -393,20 +561,8 @@ class DbApi:
         return ".."
     
     def get_current_path(self):
-        """Reconstruct the current directory path based on current_pid."""
-        path_parts = []
-        pid = self.current_pid
-
-        while pid != 1:  # Continue until we reach the root directory
-            directory_info = self.conn.get_directory_info(pid)  # This should return the name and parent ID
-            if directory_info is None:
-                break  # Handle case where directory isn't found (e.g., deleted or invalid pid)
-            
-            path_parts.insert(0, directory_info['name'])  # Add directory name to the path
-            pid = directory_info['pid']  # Move up to the parent directory
-
-        # Join all parts to form the full path
-        return "/" + "/".join(path_parts) if path_parts else "/"
+        """Reconstruct the current directory path based on current_pid (cached per directory)."""
+        return self.conn.get_directory_path(self.current_pid)
 
     def run_cd(self, cmd):
         """Execute the cd command with support for ~, .., and directory names.
@@ -452,32 +608,15 @@ IMPLEMENTATION
         
         params = cmd["params"]
 
-        if not params or params[0] == "~":
-            self.current_pid = 1  # Home directory
-        elif params[0] == "..":
-            # Set to parent if not at root
-            # parent_directory = self.conn.get_parent_directory(self.current_pid)
-            # parent_directory = self.conn.get_parent_directory_pid(self.current_pid)
-            # self.current_pid = parent_directory['pid'] if parent_directory else self.current_pid
-            # Get the parent directory pid
-            # parent_pid = self.get_parent_directory_pid(self.current_pid)
-            # if parent_pid is not None:
-            #     self.current_pid = parent_pid
-            # else:
-            #     print("No parent directory exists.")  
-            # Get the parent directory pid
-            parent_pid = self.conn.get_parent_directory(self.current_pid)
-            # Update current_pid only if a parent directory exists
-            if parent_pid is not None:
-                self.current_pid = parent_pid
-            else:
-                print("No parent directory exists.")   
+        # Any path (/a/b, a/b, .., ~/a, ...) resolves in a single round-trip
+        target_dir = params[0] if params else "~"
+        target = self.resolve(target_dir)
+        if target is None:
+            print(f"cd: {target_dir}: No such file or directory")
+        elif target["type"] != "dir":
+            print(f"cd: {target_dir}: Not a directory")
         else:
-            # Change to specified directory
-            target_dir = params[0]
-            response = requests.get(f"{self.url}/cd/?dir={target_dir}&current_pid={self.current_pid}")
-            if response.status_code == 200:
-                self.current_pid = response.json().get("new_pid")
+            self.current_pid = target["id"]
 
         # Update the prompt with the new path
         update_prompt(self.get_current_path())
@@ -525,49 +664,105 @@ SEE ALSO
        or available locally via: info '(coreutils) cat invocation'
 
 GNU coreutils 8.32                                         February 2024                                                     CAT(1)"""
+        if previous_output is not None:
+            return self._write_lines(previous_output, redirect, append)
         params = cmd["params"]
+        if not params:
+            print("Error: No file specified.")
+            return
 
-        if previous_output:
-            file_contents = "\n".join(previous_output)
-            print(f"Processing piped input in 'cat': {file_contents}")
-        else:
-            if not params:
-                print("Error: No file specified.")
-                return []
-
-            all_contents = []
+        # Write straight to the redirect target or the terminal as chunks arrive
+        sink = None
+        if redirect:
+            try:
+                sink = open(redirect, 'a' if append else 'w')
+            except IOError as e:
+                print(f"Error writing to file {redirect}: {e}")
+                return
+        out = sink or sys.stdout
 
-            # Loop through each file in params
-            for file_name in params:
-                print(f"Fetching contents of file: {file_name} in directory with pid: {self.current_pid}")
+        try:
+            # Loop through each file in params, with a newline between each
+            for i, file_name in enumerate(params):
+                chunks = self.stream_file(file_name)
+                if chunks is None:
+                    return
+                if i:
+                    out.write("\n")
+                try:
+                    for text in chunks:
+                        out.write(text)
+                finally:
+                    chunks.close()
+        finally:
+            if sink:
+                sink.close()
 
-                response = requests.get(f"{self.url}/cat/?file_name={file_name}&pid={self.current_pid}")
-                if response.status_code == 200:
-                    file_contents = response.json().get("contents", "")
-                    all_contents.append(file_contents)
-                else:
-                    print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                    return []
+        if redirect:
+            print(f"Output successfully written to {redirect}")
+            return
+        out.write("\n")
+        out.flush()
 
-            # Join contents of all files with a newline between each
-            combined_contents = "\n".join(all_contents)
+    def pipe_cat(self, cmd, lines=None):
+        """Yield cat's output one line at a time: the piped lines, or each file's as it arrives.
 
-        # Handle redirection if applicable
-        if redirect:
-            mode = 'a' if append else 'w'
+        Only one chunk of a file is held at a time. If a later stage stops
+        early, closing this generator closes the HTTP response, so the rest of
+        the file is never downloaded.
+        """
+        if lines is not None:
+            yield from lines
+            return
+        if not cmd["params"]:
+            print("Error: No file specified.")
+            return
+        for file_name in cmd["params"]:
+            chunks = self.stream_file(file_name)
+            if chunks is None:
+                return
             try:
-                with open(redirect, mode) as f:
-                    f.write(combined_contents)
-                print(f"Output successfully written to {redirect}")
-            except IOError as e:
-                print(f"Error writing to file {redirect}: {e}")
-            return []
-        else:
-            # Print the concatenated file contents
-            print(combined_contents)
-            return combined_contents.splitlines()
+                yield from text_lines(chunks)
+            finally:
+                chunks.close()
+
+    def stream_file(self, file_name):
+        """Open a streaming /cat/ request for a file in the current directory.
+
+        Returns an iterator of decoded text chunks, or None (after printing the
+        error) if the file cannot be read.
+        """
+        response = self.session.get(f"{self.url}/cat/", params={"file_name": file_name, "pid": self.current_pid}, stream=True)
+        if response.status_code != 200:
+            print(f"Error: {response.json().get('detail', 'Unknown error')}")
+            response.close()
+            return None
+        return ResponseChunks(response)
 
 
+    def pipe_server(self, sub_cmds):
+        """Yield the output of a whole pipeline run by the API's /pipeline/, next to the database.
+
+        Only the last stage's output is sent back, in batches of lines; the
+        stage timings that end the response are kept in pipeline_stages.
+        """
+        stages = [{key: sub_cmd[key] for key in ("cmd", "flags", "params")} for sub_cmd in sub_cmds]
+        response = self.session.post(f"{self.url}/pipeline/", params={"pid": self.current_pid}, json=stages, stream=True)
+        with response:
+            if response.status_code != 200:
+                print(f"Error: {response.json().get('detail', 'Unknown error')}")
+                return
+            for record in response.iter_lines():
+                if not record:
+                    continue
+                record = json.loads(record)
+                if "error" in record:
+                    print(f"Error: {record['error']}")
+                    return
+                if "stages" in record:
+                    self.pipeline_stages = record["stages"]
+                yield from record.get("lines", [])
+
     # sort command #        
     
     def run_sort(self, cmd, previous_output=None, redirect=None, append=False):
@@ -621,54 +816,32 @@ SEE ALSO
        or available locally via: info '(coreutils) sort invocation'
 
 GNU coreutils 8.32                                         February 2024                                                    SORT(1) """
-        params = cmd["params"]
-
-        # Check if we are sorting piped input
-        if previous_output:
-            # print("Sorting piped input")  # Debugging
-            # Sort the piped input
-            sorted_contents = sorted(previous_output)
-        else:
-            # If no piped input, sort the contents of a file as usual
-            if not params:
-                print("Error: No file specified.")
-                return []
-            
-            # The first parameter should be the file name
-            file_name = params[0]
-            # print(f"Sorting contents of file: {file_name} in directory with pid: {self.current_pid}")  # Debugging
+        return self._write_lines(self.pipe_sort(cmd, previous_output), redirect, append)
 
-            # Send the request to the API to fetch and sort file contents
-            response = requests.get(f"{self.url}/sort/?file_name={file_name}&pid={self.current_pid}")
-            
-            # Print debugging info
-            # print(f"API Request sent to: /sort/?file_name={file_name}&pid={self.current_pid}")
-            # print(f"API Response Status Code: {response.status_code}, Response: {response.json()}")
+    def pipe_sort(self, cmd, lines=None):
+        """Yield the sorted lines of piped input or of a file.
 
-            if response.status_code == 200:
-                sorted_contents = response.json().get("sorted_contents", [])
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
+        Sorting has to see every line before it can yield the first, so this
+        is the one stage that holds all of its input.
+        """
+        if lines is not None:
+            yield from sort_stage(lines)
+            return
+        params = cmd["params"]
+        if not params:
+            print("Error: No file specified.")
+            return
 
-        # Handle redirection if applicable
-        if redirect:
-            mode = 'a' if append else 'w'
-            try:
-                with open(redirect, mode) as f:
-                    f.write("\n".join(sorted_contents) + "\n")
-                print(f"Sorted output successfully written to {redirect}")
-            except IOError as e:
-                print(f"Error writing to file {redirect}: {e}")
-            return []  # No output to console when redirecting
-        else:
-            # If no redirection, print the sorted contents or piped input to the console
-            print("\n".join(sorted_contents))
-            return sorted_contents  # Return the sorted contents for further piping
+        # The API sorts the file's contents for us
+        response = self.session.get(f"{self.url}/sort/", params={"file_name": params[0], "pid": self.current_pid})
+        if response.status_code != 200:
+            print(f"Error: {response.json().get('detail', 'Unknown error')}")
+            return
+        yield from response.json().get("sorted_contents", [])
     
     # wc with w flag command #        
             
-    def run_wc_w(self, cmd, previous_output=None):
+    def run_wc_w(self, cmd, previous_output=None, redirect=None, append=False):
         """Execute the wc -w command to count words.
         
         Manual:
@@ -711,71 +884,47 @@ SEE ALSO
        or available locally via: info '(coreutils) wc invocation'
 
 GNU coreutils 8.32                                         February 2024                                                      WC(1)"""
-        if previous_output:
-            # Count the words in the piped input
-            word_count = sum(len(line.split()) for line in previous_output)
-            print(f"Word count from piped input: {word_count}")
-            return [str(word_count)]  # Return the result as a list for further piping
-        else:
-            # Handle the case when there's no previous output (file input)
-            params = cmd["params"]
-            if len(params) < 1:
-                print("Error: wc requires a file or input")
-                return []
-            
-            file_name = params[0]
-            try:
-                with open(file_name, 'r') as f:
-                    content = f.read()
-                    word_count = len(content.split())
-            except IOError as e:
-                print(f"Error reading file {file_name}: {e}")
-                return []
+        return self._write_lines(self.pipe_wc(cmd, previous_output), redirect, append)
 
-            print(f"Word count from file: {word_count}")
-            return [str(word_count)]
 
+    def _wc_counts(self, path, endpoint):
+        """Fetch a file's stored counts from /wc/ or /wc_w/, or print an error and return None."""
+        target = self.resolve(path)
+        if target is None or target["type"] != "file":
+            print(f"wc: {path}: No such file")
+            return None
+        response = self.session.get(f"{self.url}/{endpoint}/",
+                                params={"file_name": target["path"].rsplit('/', 1)[-1], "pid": target["pid"]})
+        if response.status_code != 200:
+            print(f"Error: {response.json().get('detail', 'Unknown error')}")
+            return None
+        return response.json()
 
     #### wc
 
     def run_wc(self, cmd, previous_output=None, redirect=None, append=False):
-        # Perform word, line, and character count
-        if previous_output:
-            # Process piped input
-            line_count = len(previous_output)
-            word_count = sum(len(line.split()) for line in previous_output)
-            char_count = sum(len(line) for line in previous_output)
-        else:
-            # Handle file input
-            params = cmd["params"]
-            if len(params) < 1:
-                print("Error: wc requires a file or input")
-                return []
-            
-            file_name = params[0]
-            try:
-                with open(file_name, 'r') as f:
-                    content = f.readlines()
-                    line_count = len(content)
-                    word_count = sum(len(line.split()) for line in content)
-                    char_count = sum(len(line) for line in content)
-            except IOError as e:
-                print(f"Error reading file {file_name}: {e}")
-                return []
-
-        # Prepare output as a single string
-        output = f"Line count: {line_count}, Word count: {word_count}, Character count: {char_count}\n"
+        # wc -w only counts words
+        if "-w" in cmd["flags"]:
+            return self.run_wc_w(cmd, previous_output, redirect, append)
+        return self._write_lines(self.pipe_wc(cmd, previous_output), redirect, append)
+
+    def pipe_wc(self, cmd, lines=None):
+        """Yield wc's counts for piped input, counted in one pass, or for the files named."""
+        words_only = "-w" in cmd["flags"]
+        if lines is not None:
+            yield from wc_stage(lines, words_only)
+            return
 
-        # Handle redirection if specified
-        if redirect:
-            mode = 'a' if append else 'w'
-            with open(redirect, mode) as f:
-                f.write(output)
-            return []  # Return an empty list since output was redirected
-        else:
-            # No redirection, so print to terminal and return for piping
-            print(output.strip())
-            return [output.strip()]
+        params = cmd["params"]
+        if len(params) < 1:
+            print("Error: wc requires a file or input")
+            return
+        if words_only:
+            params = params[:1]
+        # Several files are looked up side by side, each on its own connection
+        results = self.map_requests(lambda path: self._wc_counts(path, "wc_w" if words_only else "wc"), params)
+        found = [(path, counts) for path, counts in zip(params, results) if counts is not None]
+        yield from wc_files(found, words_only, several=len(params) > 1)
 
 
 
@@ -1050,87 +1199,69 @@ SEE ALSO
 
 GNU grep 3.7                                                 2019-12-29                                                     GREP(1)
         """
-        params = cmd["params"]
+        return self._write_lines(self.pipe_grep(cmd, previous_output, highlight=not redirect), redirect, append)
 
-        # Debugging: Print the parsed command
-        # print(f"Running grep command with params: {params}")
-        
+    def pipe_grep(self, cmd, lines=None, highlight=False):
+        """Yield grep's output lines for piped input or for the files named.
+
+        Piped input goes through grep_stage(); files are searched by the API.
+        With highlight, matches are shown in red.
+        """
+        params = cmd["params"]
         if len(params) < 1:
             print("Error: grep requires at least a pattern")
-            return []
-        
+            return
+
         pattern = params[0]
-        
-        if previous_output:
-            # If previous_output is provided (piped input), search in that data
-            # print(f"Searching for pattern: {pattern} in piped input")
-            matched_lines = [line for line in previous_output if pattern in line]
+        letters = set("".join(flag.lstrip('-') for flag in cmd["flags"]))  # -rn and -r -n alike
+        try:
+            regex = compile_pattern(pattern, 'F' in letters, 'i' in letters)
+        except re.error as e:
+            print(f"grep: invalid pattern: {e}")
+            return
+        mark = None
+        if highlight and not letters & set('vcl'):
+            mark = lambda line: regex.sub(lambda m: f"{RED}{m.group(0)}{RESET}", line)
 
-            if redirect:
-                # Handle redirection if present
-                mode = 'a' if append else 'w'
-                try:
-                    with open(redirect, mode) as f:
-                        for line in matched_lines:
-                            f.write(line + "\n")
-                    print(f"Output successfully written to {redirect}")
-                except IOError as e:
-                    print(f"Error writing to file {redirect}: {e}")
-            else:
-                # No redirection, print the matched lines to the console
-                # for line in matched_lines:
-                #     print(line)
-                for line in matched_lines:
-                    # Highlight all occurrences of the pattern in red
-                    highlighted_line = line.replace(pattern, f"{RED}{pattern}{RESET}")
-                    print(highlighted_line)
+        if lines is not None:
+            yield from grep_stage(lines, regex, letters, mark)
+            return
 
-            return matched_lines  # Return the matched lines for further piping
+        targets = params[1:] or (['.'] if 'r' in letters else [])
+        if not targets:
+            print("Error: grep requires a pattern and a file")
+            return
+        show_path = 'r' in letters or len(targets) > 1
+        query = {flag: True for flag in "Fivclr" if flag in letters}
+
+        for target in targets:
+            response = self.session.get(f"{self.url}/grep/", stream=True,
+                                    params={"pattern": pattern, "path": target, "current_pid": self.current_pid, **query})
+            with response:
+                if response.status_code != 200:
+                    print(f"grep: {response.json().get('detail', 'Unknown error')}")
+                    continue
+                # One JSON record per file, passed on as soon as the API has scanned it
+                for record in response.iter_lines():
+                    if record:
+                        yield from grep_output(json.loads(record), letters, show_path, mark)
 
-        else:
-            # If no previous_output (piping), assume input comes from a file
-            if len(params) < 2:
-                print("Error: grep requires a pattern and a file")
-                return []
-            
-            file_name = params[1]
-            # print(f"Searching for pattern: {pattern} in file: {file_name}")
-            
-            # Build the query parameters based on flags
-            flags = cmd["flags"]
-            query_params = {
-                'l': '-l' in flags,
-            }
+    # rm command #
 
-            # Send a request to the API to grep the file
-            response = requests.get(f"{self.url}/grep/?pattern={pattern}&file_name={file_name}", params=query_params)
-            
-            if response.status_code == 200:
-                matched_lines = response.json().get('matched_lines', [])
-                
-                if redirect:
-                    mode = 'a' if append else 'w'
-                    try:
-                        with open(redirect, mode) as f:
-                            for line in matched_lines:
-                                f.write(line + "\n")
-                        print(f"Output successfully written to {redirect}")
-                    except IOError as e:
-                        print(f"Error writing to file {redirect}: {e}")
-                else:
-                    for line in matched_lines:
-                        # Highlight all occurrences of the pattern in red
-                        highlighted_line = line.replace(pattern, f"{RED}{pattern}{RESET}")
-                        print(highlighted_line)
-                
-                return matched_lines  # Return matched lines for further piping
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
+    def batch_rm(self, cmd, lines=None):
+        """Return the (target, operation) pairs rm sends to /batch/; each target is removed (or fails) on its own."""
+        params = cmd["params"]
+        flags = cmd["flags"]
 
-    # rm command #
+        if not params:
+            print("Error: No file or directory specified for removal.")
+            return []
+
+        recursive = "-r" in flags or "-R" in flags
+        force = "-f" in flags
+        return [(target, {"op": "rm", "path": target, "recursive": recursive, "force": force}) for target in params]
 
-    def run_rm(self, cmd):
+    def run_rm(self, cmd, done):
         """Execute the rm command with optional flags -r (recursive) and -f (force).
         
         Manual:
@@ -1185,39 +1316,30 @@ SEE ALSO
 
 GNU coreutils 8.32                                         February 2024                                                      RM(1) 
         """
-        params = cmd["params"]
-        flags = cmd["flags"]
+        recursive = "-r" in cmd["flags"] or "-R" in cmd["flags"]
+        for target, removed in done:
+            if not removed["ok"]:
+                print(f"Error: {removed['error']}")
+            elif recursive and removed.get("directories"):
+                print(f"Successfully removed {target} ({removed['files']} files, {removed['directories']} directories).")
+            elif removed.get("files") or removed.get("directories"):
+                print(f"Successfully removed {target}.")
 
-        if not params:
-            print("Error: No file or directory specified for removal.")
-            return
 
-        target = params[0]
-        recursive = "-r" in flags
-        force = "-f" in flags
-
-        # Build the API request parameters
-        query_params = {
-            'recursive': recursive,
-            'force': force,
-            'target': target
-        }
-
-        # Send the request to the API
-        response = requests.delete(f"{self.url}/rm/", params=query_params)
-        # print(f"API Request sent to: /rm/?target={target}&recursive={recursive}&force={force}")  # Debugging
-        # print(f"API Response Status Code: {response.status_code}, Response: {response.json()}")  # Debugging
+    # mkdir command #
 
-        # Handle the response from the API
-        if response.status_code == 200:
-            print(f"Successfully removed {target}.")
-        else:
-            print(f"Error: {response.json().get('detail', 'Unknown error')}")    
+    def batch_mkdir(self, cmd, lines=None):
+        """Return the (directory, operation) pairs mkdir sends to /batch/; with -p missing parents are made too."""
+        params = cmd["params"]
 
+        if not params:
+            print("Error: No directory name specified.")
+            return []
 
-    # mkdir command #
+        parents = '-p' in cmd["flags"]
+        return [(dir_name, {"op": "mkdir", "path": dir_name, "parents": parents}) for dir_name in params]
 
-    def run_mkdir(self, cmd):
+    def run_mkdir(self, cmd, done):
         """Execute the mkdir command to create a directory.
         
         Manual:
@@ -1257,36 +1379,14 @@ SEE ALSO
 
 GNU coreutils 8.32                                         February 2024                                                   MKDIR(1) 
         """
-        params = cmd["params"]
-        flags = cmd["flags"]
-
-        if not params:
-            print("Error: No directory name specified.")
-            return
-
-        dir_name = params[0]
-        parent_pid = self.current_pid
-
-        if '-p' in flags:
-            parts = dir_name.split('/')
-            for part in parts:
-                if part:
-                    response = requests.post(f"{self.url}/mkdir/?name={part}&pid={parent_pid}&oid=1")
-                    if response.status_code == 200:
-                        parent_pid = response.json().get("directory_id")
-                    else:
-                        print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                        return
-            print(f"Created directory {dir_name} with parent directories.")
-        else:
-            # print(f"{self.url}/mkdir/", {"name": dir_name, "pid": parent_pid, "oid": 1})
-            obj ={"name": dir_name, "pid": parent_pid, "oid": 1}
-            print(obj)
-            response = requests.post(f"{self.url}/mkdir/?name={dir_name}&pid={parent_pid}&oid=1")
-            if response.status_code == 200:
-                print(f"Created directory {dir_name}")
+        parents = '-p' in cmd["flags"]
+        for dir_name, created in done:
+            if not created["ok"]:
+                print(f"Error: {created['error']}")
+            elif parents:
+                print(f"Created directory {dir_name} with parent directories.")
             else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
+                print(f"Created directory {dir_name}")
 
     # pwd command #
 
@@ -1375,46 +1475,26 @@ GNU coreutils 8.32                                         February 2024
             print("Error: Source and destination must be specified.")
             return
 
-        src_file = params[0]
+        src_path = params[0]
         dest_path = params[1]
 
-        # Validate source file existence using list_directory
-        directory_contents = self.conn.list_directory(self.current_pid)
-        files_in_current_dir = [f[0] for f in directory_contents]
-        if src_file not in files_in_current_dir:
-            print(f"Error: Source file {src_file} not found in the source directory.")
+        # Validate that the source exists and is a file
+        src = self.resolve(src_path)
+        if src is None or src["type"] != "file":
+            print(f"Error: Source file {src_path} not found in the source directory.")
             return
+        src_file = src["path"].rsplit('/', 1)[-1]
 
-        # Handle if the destination is a directory or a file
-        if dest_path.endswith('/') or any(f[0] == dest_path and f[1] == 'dir' for f in directory_contents):
-            # Destination is a directory, get the directory's ID
-            dest_dir_name = dest_path.rstrip('/')
-            dest_info = self.getId(dest_dir_name, self.current_pid)  # Get directory info from the database
-            if not dest_info:
-                print(f"Error: Destination directory {dest_dir_name} not found.")
-                return
-            dest_pid = dest_info.get("id")
-            dest_name = src_file  # Keep the original file name when moving to a directory
-        else:
-            # Split the destination path into directory and file name
-            dest_parts = dest_path.rsplit('/', 1)
-            if len(dest_parts) == 2:
-                # Move and rename
-                dest_dir_name, dest_name = dest_parts
-                dest_info = self.getId(dest_dir_name, self.current_pid)  # Get the directory info
-                if not dest_info:
-                    print(f"Error: Destination directory {dest_dir_name} not found.")
-                    return
-                dest_pid = dest_info.get("id")
-            else:
-                # Just rename the file in the current directory
-                dest_pid = self.current_pid
-                dest_name = dest_path
+        destination = self._resolve_destination(src_file, dest_path)
+        if destination is None:
+            return
+        dest_pid, dest_name = destination
 
         # Send a request to the API to move or rename the file
-        response = requests.post(f"{self.url}/mv/?file_name={src_file}&src_pid={self.current_pid}&dest_pid={dest_pid}&dest_name={dest_name}")
+        response = self.session.post(f"{self.url}/mv/?file_name={src_file}&src_pid={src['pid']}&dest_pid={dest_pid}&dest_name={dest_name}")
         if response.status_code == 200:
-            print(f"Moved {src_file} to {dest_path}")
+            self.invalidate_paths()
+            print(f"Moved {src_path} to {dest_path}")
         else:
             print(f"Error: {response.json().get('detail', 'Unknown error')}")
 
@@ -1508,41 +1588,19 @@ COLOPHON         top
                         Version 643: 20 Jul 2023                 LESS(1)
 """
         params = cmd["params"]
+        page_size = shutil.get_terminal_size((80, 20)).lines - 1
 
         if previous_output:
             lines = previous_output[::-1]
+            pages = (lines[i:i + page_size] for i in range(0, len(lines), page_size))
         else:
             if not params:
                 print("Error: No file specified.")
                 return []
+            # Pages are fetched from the end of the file as the user scrolls
+            pages = self._fetch_pages(params[0], page_size, from_end=True)
 
-            file_name = params[0]
-            response = requests.get(f"{self.url}/cat/?file_name={file_name}&pid={self.current_pid}")
-            if response.status_code == 200:
-                lines = response.json().get("contents").splitlines()[::-1]
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
-
-        terminal_size = shutil.get_terminal_size((80, 20))
-        page_size = terminal_size.lines - 1
-
-        for i in range(0, len(lines), page_size):
-            output = "\n".join(lines[i:i + page_size])
-            if redirect:
-                mode = 'a' if append else 'w'
-                try:
-                    with open(redirect, mode) as f:
-                        f.write(output)
-                    print(f"Output successfully written to {redirect}")
-                except IOError as e:
-                    print(f"Error writing to file {redirect}: {e}")
-                return []
-            else:
-                print(output)
-                if i + page_size < len(lines):
-                    input("Press Enter to continue...")
-        return lines[::-1]
+        return self._show_pages(pages, redirect, append)[::-1]
         
     # more command #
 
@@ -1610,41 +1668,67 @@ AVAILABILITY         top
 util-linux 2.39.594-1e0ad      2023-07-19                        MORE(1)
 """
         params = cmd["params"]
+        page_size = shutil.get_terminal_size((80, 20)).lines - 1
 
         if previous_output:
             lines = previous_output
+            pages = (lines[i:i + page_size] for i in range(0, len(lines), page_size))
         else:
             if not params:
                 print("Error: No file specified.")
                 return []
+            # Pages are fetched one screen at a time as the user scrolls
+            pages = self._fetch_pages(params[0], page_size)
 
-            file_name = params[0]
-            response = requests.get(f"{self.url}/cat/?file_name={file_name}&pid={self.current_pid}")
-            if response.status_code == 200:
-                lines = response.json().get("contents").splitlines()
+        return self._show_pages(pages, redirect, append)
+
+    def _fetch_pages(self, file_name, page_size, from_end=False):
+        """Lazily yield pages of a file's lines, one API request per page.
+
+        Pages come from /lines/ top down, or from /tail/ bottom up (each page
+        reversed) when from_end is set, so only the lines shown cross the wire.
+        """
+        fetched = 0
+        while True:
+            if from_end:
+                response = self.session.get(f"{self.url}/tail/", params={"file_name": file_name, "pid": self.current_pid, "n": page_size, "skip": fetched})
             else:
+                response = self.session.get(f"{self.url}/lines/", params={"file_name": file_name, "pid": self.current_pid, "offset": fetched, "limit": page_size})
+            if response.status_code != 200:
                 print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
+                return
+
+            page = response.json()["lines"]
+            if page:
+                yield page[::-1] if from_end else page
+            fetched += len(page)
+            if len(page) < page_size or (not from_end and response.json()["eof"]):
+                return
 
-        terminal_size = shutil.get_terminal_size((80, 20))
-        page_size = terminal_size.lines - 1
+    def _show_pages(self, pages, redirect=None, append=False):
+        """Print pages one screen at a time, or write them all to the redirect target.
 
-        for i in range(0, len(lines), page_size):
-            output = "\n".join(lines[i:i + page_size])
-            if redirect:
-                mode = 'a' if append else 'w'
-                try:
-                    with open(redirect, mode) as f:
-                        f.write(output)
-                    print(f"Output successfully written to {redirect}")
-                except IOError as e:
-                    print(f"Error writing to file {redirect}: {e}")
-                return []
-            else:
-                print(output)
-                if i + page_size < len(lines):
-                    input("Press Enter to continue...")
-        return lines
+        Returns the lines that were shown, for piping.
+        """
+        if redirect:
+            mode = 'a' if append else 'w'
+            try:
+                with open(redirect, mode) as f:
+                    for page in pages:
+                        f.write("\n".join(page) + "\n")
+                print(f"Output successfully written to {redirect}")
+            except IOError as e:
+                print(f"Error writing to file {redirect}: {e}")
+            return []
+
+        shown = []
+        for page in pages:
+            # The next page is already fetched here, so we never prompt for nothing
+            if shown:
+                input("Press Enter to continue...")
+            print("\n".join(page))
+            shown.extend(page)
+        return shown
         
     # head command #
 
@@ -1688,46 +1772,34 @@ SEE ALSO
        or available locally via: info '(coreutils) head invocation'
 
 GNU coreutils 8.32                                         February 2024                                                    HEAD(1)  """
-        params = cmd["params"]
-        flags = cmd["flags"]
+        return self._write_lines(self.pipe_head(cmd, previous_output), redirect, append)
 
-        if previous_output:
-            lines = previous_output
-        else:
-            if not params:
-                print("Error: No file specified.")
-                return []
+    def pipe_head(self, cmd, lines=None):
+        """Yield the first lines of piped input or of a file.
 
-            file_name = params[0]
-            response = requests.get(f"{self.url}/cat/?file_name={file_name}&pid={self.current_pid}")
-            if response.status_code == 200:
-                lines = response.json().get("contents").splitlines()
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
-
-        num_lines = 10  # Default number of lines
-        if '-n' in flags:
-            try:
-                num_lines = int(params[1])
-            except (IndexError, ValueError):
-                print("Error: Invalid number of lines specified.")
-                return []
-
-        output = "\n".join(lines[:num_lines])
+        Piped input is read only as far as needed and then closed, so the
+        stages feeding it stop, and cancel their downloads, right away.
+        """
+        try:
+            num_lines = line_count(cmd, lines is not None)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if lines is not None:
+            yield from head_stage(lines, num_lines)
+            return
+        yield from self._fetch_lines("head", cmd, num_lines)
 
-        if redirect:
-            mode = 'a' if append else 'w'
-            try:
-                with open(redirect, mode) as f:
-                    f.write(output)
-                print(f"Output successfully written to {redirect}")
-            except IOError as e:
-                print(f"Error writing to file {redirect}: {e}")
+    def _fetch_lines(self, endpoint, cmd, num_lines):
+        """Return the lines /head/ or /tail/ sends for the file named in cmd; only those cross the wire."""
+        if not cmd["params"]:
+            print("Error: No file specified.")
             return []
-        else:
-            print(output)
-            return output.splitlines()
+        response = self.session.get(f"{self.url}/{endpoint}/", params={"file_name": cmd["params"][0], "pid": self.current_pid, "n": num_lines})
+        if response.status_code != 200:
+            print(f"Error: {response.json().get('detail', 'Unknown error')}")
+            return []
+        return response.json().get("lines", [])
         
     # tail command #
 
@@ -1771,46 +1843,19 @@ SEE ALSO
        or available locally via: info '(coreutils) tail invocation'
 
 GNU coreutils 8.32                                         February 2024                                                    TAIL(1)"""
-        params = cmd["params"]
-        flags = cmd["flags"]
-
-        if previous_output:
-            lines = previous_output
-        else:
-            if not params:
-                print("Error: No file specified.")
-                return []
+        return self._write_lines(self.pipe_tail(cmd, previous_output), redirect, append)
 
-            file_name = params[0]
-            response = requests.get(f"{self.url}/cat/?file_name={file_name}&pid={self.current_pid}")
-            if response.status_code == 200:
-                lines = response.json().get("contents").splitlines()
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
-
-        num_lines = 10  # Default number of lines
-        if '-n' in flags:
-            try:
-                num_lines = int(params[1])
-            except (IndexError, ValueError):
-                print("Error: Invalid number of lines specified.")
-                return []
-
-        output = "\n".join(lines[-num_lines:])
-
-        if redirect:
-            mode = 'a' if append else 'w'
-            try:
-                with open(redirect, mode) as f:
-                    f.write(output)
-                print(f"Output successfully written to {redirect}")
-            except IOError as e:
-                print(f"Error writing to file {redirect}: {e}")
-            return []
-        else:
-            print(output)
-            return output.splitlines()
+    def pipe_tail(self, cmd, lines=None):
+        """Yield the last lines of piped input or of a file; only that many are held at a time."""
+        try:
+            num_lines = line_count(cmd, lines is not None)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if lines is not None:
+            yield from tail_stage(lines, num_lines)
+            return
+        yield from self._fetch_lines("tail", cmd, num_lines)
 
     # chmod command #     
     
@@ -1926,16 +1971,16 @@ GNU coreutils 8.32                                         February 2024
             return
 
         # Determine if the target is a file or directory by calling a helper API endpoint or checking the database
-        response = requests.get(f"{self.url}/is_dir_or_file/?file_name={file_name}&pid={self.current_pid}")
+        response = self.session.get(f"{self.url}/is_dir_or_file/?file_name={file_name}&pid={self.current_pid}")
         if response.status_code == 200:
             target_type = response.json().get("type")
 
             if target_type == "file":
                 # Apply chmod to a file
-                response = requests.post(f"{self.url}/chmod/?file_name={file_name}&pid={self.current_pid}&target=file", json=perm_dict)
+                response = self.session.post(f"{self.url}/chmod/?file_name={file_name}&pid={self.current_pid}&target=file", json=perm_dict)
             elif target_type == "directory":
                 # Apply chmod to a directory
-                response = requests.post(f"{self.url}/chmod/?file_name={file_name}&pid={self.current_pid}&target=directory", json=perm_dict)
+                response = self.session.post(f"{self.url}/chmod/?file_name={file_name}&pid={self.current_pid}&target=directory", json=perm_dict)
 
             if response.status_code == 200:
                 print(f"Permissions updated for {file_name}")
@@ -2017,38 +2062,32 @@ GNU coreutils 8.32                                         February 2024
             print("Error: Source and destination must be specified.")
             return
 
-        src_name = params[0]
+        src_path = params[0]
         dest_path = params[1]
 
-        # Check if the destination is a directory path or a file path
-        if dest_path.endswith('/'):
-            # Destination is a directory, get the destination directory's ID
-            dest_info = self.getId(dest_path.rstrip('/'))  # Get directory info from the database
-            if not dest_info:
-                print(f"Error: Destination directory {dest_path} not found.")
-                return
-            dest_pid = dest_info.get("id")
-            dest_name = src_name  # Keep the original file name when copying to a directory
-        else:
-            # Split the destination into directory and file name
-            dest_parts = dest_path.rsplit('/', 1)
-            if len(dest_parts) == 2:
-                # A directory path and file name are specified
-                dest_dir_name, dest_name = dest_parts
-                dest_info = self.getId(dest_dir_name)  # Get directory info from the database
-                if not dest_info:
-                    print(f"Error: Destination directory {dest_dir_name} not found.")
-                    return
-                dest_pid = dest_info.get("id")
-            else:
-                # No directory path specified, use current directory
-                dest_pid = self.current_pid
-                dest_name = dest_path
+        # Resolve the source (file or directory) and the destination in one round-trip each
+        src = self.resolve(src_path)
+        if src is None:
+            print(f"Error: Source {src_path} not found.")
+            return
+        src_name = src["path"].rsplit('/', 1)[-1]
+
+        destination = self._resolve_destination(src_name, dest_path)
+        if destination is None:
+            return
+        dest_pid, dest_name = destination
 
-        # Send a request to the API to copy the file
-        response = requests.post(f"{self.url}/cp/?file_name={src_name}&src_pid={self.current_pid}&dest_pid={dest_pid}&dest_name={dest_name}")
+        # Send a request to the API to copy the file (or, with -r, the whole directory tree)
+        recursive = "-r" in cmd["flags"] or "-R" in cmd["flags"]
+        response = self.session.post(f"{self.url}/cp/", params={"file_name": src_name, "src_pid": src["pid"], "dest_pid": dest_pid,
+                                                            "dest_name": dest_name, "recursive": recursive})
         if response.status_code == 200:
-            print(f"Copied {src_name} to {dest_path}")
+            self.invalidate_paths()
+            copied = response.json()
+            if copied.get("directories"):
+                print(f"Copied {src_path} to {dest_path} ({copied['files']} files, {copied['directories']} directories)")
+            else:
+                print(f"Copied {src_path} to {dest_path}")
         else:
             print(f"Error: {response.json().get('detail', 'Unknown error')}")
 
@@ -2056,6 +2095,60 @@ GNU coreutils 8.32                                         February 2024
 
 
     # !x command #
+    # time builtin #
+
+    def run_line(self, line):
+        """Parse and run one command line, recording how long each stage took.
+
+        'time <cmd>' runs cmd and prints its timings; a bare 'time' shows the
+        timings of the last TIMINGS_KEPT commands. The API time is spent inside
+        requests, render is everything else after parsing. For a pipeline run
+        on the API, 'time' also prints how long each of its stages took there.
+        """
+        words = line.strip().split(" ", 1)
+        if words[0] == "time":
+            if len(words) == 1 or not words[1].strip():
+                self.show_timings()
+                return None
+            line = words[1].strip()
+
+        start = time.perf_counter()
+        api_seconds, api_calls = self.session.api_seconds, self.session.api_calls
+        self.pipeline_stages = None
+        parsed_cmd = parse(line)
+        parsed = time.perf_counter()
+        try:
+            return dispatch(self, parsed_cmd)
+        finally:
+            done = time.perf_counter()
+            api_ms = (self.session.api_seconds - api_seconds) * 1000
+            timing = {
+                "cmd": line,
+                "parse_ms": (parsed - start) * 1000,
+                "api_ms": api_ms,
+                "api_calls": self.session.api_calls - api_calls,
+                "render_ms": max((done - parsed) * 1000 - api_ms, 0.0),
+                "total_ms": (done - start) * 1000,
+                "stages": self.pipeline_stages,
+            }
+            self.timings.append(timing)
+            if words[0] == "time":
+                print(self._format_timing(timing))
+                for stage in timing["stages"] or []:
+                    print(f"  api stage {stage['cmd']:<24.24} {stage['ms']:>9.1f} ms {stage['lines']:>9} lines out")
+
+    @staticmethod
+    def _format_timing(timing):
+        return (f"total {timing['total_ms']:.1f} ms: parse {timing['parse_ms']:.2f} ms, "
+                f"api {timing['api_ms']:.1f} ms ({timing['api_calls']} request{'' if timing['api_calls'] == 1 else 's'}), render {timing['render_ms']:.1f} ms")
+
+    def show_timings(self):
+        """Print the per-stage timings of recent commands, oldest first."""
+        if not self.timings:
+            print("No commands timed yet.")
+        for timing in self.timings:
+            print(f"{timing['cmd']:<30.30} {self._format_timing(timing)}")
+
     def x_history(self, index):
         """Retrieve a command from history based on its index BUT DO NOT EXECUTE."""
         if 0 <= index < len(self.history):
@@ -2094,39 +2187,38 @@ GNU coreutils 8.32                                         February 2024
             return []
 
     # touch command #
-    def run_touch(self, cmd, previous_output=None, redirect=None, append=False):
-        """Execute the touch command to create empty files."""
+    def batch_touch(self, cmd, previous_output=None):
+        """Return the (file name, operation) pairs touch sends to /batch/: its params, or the words piped in."""
         if previous_output:
             # Split the previous output into individual words
             words = " ".join(previous_output).split()
         else:
-            params = cmd["params"]
-            if not params:
+            words = cmd["params"]
+            if not words:
                 print("Error: No file names specified.")
                 return []
-            words = params
+        return [(word, {"op": "touch", "path": word}) for word in words]
 
+    def run_touch(self, cmd, done, redirect=None, append=False):
+        """Execute the touch command to create empty files, reporting the files batch_touch's batch created."""
         outputs = []
-        for word in words:
-            response = requests.post(f"{self.url}/create_file/?name={word}&contents=''&pid={self.current_pid}&oid=1&size=0")
-            if response.status_code == 200:
-                output = f"Created file {word}"
-                outputs.append(output)
-                if redirect:
-                    mode = 'a' if append else 'w'
-                    try:
-                        with open(redirect, mode) as f:
-                            f.write(output + "\n")
-                        print(f"Output successfully written to {redirect}")
-                    except IOError as e:
-                        print(f"Error writing to file {redirect}: {e}")
-                    return []
-                else:
-                    print(output)
-            else:
-                print(f"Error: {response.json().get('detail', 'Unknown error')}")
-                return []
+        for word, touched in done:
+            if not touched["ok"]:
+                print(f"Error: {touched['error']}")
+            elif touched["created"]:
+                outputs.append(f"Created file {word}")
 
+        if redirect:
+            mode = 'a' if append else 'w'
+            try:
+                with open(redirect, mode) as f:
+                    f.writelines(output + "\n" for output in outputs)
+                print(f"Output successfully written to {redirect}")
+            except IOError as e:
+                print(f"Error writing to file {redirect}: {e}")
+            return []
+        for output in outputs:
+            print(output)
         return outputs
 
     # cowspeak command #
@@ -2227,6 +2319,113 @@ RESET = '\033[0m'
 # prompt = "$"  # set default prompt
 prompt = f"{BLUE}~{RESET}$ "
 
+# Command registry #
+
+Command = namedtuple("Command", "name handler pipe_input stream redirect batchable")
+
+COMMANDS = {}
+
+
+def register_command(name, handler, pipe_input=False, stream=None, redirect=False, batchable=None):
+    """Make a command available to the shell by name.
+
+    handler is the DbApi method that runs it, called with the shell and the
+    parsed sub-command. The capabilities say what else dispatch() does with it:
+    - pipe_input: hand it the previous stage's output (as a list)
+    - stream: a generator method (cmd, lines) that runs the command as a lazy
+      pipeline stage, taking and yielding lines, used for every stage but the last
+    - redirect: hand the last stage the > / >> target and append flag
+    - batchable: a method (cmd, lines) returning (target, operation) pairs; all
+      of them are sent to /batch/ as one request, and handler is given the
+      (target, result) pairs in place of the piped input
+    """
+    COMMANDS[name] = Command(name, handler, pipe_input, stream, redirect, batchable)
+
+
+for _name in ("cd", "pwd", "mv", "cp", "chmod", "man", "history"):
+    register_command(_name, getattr(DbApi, f"run_{_name}"))
+for _name in ("ls", "more", "less", "fortune", "cowspeak"):
+    register_command(_name, getattr(DbApi, f"run_{_name}"), pipe_input=True, redirect=True)
+for _name in ("cat", "sort", "wc", "grep", "head", "tail"):
+    register_command(_name, getattr(DbApi, f"run_{_name}"), pipe_input=True,
+                     stream=getattr(DbApi, f"pipe_{_name}"), redirect=True)
+for _name in ("mkdir", "rm"):
+    register_command(_name, getattr(DbApi, f"run_{_name}"), batchable=getattr(DbApi, f"batch_{_name}"))
+register_command("touch", DbApi.run_touch, pipe_input=True, redirect=True, batchable=DbApi.batch_touch)
+
+
+def run_batched(db_api, command, sub_cmd, lines, kwargs):
+    """Send every target of a batchable command to /batch/ in one request, then run its handler on the results.
+
+    Returns None without calling the handler when there is nothing to send
+    (the command printed why) or the request failed (run_batch printed why).
+    """
+    targets = command.batchable(db_api, sub_cmd, lines)
+    if not targets:
+        return None
+    results = db_api.run_batch([operation for _, operation in targets])
+    if results is None:
+        return None
+    done = [(target, result) for (target, _), result in zip(targets, results)]
+    return command.handler(db_api, sub_cmd, done, **kwargs)
+
+
+def dispatch(db_api, parsed_cmd):
+    """Run the sub-commands of a parsed command line, piping each one's output into the next.
+
+    Stages with a stream method are chained as generators, so lines flow through
+    the pipeline one at a time and nothing runs until the last stage asks for
+    output. When a stage stops early (head), or the command fails or is
+    interrupted, every stage is closed, which cancels the reads still going on
+    upstream. Only the last stage prints or writes the redirect target. A
+    pipeline whose stages are all pipeline.STAGES runs on the API instead
+    (pipe_server), unless db_api.server_pipelines is off.
+    """
+    sub_cmds = parsed_cmd["sub_cmds"]
+    for sub_cmd in sub_cmds:
+        if sub_cmd["cmd"] not in COMMANDS:
+            print(f"Unknown command: {sub_cmd['cmd']}")
+            return None
+
+    if len(sub_cmds) > 1 and db_api.server_pipelines and all(sub_cmd["cmd"] in STAGES for sub_cmd in sub_cmds):
+        # Every stage can run next to the database: send the whole pipeline
+        lines = db_api.pipe_server(sub_cmds)
+        try:
+            return db_api._write_lines(lines, parsed_cmd["redirect"], parsed_cmd["append"])
+        finally:
+            close_lines(lines)
+
+    lines = None
+    stages = []
+    last_stage = len(sub_cmds) - 1
+    try:
+        for stage, sub_cmd in enumerate(sub_cmds):
+            command = COMMANDS[sub_cmd["cmd"]]
+            if stage < last_stage and command.stream:
+                lines = command.stream(db_api, sub_cmd, lines)
+                stages.append(lines)
+                continue
+            if not command.pipe_input:
+                lines = None
+            elif lines is not None and not command.stream:
+                lines = list(lines)  # this command wants its input all at once
+            kwargs = {}
+            if command.redirect and stage == last_stage:
+                kwargs.update(redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
+            if command.batchable:
+                output = run_batched(db_api, command, sub_cmd, lines, kwargs)
+            elif command.pipe_input:
+                output = command.handler(db_api, sub_cmd, lines, **kwargs)
+            else:
+                output = command.handler(db_api, sub_cmd, **kwargs)
+            if stage == last_stage:
+                return output
+            lines = iter(output) if isinstance(output, list) else None
+    finally:
+        for lines in reversed(stages):
+            close_lines(lines)
+
+
 def update_prompt(path):
     """Update the global prompt with the current path in blue."""
     global prompt
@@ -2336,79 +2535,10 @@ if __name__ == "__main__":
                         continue
                 except ValueError:
                     print("Error: Invalid history index.")
-            # This 'elif' simulates something "happening" after pressing return
             else:
-                parsed_cmd = parse(cmd)
-                
-                #####################
-                # COMMENT/UNCOMMENT #
-                #####################
-                # print(parsed_cmd)
-                sleep(1)
-
-                # Save the command to history
-                parsed_cmd = parse(cmd)
+                # Save the command to history, then run it straight away
                 db_api.save_to_history(cmd)
-
-
-                # Iterate through each sub-command parsed
-                previous_output = None
-                for sub_cmd in parsed_cmd["sub_cmds"]:
-                    if sub_cmd["cmd"] == "ls":
-                        # print("Running ls command")
-                        # previous_output = db_api.run_ls(sub_cmd)
-                        previous_output = db_api.run_ls(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "cd":
-                        previous_output = db_api.run_cd(sub_cmd)
-                    elif sub_cmd["cmd"] == "cat":
-                        # Pass the redirection and append values to run_cat
-                        previous_output = db_api.run_cat(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "sort":
-                        # previous_output = db_api.run_sort(sub_cmd)
-                        previous_output = db_api.run_sort(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "wc" and "-w" in sub_cmd["flags"]:
-                        print("Running wc -w command")
-                        previous_output = db_api.run_wc_w(sub_cmd, previous_output)
-                    elif sub_cmd["cmd"] == "wc":
-                        # print("Running wc command")
-                        # previous_output = db_api.run_wc(sub_cmd)
-                        previous_output = db_api.run_wc(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "grep":
-                        # Pass the previous output if there's piping
-                        previous_output = db_api.run_grep(sub_cmd, previous_output)
-                    elif sub_cmd["cmd"] == "history":
-                        previous_output = db_api.show_history()
-                    elif sub_cmd["cmd"] == "rm":
-                        previous_output = db_api.run_rm(sub_cmd)
-                    elif sub_cmd["cmd"] == "pwd":
-                        previous_output = db_api.run_pwd(sub_cmd)
-                    elif sub_cmd["cmd"] == "mv":
-                        previous_output = db_api.run_mv(sub_cmd)
-                    elif sub_cmd["cmd"] == "mkdir":
-                        previous_output = db_api.run_mkdir(sub_cmd)
-                    elif sub_cmd["cmd"] == "chmod":
-                        previous_output = db_api.run_chmod(sub_cmd)
-                    elif sub_cmd["cmd"] == "cp":
-                        previous_output = db_api.run_cp(sub_cmd)
-                    elif sub_cmd["cmd"] == "more":
-                        previous_output = db_api.run_more(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "less":
-                        previous_output = db_api.run_less(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "head":
-                        previous_output = db_api.run_head(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "tail":
-                        previous_output = db_api.run_tail(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "fortune":
-                        previous_output = db_api.run_fortune(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "touch":
-                        previous_output = db_api.run_touch(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "cowspeak":
-                        previous_output = db_api.run_cowspeak(sub_cmd, previous_output, redirect=parsed_cmd["redirect"], append=parsed_cmd["append"])
-                    elif sub_cmd["cmd"] == "man":
-                        db_api.run_man(sub_cmd)
-
-                    else:
-                        print(f"Unknown command: {sub_cmd['cmd']}")
+                db_api.run_line(cmd)
 
             cmd = ""  # reset command to nothing (since we just executed it)
             cursor_pos = 0  # reset cursor position
@@ -7,52 +7,391 @@ permissions, and user information. It acts as the database interface, enabling
 the API to execute the necessary queries and operations based on the shell's requests.
 """
 
+import io
+import json
 import sqlite3
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
+from itertools import islice
+
+import schema
+from blobcodec import CompressedBlob
+from pathcache import PathCache
+
+
+ROOT_ID = 1  # id of the top-level directory, shown as "/" in the prompt
+CHUNK_SIZE = 64 * 1024  # bytes per read when streaming file contents
+OFFSET_TYPECODE = 'I'   # line_index offsets are packed as little-endian uint32
+OFFSET_SIZE = 4
+MIN_FTS_PATTERN = 3     # the trigram index only answers patterns of at least this many characters
+
+# Columns carried over when a file or directory is copied (everything but id, parent, name and dates)
+FILE_COPY_COLUMNS = """oid, size, blob_id, read_permission, write_permission, execute_permission,
+    world_read, world_write, world_execute, line_count, word_count, char_count, byte_count"""
+DIRECTORY_COPY_COLUMNS = """oid, read_permission, write_permission, execute_permission,
+    world_read, world_write, world_execute"""
+
+# Ids of directory :pid and, when :recursive is true, every directory below it
+SUBTREE_CTE = """
+    WITH RECURSIVE subtree(id) AS (
+        SELECT :pid
+        UNION
+        SELECT d.id FROM directories d JOIN subtree ON d.pid = subtree.id WHERE :recursive
+    )
+"""
+
+
+class BytesBlob(io.BytesIO):
+    """In-memory stand-in for sqlite3.Blob, for contents that cannot be opened incrementally."""
+
+    def __len__(self):
+        return self.getbuffer().nbytes
+
+
+def read_chunks(blob, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """Yield bytes [start, end) of an open blob, chunk_size at a time."""
+    stop = len(blob) if end is None else min(end, len(blob))
+    blob.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = blob.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def split_lines(chunks):
+    """Yield the newline-separated lines (without the newline) of a stream of byte chunks."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def decode_line(line):
+    """Decode one raw line, dropping a Windows carriage return."""
+    return line.rstrip(b"\r").decode("utf-8", errors="replace")
+
+
+def wc_counts(contents):
+    """Return (lines, words, chars, bytes) for a file's contents, as /wc/ reports them."""
+    text = contents.decode("utf-8", errors="replace")
+    return len(text.splitlines()), len(text.split()), len(text), len(contents)
+
+
+def line_starts(chunks):
+    """Return an array with the byte offset at which each line of a chunk stream starts.
+
+    Lines follow split_lines: a trailing newline does not start another line.
+    """
+    starts = array(OFFSET_TYPECODE)
+    base = 0
+    at_line_start = True
+    for chunk in chunks:
+        if at_line_start and chunk:
+            starts.append(base)
+            at_line_start = False
+        pos = chunk.find(b"\n")
+        while pos != -1:
+            if pos + 1 < len(chunk):
+                starts.append(base + pos + 1)
+            else:
+                at_line_start = True  # the next line starts in the next chunk, if there is one
+            pos = chunk.find(b"\n", pos + 1)
+        base += len(chunk)
+    return starts
+
+
+def pack_offsets(starts):
+    """Pack line offsets into the little-endian bytes stored in line_index."""
+    if sys.byteorder == "big":
+        starts = array(OFFSET_TYPECODE, starts)
+        starts.byteswap()
+    return starts.tobytes()
+
+
+def unpack_offsets(data):
+    """Unpack little-endian line offsets read from line_index."""
+    starts = array(OFFSET_TYPECODE)
+    starts.frombytes(data)
+    if sys.byteorder == "big":
+        starts.byteswap()
+    return starts
+
+
+class ConnectionPool:
+    """Hand out one long-lived connection per thread instead of connecting per call.
+
+    Each thread gets its own connection the first time it asks for one and keeps
+    reusing it, so the database file is opened and its schema parsed once per
+    worker thread. Every connection keeps an LRU cache of prepared statements
+    (keyed by SQL text), which is why all queries should use ? placeholders.
+    """
+
+    def __init__(self, db_path, cached_statements=256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0  # bumped by close() so stale thread-local connections are dropped
+
+    def _open(self):
+        """Open a new connection that can be closed from the shutdown thread."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        schema.apply_pragmas(conn)
+        return conn
+
+    def get(self):
+        """Return the calling thread's connection, opening it on first use."""
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            with self._lock:
+                conn = self._open()
+                self._connections.append(conn)
+                local.conn = conn
+                local.generation = self._generation
+        return local.conn
+
+    def size(self):
+        """Return the number of open connections."""
+        with self._lock:
+            return len(self._connections)
+
+    def close(self):
+        """Close every connection handed out so far."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._generation += 1
+
 
 class SqliteCRUD:
-    def __init__(self, db_path='filesystem.db'):
-        """Store the database path."""
+    def __init__(self, db_path='filesystem.db', use_line_index=True):
+        """Store the database path and set up the connection pool and path cache."""
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.path_cache = PathCache()
+        self.use_line_index = use_line_index  # seek to line N instead of scanning for newlines
+        self._batch = threading.local()  # set while this thread runs a batch()
+        self.cache_writer = None  # GroupCommitWriter that lazily filled caches are saved through, if any
 
     def _connect(self):
-        """Create and return a new database connection."""
-        return sqlite3.connect(self.db_path)
+        """Return the pooled connection for the current thread.
+
+        The connection is shared by every call made on this thread, so callers
+        must not close it; use `with self._write(conn):` to commit or roll back writes.
+        """
+        return self.pool.get()
+
+    @contextmanager
+    def _write(self, conn, immediate=False):
+        """Commit the writes made in the block, or roll them back if it raises.
+
+        With immediate the write lock is taken up front (BEGIN IMMEDIATE). Inside
+        batch() nothing is committed here: the writes join the batch's
+        transaction, which commits or rolls back as a whole.
+        """
+        if getattr(self._batch, "active", False):
+            yield conn
+            return
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    @contextmanager
+    def batch(self):
+        """Run every write made on this thread inside the block as one transaction.
+
+        Yields the connection, so the caller can set savepoints around single
+        operations. The transaction commits when the block ends and rolls back
+        if it raises. The path cache is cleared either way, since paths looked
+        up inside the block may have been rolled back. A batch() opened inside
+        another one is a savepoint in the outer transaction.
+        """
+        conn = self._connect()
+        if getattr(self._batch, "active", False):
+            conn.execute("SAVEPOINT nested_batch")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO nested_batch")
+                raise
+            finally:
+                conn.execute("RELEASE nested_batch")
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._batch.active = True
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._batch.active = False
+            self.path_cache.invalidate()
+
+    def migrate(self):
+        """Create any missing tables and apply pending schema migrations."""
+        return schema.create_schema(self._connect())
 
     def create_directory(self, name, pid, oid):
         """Create a new directory."""
-        print(f"vars: {name}, {pid}, {oid}")
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute(f"INSERT INTO 'directories' ('name', 'pid', 'oid') VALUES ('{name}', '{int(pid)}', '{int(oid)}');")
-        conn.commit()
-        last_row_id = cursor.lastrowid
-        conn.close()
-        return last_row_id
+        with self._write(conn):
+            cursor = conn.execute("""
+                INSERT INTO directories (name, pid, oid) VALUES (?, ?, ?);
+            """, (name, int(pid), int(oid)))
+        self.path_cache.invalidate()
+        return cursor.lastrowid
     
     def get_directory_id(self, name, parent_pid=1):
         """Retrieve the directory ID (pid) based on the directory name and its parent directory."""
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("""
+        cursor = conn.execute("""
             SELECT id FROM directories WHERE name = ? AND pid = ?;
         """, (name, parent_pid))
         result = cursor.fetchone()
-        conn.close()
         if result:
             return {'id': result[0]}  # Return the directory ID
         else:
             return None  # Return None if directory not found
 
+    def get_directory_id_by_path(self, path, start_pid=1):
+        """Resolve a slash-separated directory path from start_pid, using the path cache."""
+        key = path.strip('/')
+        dir_id = self.path_cache.get_id(start_pid, key)
+        if dir_id is not None:
+            return {'id': dir_id}
+
+        # Walk one component at a time, caching every prefix on the way down
+        dir_id = start_pid
+        walked = []
+        for part in key.split('/'):
+            result = self.get_directory_id(part, dir_id)
+            if result is None:
+                return None  # Directory not found at this level
+            self.path_cache.put_parent(result['id'], part, dir_id)
+            dir_id = result['id']
+            walked.append(part)
+            self.path_cache.put_id(start_pid, '/'.join(walked), dir_id)
+
+        return {'id': dir_id}
+
+    def get_directory_path(self, pid):
+        """Return the absolute path of a directory, using the path cache."""
+        path = self.path_cache.get_path(pid)
+        if path is not None:
+            return path
+
+        path_parts = []
+        current = pid
+        while current != 1:  # Continue until we reach the root directory
+            directory_info = self.get_directory_info(current)
+            if directory_info is None:
+                break  # Handle case where directory isn't found (e.g., deleted or invalid pid)
+            path_parts.insert(0, directory_info['name'])
+            current = directory_info['pid']
+
+        path = "/" + "/".join(path_parts) if path_parts else "/"
+        self.path_cache.put_path(pid, path)
+        return path
     
-    
+    def resolve_path(self, path, current_pid=1):
+        """Resolve an absolute or relative path (with '.', '..' and '~') in a single query.
+
+        The components are walked by a recursive CTE, one row per level, and the
+        canonical path is rebuilt from the target by climbing parent pointers in
+        the same statement. Returns {'id', 'pid', 'type', 'path'}, where pid is
+        the directory holding the target, or None if any component is missing.
+        """
+        if path.startswith('~'):
+            start = None  # the home directory, looked up inside the query
+            path = path[1:]
+        elif path.startswith('/'):
+            start = ROOT_ID
+        else:
+            start = current_pid
+        parts = [part for part in path.split('/') if part not in ('', '.')]
+
+        conn = self._connect()
+        row = conn.execute("""
+            WITH RECURSIVE
+            parts(idx, name) AS (
+                SELECT key, value FROM json_each(?1)
+            ),
+            walk(idx, id, type) AS (
+                SELECT 0, COALESCE(?2, (SELECT id FROM directories WHERE name = 'home' ORDER BY id LIMIT 1), ?3), 'dir'
+                UNION ALL
+                SELECT walk.idx + 1,
+                    CASE
+                        WHEN parts.name = '..' AND walk.id = ?3 THEN walk.id
+                        WHEN parts.name = '..' THEN (SELECT pid FROM directories WHERE id = walk.id)
+                        ELSE COALESCE(
+                            (SELECT id FROM directories WHERE pid = walk.id AND name = parts.name),
+                            (SELECT id FROM files WHERE pid = walk.id AND name = parts.name))
+                    END,
+                    CASE
+                        WHEN parts.name = '..' THEN 'dir'
+                        WHEN EXISTS (SELECT 1 FROM directories WHERE pid = walk.id AND name = parts.name) THEN 'dir'
+                        WHEN EXISTS (SELECT 1 FROM files WHERE pid = walk.id AND name = parts.name) THEN 'file'
+                    END
+                FROM walk JOIN parts ON parts.idx = walk.idx
+                WHERE walk.type = 'dir'
+            ),
+            target AS (
+                SELECT idx, id, type,
+                    CASE WHEN type = 'file' THEN (SELECT pid FROM files WHERE id = walk.id) ELSE id END AS dir_id
+                FROM walk ORDER BY idx DESC LIMIT 1
+            ),
+            up(id, name, pid, depth) AS (
+                SELECT d.id, d.name, d.pid, 0
+                FROM directories d JOIN target ON d.id = target.dir_id
+                WHERE d.id != ?3
+                UNION ALL
+                SELECT d.id, d.name, d.pid, up.depth + 1
+                FROM directories d JOIN up ON d.id = up.pid
+                WHERE d.id != ?3 AND up.depth < 1000
+            )
+            SELECT target.idx, target.id, target.type, target.dir_id,
+                (SELECT pid FROM directories WHERE id = target.id),
+                (SELECT group_concat(name, '/') FROM (SELECT name FROM up ORDER BY depth DESC)),
+                (SELECT name FROM files WHERE id = target.id)
+            FROM target;
+        """, (json.dumps(parts), start, ROOT_ID)).fetchone()
+
+        idx, target_id, target_type, dir_id, dir_parent, dir_path, file_name = row
+        if idx != len(parts) or target_id is None or target_type is None:
+            return None
+
+        canonical = "/" + dir_path if dir_path else "/"
+        if target_type == 'file':
+            return {'id': target_id, 'pid': dir_id, 'type': 'file',
+                    'path': canonical.rstrip('/') + "/" + file_name}
+        return {'id': target_id, 'pid': dir_parent, 'type': 'dir', 'path': canonical}
+
     def list_directory(self, pid, name=None):
         """List files and directories in the current directory, optionally filtering by name."""
         conn = self._connect()
-        cursor = conn.cursor()
 
         # If a specific name is provided, filter by that name
         if name:
-            cursor.execute("""
+            cursor = conn.execute("""
                 SELECT name, 'dir' as type, modified_at, oid, read_permission, write_permission, execute_permission, world_read, world_write, world_execute, NULL as size
                 FROM directories 
                 WHERE pid = ? AND name = ?
@@ -62,7 +401,7 @@ class SqliteCRUD:
                 WHERE pid = ? AND name = ?;
             """, (pid, name, pid, name))
         else:
-            cursor.execute(""" 
+            cursor = conn.execute(""" 
                 SELECT name, 'dir' as type, modified_at, oid, read_permission, write_permission, execute_permission, world_read, world_write, world_execute, NULL as size
                 FROM directories 
                 WHERE pid = ?
@@ -72,9 +411,7 @@ class SqliteCRUD:
                 WHERE pid = ?;
             """, (pid, pid))
 
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return cursor.fetchall()
 
 
 
@@ -83,65 +420,34 @@ class SqliteCRUD:
     def get_home_directory_pid(self):
         """Fetch the id of the home directory from the database."""
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM directories WHERE name = 'home'")
-        result = cursor.fetchone()
-        conn.close()
-        print(f"Database result for home directory: {result}")  # Debugging
+        result = conn.execute("SELECT id FROM directories WHERE name = 'home'").fetchone()
         return result[0] if result else 1  # Return id (1), or default to 1 if not found
 
-    # def get_parent_directory_pid(self, current_pid):
-    #     """Return the pid of the parent directory of the current directory."""
-    #     # conn = self._connect()
-    #     # cursor = conn.cursor()
-    #     # cursor.execute("SELECT pid FROM directories WHERE id = ?", (current_pid,))
-    #     # result = cursor.fetchone()
-    #     # conn.close()
-    #     # return result[0] if result else None
-        
-    #     conn = self._connect()
-    #     cursor = conn.cursor()
-    #     cursor.execute("SELECT pid FROM directories WHERE id = ?", (current_pid,))
-    #     result = cursor.fetchone()
-    #     conn.close()
-    #     return result[0] if result else None
-    
     def get_parent_directory(self, current_pid):
         """Return the pid of the parent directory of the current directory."""
-        # conn = self._connect()
-        # cursor = conn.cursor()
-        # cursor.execute("SELECT pid FROM directories WHERE id = ?", (current_pid,))
-        # result = cursor.fetchone()
-        # conn.close()
-        # return result[0] if result else None
-        
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT pid FROM directories WHERE id = ?", (current_pid,))
-        result = cursor.fetchone()
-        conn.close()
+        result = conn.execute("SELECT pid FROM directories WHERE id = ?", (current_pid,)).fetchone()
         return result[0] if result else None
 
     def get_directory_pid_by_name(self, name, current_pid):
         """Return the pid of a directory by its name and current pid."""
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM directories WHERE name = ? AND pid = ?", (name, current_pid))
-        result = cursor.fetchone()
-        conn.close()
+        result = conn.execute("SELECT id FROM directories WHERE name = ? AND pid = ?", (name, current_pid)).fetchone()
         return result[0] if result else None
     
     def get_directory_info(self, pid):
         """Retrieve directory name and parent ID based on the pid."""
+        cached = self.path_cache.get_parent(pid)
+        if cached is not None:
+            return {'name': cached[0], 'pid': cached[1]}
+
         conn = self._connect()
-        cursor = conn.cursor()  # Get a cursor from the connection
 
         query = "SELECT name, pid FROM directories WHERE id = ?"
-        cursor.execute(query, (pid,))
-        result = cursor.fetchone()
-        conn.close()  # Ensure the connection is closed after use
+        result = conn.execute(query, (pid,)).fetchone()
 
         if result:
+            self.path_cache.put_parent(pid, result[0], result[1])
             return {'name': result[0], 'pid': result[1]}  # name and parent id
         return None  # Return None if directory not found
 
@@ -149,310 +455,627 @@ class SqliteCRUD:
     def read_file(self, file_name: str, pid: int):
         """Read the contents of a file from the database."""
         conn = self._connect()
-        cursor = conn.cursor()
         
         # Query to get the file contents where name matches and pid is the current directory
-        cursor.execute("""
-            SELECT contents FROM files WHERE name = ? AND pid = ?
-        """, (file_name, pid))
-        
-        result = cursor.fetchone()
-        conn.close()
+        result = conn.execute("""
+            SELECT blob_text(b.codec, b.contents, b.frames)
+            FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.name = ? AND f.pid = ?
+        """, (file_name, pid)).fetchone()
 
         if result:
             return result[0]  # Return file contents
         else:
             return None  # File not found
 
-    #### wc -w
-    def count_words(self, file_name, pid):
-        """Count the number of words in the specified file."""
+    def get_file_stream_info(self, file_name: str, pid: int):
+        """Return {'id', 'length'} for a file without loading its contents, or None."""
         conn = self._connect()
-        cursor = conn.cursor()
-
+        result = conn.execute("""
+            SELECT f.id, b.size FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.name = ? AND f.pid = ?
+        """, (file_name, pid)).fetchone()
+        if result:
+            return {'id': result[0], 'length': result[1] or 0}
+        return None
+
+    def _blob_id(self, conn, file_id):
+        """Return the id of the blob holding a file's contents, or None."""
+        row = conn.execute("SELECT blob_id FROM files WHERE id = ?", (file_id,)).fetchone()
+        return row[0] if row else None
+
+    def _open_blob(self, conn, file_id):
+        """Open a file's contents for incremental reads (seek/read/len).
+
+        Compressed blobs are wrapped in a CompressedBlob, which decompresses
+        only the frames a read touches. A file without a blob reads as empty,
+        through a BytesBlob; all three have the interface of sqlite3.Blob.
+        """
+        row = conn.execute("""
+            SELECT f.blob_id, b.codec, b.size, b.frames FROM files f LEFT JOIN blobs b ON b.id = f.blob_id
+            WHERE f.id = ?
+        """, (file_id,)).fetchone()
+        if row is None:
+            raise sqlite3.OperationalError(f"no such file: {file_id}")
+        blob_id, codec, size, frames = row
+        if blob_id is None:
+            return BytesBlob(b"")
+        blob = conn.blobopen("blobs", "contents", blob_id, readonly=True)
+        return CompressedBlob(blob, codec, size, frames) if codec else blob
+
+    def iter_file(self, file_id, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """Yield a file's contents in chunks using incremental BLOB I/O.
+
+        Only bytes [start, end) are read, chunk_size at a time, so memory stays
+        flat whatever the file size. The stream gets its own connection because
+        a StreamingResponse may resume the generator on a different thread.
+        """
+        conn = self.pool._open()
         try:
-            # Fetch the file contents
-            cursor.execute("SELECT contents FROM files WHERE name = ? AND pid = ?", (file_name, pid))
-            result = cursor.fetchone()
-
-            if result:
-                file_contents = result[0].decode('utf-8')  # Decode the BLOB contents
-                words = file_contents.split()  # Split by whitespace to count words
-                word_count = len(words)
-                return word_count
-            else:
-                return None  # File not found
-
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return None
-
+            with self._open_blob(conn, file_id) as blob:
+                yield from read_chunks(blob, start, end, chunk_size)
         finally:
             conn.close()
-            
-    def count_lines_words_chars(self, file_name, pid):
-        """Count lines, words, and characters in the specified file."""
+
+    ### Line-offset index
+    def _store_line_index(self, conn, blob_id, starts):
+        """Save a blob's line start offsets (inside the caller's transaction)."""
+        conn.execute("""
+            INSERT OR REPLACE INTO line_index (blob_id, line_count, offsets) VALUES (?, ?, ?);
+        """, (blob_id, len(starts), pack_offsets(starts)))
+
+    def _fill_cache(self, fn, *args):
+        """Save a cache entry computed on the read path (a line index, wc counts).
+
+        With a cache_writer the save is queued on its writer thread and not
+        waited for, so readers never take the write lock themselves; without
+        one it is made right away.
+        """
+        if self.cache_writer is not None:
+            self.cache_writer.submit(fn, *args)
+        else:
+            fn(*args)
+
+    def _save_line_index(self, blob_id, blob_hash, starts):
+        """Store line offsets computed by a reader, unless the blob has gone (or been replaced) since."""
         conn = self._connect()
-        cursor = conn.cursor()
+        with self._write(conn):
+            if conn.execute("SELECT 1 FROM blobs WHERE id = ? AND hash = ?", (blob_id, blob_hash)).fetchone():
+                self._store_line_index(conn, blob_id, starts)
+
+    def _index_lines(self, conn, file_id):
+        """Return the line start offsets of a file with one pass over its contents, saving them as its index."""
+        row = conn.execute("""
+            SELECT b.id, b.hash FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.id = ?
+        """, (file_id,)).fetchone()
+        with self._open_blob(conn, file_id) as blob:
+            starts = line_starts(read_chunks(blob))
+        if row is not None:
+            self._fill_cache(self._save_line_index, *row, starts)
+        return starts
+
+    def build_line_index(self, file_id):
+        """(Re)build the line-offset index of a file's blob with one pass over its contents."""
+        return len(self._index_lines(self._connect(), file_id))
+
+    def _line_index(self, conn, file_id):
+        """Return (line count, offsets) for a file.
+
+        offsets is None when the index is stored, to be read with _line_offsets;
+        when it is missing it is built, handed back whole and saved for next time.
+        """
+        row = conn.execute("""
+            SELECT li.line_count FROM files f JOIN line_index li ON li.blob_id = f.blob_id WHERE f.id = ?
+        """, (file_id,)).fetchone()
+        if row:
+            return row[0], None
+        starts = self._index_lines(conn, file_id)
+        return len(starts), starts
+
+    def _line_count(self, conn, file_id):
+        """Return a file's line count from its index, building the index if it is missing."""
+        return self._line_index(conn, file_id)[0]
+
+    def _line_offsets(self, conn, file_id, first, count):
+        """Read count line start offsets, beginning at line first, straight out of the index BLOB."""
+        with conn.blobopen("line_index", "offsets", self._blob_id(conn, file_id), readonly=True) as blob:
+            blob.seek(first * OFFSET_SIZE)
+            return unpack_offsets(blob.read(count * OFFSET_SIZE))
+
+    ### head, tail, less, more
+    def read_lines(self, file_id, offset=0, limit=None):
+        """Return (lines, eof) for up to limit lines starting at line number offset.
+
+        With the line index, the byte range of the window is looked up and read
+        directly; without it the BLOB is scanned forward until the window is filled.
+        """
+        if not self.use_line_index:
+            return self._scan_lines(file_id, offset, limit)
 
-        try:
-            # Fetch the file contents
-            cursor.execute("SELECT contents FROM files WHERE name = ? AND pid = ?", (file_name, pid))
-            result = cursor.fetchone()
-
-            if result:
-                file_contents = result[0].decode('utf-8')  # Decode the BLOB contents
-                lines = file_contents.splitlines()
-                line_count = len(lines)
-                word_count = sum(len(line.split()) for line in lines)
-                char_count = len(file_contents)
-                return line_count, word_count, char_count
-            else:
-                return None, None, None  # File not found
+        conn = self._connect()
+        count, starts = self._line_index(conn, file_id)
+        if offset >= count or limit == 0:
+            return [], offset >= count
+        stop = count if limit is None else min(offset + limit, count)
+
+        # Start of the first line, and start of the line after the window (if any)
+        wanted = stop - offset + (stop < count)
+        if starts is None:
+            offsets = self._line_offsets(conn, file_id, offset, wanted)
+        else:
+            offsets = starts[offset:offset + wanted]  # just built, maybe not saved yet
+        end = offsets[-1] if stop < count else None
+        with self._open_blob(conn, file_id) as blob:
+            data = b"".join(read_chunks(blob, offsets[0], end))
+
+        lines = data.split(b"\n")
+        if lines[-1] == b"":
+            lines.pop()  # trailing newline does not start another line
+        return [decode_line(line) for line in lines], stop >= count
+
+    def _scan_lines(self, file_id, offset=0, limit=None):
+        """read_lines without the index: scan forward, stopping once the window is filled."""
+        conn = self._connect()
+        with self._open_blob(conn, file_id) as blob:
+            stop = None if limit is None else offset + limit + 1  # one extra line tells us if there is more
+            window = list(islice(split_lines(read_chunks(blob)), offset, stop))
+        eof = limit is None or len(window) <= limit
+        return [decode_line(line) for line in window[:limit]], eof
+
+    def head_lines(self, file_id, n=10):
+        """Return the first n lines of a file."""
+        return self.read_lines(file_id, 0, n)[0]
+
+    def tail_lines(self, file_id, n=10, skip=0):
+        """Return n lines ending skip lines before the end of a file."""
+        want = n + skip
+        if want <= 0:
+            return []
+        if not self.use_line_index:
+            return self._scan_tail(file_id, n, skip)
+
+        count = self._line_count(self._connect(), file_id)
+        end = count - skip
+        if end <= 0:
+            return []
+        begin = max(end - n, 0)
+        return self.read_lines(file_id, begin, end - begin)[0]
+
+    def _scan_tail(self, file_id, n=10, skip=0):
+        """tail_lines without the index.
+
+        The BLOB is read backwards from the end, a chunk at a time, until enough
+        newlines have been seen, so the start of a large file is never touched.
+        """
+        want = n + skip
+        conn = self._connect()
+        with self._open_blob(conn, file_id) as blob:
+            pos = len(blob)
+            buffer = b""
+            # want + 1 newlines guarantee want complete lines, even with a trailing newline
+            while pos > 0 and buffer.count(b"\n") <= want:
+                step = min(CHUNK_SIZE, pos)
+                pos -= step
+                blob.seek(pos)
+                buffer = blob.read(step) + buffer
+
+        lines = buffer.split(b"\n")
+        if lines[-1] == b"":
+            lines.pop()  # trailing newline does not start another line
+        if pos > 0:
+            lines = lines[1:]  # first piece is the tail end of an earlier line
+        lines = lines[-want:]
+        if skip:
+            lines = lines[:-skip]
+        return [decode_line(line) for line in lines]
 
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return None, None, None
+    #### wc -w
+    def get_wc_stats(self, file_name, pid):
+        """Return the stored line, word, char and byte counts of a file, or None if it is missing.
 
-        finally:
-            conn.close()
+        Counts that were never stored (or went stale) are computed once and saved.
+        """
+        conn = self._connect()
+        row = conn.execute("""
+            SELECT f.id, b.hash, f.line_count, f.word_count, f.char_count, f.byte_count
+            FROM files f LEFT JOIN blobs b ON b.id = f.blob_id WHERE f.name = ? AND f.pid = ?;
+        """, (file_name, pid)).fetchone()
+        if row is None:
+            return None
 
+        file_id, blob_hash, *counts = row
+        if None in counts:
+            with self._open_blob(conn, file_id) as blob:
+                counts = wc_counts(blob.read())
+            self._fill_cache(self._save_wc_counts, file_id, blob_hash, counts)
+        return dict(zip(("line_count", "word_count", "char_count", "byte_count"), counts))
 
+    def _save_wc_counts(self, file_id, blob_hash, counts):
+        """Store wc counts computed by a reader, unless the file's contents changed since."""
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute("""
+                UPDATE files SET line_count = ?, word_count = ?, char_count = ?, byte_count = ?
+                WHERE id = ? AND blob_id IS (SELECT id FROM blobs WHERE hash = ?);
+            """, (*counts, file_id, blob_hash))
+
+    def count_words(self, file_name, pid):
+        """Count the number of words in the specified file."""
+        stats = self.get_wc_stats(file_name, pid)
+        return stats["word_count"] if stats else None  # None: file not found
 
-    def create_file(self, name, contents, pid, oid, size=0):
-        """Create a new file in the specified directory (pid)."""
+    def count_lines_words_chars(self, file_name, pid):
+        """Count lines, words, and characters in the specified file."""
+        stats = self.get_wc_stats(file_name, pid)
+        if stats is None:
+            return None, None, None  # File not found
+        return stats["line_count"], stats["word_count"], stats["char_count"]
+
+    def _store_contents(self, conn, contents, name=None):
+        """Store contents as a blob (or find the blob already holding them); return its id.
+
+        name is the file's name, which helps decide whether to compress. The
+        line index is built only for a blob that does not have one yet, so
+        writing the same contents again costs a hash and a lookup.
+        """
+        blob_id = schema.store_blob(conn, contents, name)
+        if self.use_line_index and conn.execute(
+                "SELECT 1 FROM line_index WHERE blob_id = ?", (blob_id,)).fetchone() is None:
+            self._store_line_index(conn, blob_id, line_starts([contents]))
+        return blob_id
+
+    def create_file(self, name, contents, pid, oid, size=None, counts=None):
+        """Create a new file in the specified directory (pid).
+
+        size defaults to the length of contents; counts are the file's
+        wc_counts when the caller already has them. Identical contents are
+        stored once and shared, and may be stored compressed (see schema.py).
+        """
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')  # Always store a BLOB so it can be streamed
+        contents = contents or b""
+        if size is None:
+            size = len(contents)
+        if counts is None:
+            counts = wc_counts(contents)
+        conn = self._connect()
+        with self._write(conn):
+            cursor = conn.execute("""
+                INSERT INTO files (name, blob_id, pid, oid, size, line_count, word_count, char_count, byte_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """, (name, self._store_contents(conn, contents, name), pid, oid, size, *counts))
+        return cursor.lastrowid
+
+    def write_file(self, file_name, pid, contents):
+        """Replace the contents of a file; returns the number of files written (0 or 1).
+
+        Blobs are never changed in place: the file is pointed at the blob for
+        its new contents, so copies that shared the old blob keep their data,
+        and the old blob is dropped by trigger once nothing refers to it.
+        """
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO files (name, contents, pid, oid, size)
-            VALUES (?, ?, ?, ?, ?);
-        """, (name, contents, pid, oid, size))
-        conn.commit()
-        last_row_id = cursor.lastrowid
-        conn.close()
-        return last_row_id
+        with self._write(conn):
+            cursor = conn.execute("""
+                UPDATE files SET blob_id = ?, size = ?, modified_date = CURRENT_TIMESTAMP,
+                    line_count = ?, word_count = ?, char_count = ?, byte_count = ?
+                WHERE name = ? AND pid = ?;
+            """, (self._store_contents(conn, contents, file_name), len(contents), *wc_counts(contents),
+                  file_name, pid))
+        return cursor.rowcount
     
     
     def move_file(self, file_name, src_pid, dest_pid, dest_name):
         """Move or rename a file."""
         conn = self._connect()
-        cursor = conn.cursor()
         
         # Update the file's directory (pid) and optionally its name
-        cursor.execute("""
-            UPDATE files 
-            SET pid = ?, name = ? 
-            WHERE name = ? AND pid = ?;
-        """, (dest_pid, dest_name, file_name, src_pid))
-        
-        conn.commit()
+        with self._write(conn):
+            cursor = conn.execute("""
+                UPDATE files 
+                SET pid = ?, name = ? 
+                WHERE name = ? AND pid = ?;
+            """, (dest_pid, dest_name, file_name, src_pid))
+        self.path_cache.invalidate()
 
         if cursor.rowcount == 0:
             raise Exception(f"File {file_name} not found in the source directory.")
-        
-        conn.close()
 
     
     def copy_file(self, file_name, src_pid, dest_pid, dest_name):
-        """Copy a file from one directory to another, potentially renaming it."""
-        conn = self._connect()
-        cursor = conn.cursor()
-
-        # Fetch the file details from the source directory
-        cursor.execute("""
-            SELECT name, contents, oid, size FROM files WHERE name = ? AND pid = ?;
-        """, (file_name, src_pid))
-        file_data = cursor.fetchone()
-
-        if file_data:
-            # Use the dest_name for the copied file (which could be the same as file_name)
-            _, contents, oid, size = file_data
-            self.create_file(dest_name, contents, dest_pid, oid, size)
-        else:
-            raise Exception(f"File {file_name} not found in the source directory.")
-
-        conn.commit()
-        conn.close()
-    
-    
-    def grep_file(self, pattern: str, file_name: str, l: bool = False):
-        """Search for a pattern in the file's contents."""
-        try:
-            conn = self._connect()
-            cursor = conn.cursor()
-
-            # Fetch the file contents
-            cursor.execute("SELECT contents FROM files WHERE name = ?", (file_name,))
-            result = cursor.fetchone()
-            
-            if result:
-                contents = result[0]
-                
-                # Check if the contents are in bytes (BLOB), then decode; otherwise, assume it's a string
-                if isinstance(contents, bytes):
-                    contents = contents.decode('utf-8')
-                    print(f"Decoded BLOB content for {file_name}")
-                else:
-                    print(f"File content for {file_name} is a string")
-
-                # Split the contents into lines and search for the pattern
-                lines = contents.splitlines()
-                matched_lines = [line for line in lines if pattern in line]
-                
-                # Debug: Show lines that match the pattern
-                print(f"Matched lines for pattern '{pattern}': {matched_lines}")
-                
-                if l:
-                    # Return just the file name if -l flag is set
-                    return [file_name] if matched_lines else []
-                else:
-                    return matched_lines
-            else:
-                print(f"Error: File {file_name} not found")
-                return []
-        except Exception as e:
-            print(f"Error in grep_file: {e}")
-            raise e
-        finally:
-            conn.close()
-
+        """Copy a file from one directory to another, potentially renaming it.
 
-        # Helper function to remove a file
-    def remove_file(self, target):
-        """Remove the specified file."""
+        Only the row is copied: the new file points at the same blob, so the
+        contents are neither read nor stored again.
+        """
         conn = self._connect()
-        cursor = conn.cursor()
-
-        # SQL query to delete the file from the database
-        cursor.execute("DELETE FROM files WHERE name = ?", (target,))
-        conn.commit()
-        conn.close()
-        print(f"File {target} has been removed from the database.")  # Debugging
-
-    # Helper function to remove a directory
-    def remove_directory(self, target, recursive=False):
-        """Remove the specified directory (and its contents if recursive)."""
+        with self._write(conn):
+            cursor = conn.execute(f"""
+                INSERT INTO files (pid, name, {FILE_COPY_COLUMNS})
+                SELECT ?, ?, {FILE_COPY_COLUMNS} FROM files WHERE name = ? AND pid = ?;
+            """, (dest_pid, dest_name, file_name, src_pid))
+            if cursor.rowcount == 0:
+                raise Exception(f"File {file_name} not found in the source directory.")
+        self.path_cache.invalidate()
+        return cursor.lastrowid
+
+    def copy_tree(self, dir_id, dest_pid, dest_name):
+        """Copy directory dir_id and everything below it to dest_pid/dest_name in one transaction.
+
+        Old and new directory ids are paired in a temporary mapping table, and
+        directories and files are cloned with INSERT ... SELECT through it. The
+        copied files share their blobs with the originals, so the cost grows
+        with the number of rows and no contents are read or written.
+        Returns {'files': n, 'directories': n}.
+        """
+        params = {"pid": dir_id, "recursive": True, "dest_pid": dest_pid, "dest_name": dest_name}
         conn = self._connect()
-        cursor = conn.cursor()
+        try:
+            with self._write(conn, immediate=True):
+                conn.execute("DROP TABLE IF EXISTS temp.dir_map")
+                conn.execute("CREATE TEMP TABLE dir_map (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+
+                # New ids continue after the highest id ever handed out
+                conn.execute(SUBTREE_CTE + """
+                    INSERT INTO dir_map (old_id, new_id)
+                    SELECT id, (SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'directories'), 0),
+                                           COALESCE((SELECT MAX(id) FROM directories), 0)))
+                               + ROW_NUMBER() OVER (ORDER BY id)
+                    FROM subtree;
+                """, params)
+                if conn.execute("SELECT 1 FROM dir_map WHERE old_id = ?", (dest_pid,)).fetchone():
+                    raise Exception("Cannot copy a directory into itself.")
+
+                directories = conn.execute(f"""
+                    INSERT INTO directories (id, pid, name, {DIRECTORY_COPY_COLUMNS})
+                    SELECT m.new_id,
+                        CASE WHEN d.id = :pid THEN :dest_pid ELSE parent.new_id END,
+                        CASE WHEN d.id = :pid THEN :dest_name ELSE d.name END,
+                        {", ".join("d." + column.strip() for column in DIRECTORY_COPY_COLUMNS.split(","))}
+                    FROM directories d
+                    JOIN dir_map m ON m.old_id = d.id
+                    LEFT JOIN dir_map parent ON parent.old_id = d.pid
+                    ORDER BY m.new_id;
+                """, params).rowcount
+                files = conn.execute(f"""
+                    INSERT INTO files (pid, name, {FILE_COPY_COLUMNS})
+                    SELECT dm.new_id, f.name,
+                        {", ".join("f." + column.strip() for column in FILE_COPY_COLUMNS.split(","))}
+                    FROM files f
+                    JOIN dir_map dm ON dm.old_id = f.pid
+                    ORDER BY f.id;
+                """).rowcount
+                conn.execute("DROP TABLE temp.dir_map")
+        except sqlite3.IntegrityError:
+            raise Exception(f"{dest_name} already exists in the destination directory.")
+        self.path_cache.invalidate()
+        return {"files": files, "directories": directories}
+
+    ### Full-text search
+    def search(self, pattern, pid=ROOT_ID, recursive=True, name=None, names_only=False, limit=100, max_lines=5):
+        """Find files in directory pid (and below it, if recursive) whose contents contain pattern.
+
+        The FTS5 trigram index narrows the tree down to candidate files and
+        instr() confirms the exact, case-sensitive match, so only real matches
+        are read. Patterns shorter than MIN_FTS_PATTERN cannot use the index and
+        are checked with instr() alone. Results are ordered by bm25 rank; each
+        holds the file's path, rank and a highlighted snippet, plus (unless
+        names_only) up to max_lines matching lines with 1-based line numbers.
+        """
+        needle = pattern.encode("utf-8")
+        if not needle:
+            return []
+        params = {"pid": pid, "recursive": recursive, "needle": needle, "name": name,
+                  "names_only": names_only, "limit": limit}
 
-        if recursive:
-            # SQL query to remove directory and its contents recursively
-            cursor.execute("DELETE FROM directories WHERE name = ?", (target,))
-            cursor.execute("DELETE FROM files WHERE pid IN (SELECT id FROM directories WHERE name = ?)", (target,))
-            print(f"Directory {target} and its contents have been removed.")  # Debugging
+        conn = self._connect()
+        if len(pattern) >= MIN_FTS_PATTERN:
+            params["query"] = '"' + pattern.replace('"', '""') + '"'  # one phrase, no FTS operators
+            rows = conn.execute(SUBTREE_CTE + """
+                SELECT f.id, f.pid, f.name, bm25(blobs_fts),
+                    CASE WHEN :names_only THEN NULL ELSE snippet(blobs_fts, 0, '[', ']', '...', 64) END
+                FROM blobs_fts
+                JOIN blobs b ON b.id = blobs_fts.rowid
+                JOIN files f ON f.blob_id = b.id
+                WHERE blobs_fts MATCH :query
+                    AND f.pid IN subtree
+                    AND (:name IS NULL OR f.name = :name)
+                    AND instr(blob_text(b.codec, b.contents, b.frames), :needle) > 0
+                ORDER BY rank
+                LIMIT :limit;
+            """, params).fetchall()
         else:
-            # SQL query to remove just the directory
-            cursor.execute("DELETE FROM directories WHERE name = ?", (target,))
-            print(f"Directory {target} has been removed.")  # Debugging
-
-        conn.commit()
-        conn.close()
+            rows = conn.execute(SUBTREE_CTE + """
+                SELECT f.id, f.pid, f.name, 0.0, NULL
+                FROM files f JOIN blobs b ON b.id = f.blob_id
+                WHERE f.pid IN subtree
+                    AND (:name IS NULL OR f.name = :name)
+                    AND instr(blob_text(b.codec, b.contents, b.frames), :needle) > 0
+                ORDER BY f.id
+                LIMIT :limit;
+            """, params).fetchall()
+
+        results = []
+        for file_id, file_pid, file_name, rank, snippet in rows:
+            result = {
+                "id": file_id,
+                "path": self.get_directory_path(file_pid).rstrip("/") + "/" + file_name,
+                "rank": rank,
+                "snippet": snippet,
+            }
+            if not names_only:
+                result["lines"] = self._matching_lines(conn, file_id, needle, max_lines)
+            results.append(result)
+        return results
 
-    # Helper function to get target info (file or directory)
-    def get_target_info(self, target):
-        """Retrieve file or directory information."""
+    def find_files(self, pid=ROOT_ID, recursive=False, name=None, contains=None):
+        """Return (id, path) for the files in directory pid (or its subtree), sorted by path.
+
+        name keeps only files with that name. contains is a literal the file must
+        hold somewhere, ignoring case; when it is long enough the full-text index
+        drops the files that cannot match, otherwise it is ignored, so the caller
+        always gets a superset of the matching files.
+        """
+        params = {"pid": pid, "recursive": recursive, "name": name}
+        if contains is not None and len(contains) >= MIN_FTS_PATTERN:
+            params["query"] = '"' + contains.replace('"', '""') + '"'
+            source = "blobs_fts JOIN files f ON f.blob_id = blobs_fts.rowid WHERE blobs_fts MATCH :query AND"
+        else:
+            source = "files f WHERE"
+        rows = self._connect().execute(SUBTREE_CTE + f"""
+            SELECT f.id, f.pid, f.name FROM {source} f.pid IN subtree AND (:name IS NULL OR f.name = :name);
+        """, params).fetchall()
+        files = [(file_id, self.get_directory_path(file_pid).rstrip("/") + "/" + file_name)
+                 for file_id, file_pid, file_name in rows]
+        return sorted(files, key=lambda item: item[1])
+
+    def _matching_lines(self, conn, file_id, needle, max_lines):
+        """Return up to max_lines (0 for all) {'line_number', 'line'} dicts for lines containing needle."""
+        matches = []
+        with self._open_blob(conn, file_id) as blob:
+            for number, line in enumerate(split_lines(read_chunks(blob)), start=1):
+                if needle in line:
+                    matches.append({"line_number": number, "line": decode_line(line)})
+                    if max_lines and len(matches) >= max_lines:
+                        break
+        return matches
+
+
+    # Helper function to remove a file
+    def remove_file(self, file_name, pid):
+        """Remove a file from directory pid; returns the number of files removed (0 or 1)."""
         conn = self._connect()
-        cursor = conn.cursor()
-
-        # Check if it's a file or directory
-        cursor.execute("SELECT name, 'file' as type FROM files WHERE name = ? UNION SELECT name, 'dir' as type FROM directories WHERE name = ?", (target, target))
-        result = cursor.fetchone()
-        conn.close()
-
-        return {"name": result[0], "type": result[1]} if result else None
-
+        with self._write(conn):
+            cursor = conn.execute("DELETE FROM files WHERE name = ? AND pid = ?", (file_name, pid))
+        self.path_cache.invalidate()
+        return cursor.rowcount
 
+    # Helper function to remove a directory
+    def remove_directory(self, dir_name, pid, recursive=False):
+        """Remove directory dir_name from directory pid (and everything below it if recursive)."""
+        row = self._connect().execute("""
+            SELECT id FROM directories WHERE name = ? AND pid = ?;
+        """, (dir_name, pid)).fetchone()
+        if row is None:
+            raise Exception(f"Directory {dir_name} not found in the current directory.")
+        return self.remove_tree(row[0], recursive)
+
+    def remove_tree(self, dir_id, recursive=True):
+        """Delete directory dir_id and, if recursive, its whole subtree, in one transaction.
+
+        The subtree is collected by a recursive CTE and its files and directories
+        are deleted by id with two statements, however large it is. Without
+        recursive the directory must be empty. Returns {'files': n, 'directories': n}.
+        """
+        if dir_id == ROOT_ID:
+            raise Exception("Cannot remove the root directory.")
+        params = {"pid": dir_id, "recursive": recursive}
+        conn = self._connect()
+        with self._write(conn, immediate=True):  # nothing can be added to the subtree while it is collected
+            if not recursive and conn.execute("""
+                SELECT EXISTS (SELECT 1 FROM files WHERE pid = ?1) OR EXISTS (SELECT 1 FROM directories WHERE pid = ?1);
+            """, (dir_id,)).fetchone()[0]:
+                raise Exception("Directory not empty. Use the -r flag to remove it.")
+            # The CTE goes in a subquery: a statement starting with WITH reports no rowcount
+            subtree = SUBTREE_CTE + "SELECT id FROM subtree"
+            files = conn.execute(f"DELETE FROM files WHERE pid IN ({subtree});", params).rowcount
+            directories = conn.execute(f"DELETE FROM directories WHERE id IN ({subtree});", params).rowcount
+        self.path_cache.invalidate()
+        if directories == 0:
+            raise Exception(f"Directory {dir_id} not found.")
+        return {"files": files, "directories": directories}
 
     def delete_directory(self, dir_name, pid):
         """Delete a directory and its contents recursively."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id FROM directories WHERE name = ? AND pid = ?;
-        """, (dir_name, pid))
-        dir_data = cursor.fetchone()
-        if dir_data:
-            dir_id = dir_data[0]
-            cursor.execute("DELETE FROM directories WHERE id = ?", (dir_id,))
-            cursor.execute("DELETE FROM files WHERE pid = ?", (dir_id,))
-            conn.commit()
-        else:
-            raise Exception(f"Directory {dir_name} not found in the current directory.")
-        conn.close()
-    
+        return self.remove_directory(dir_name, pid, recursive=True)
 
-    
     def chmod_file(self, file_name, pid, permissions):
         """Change file permissions."""
         conn = self._connect()
-        cursor = conn.cursor()
 
         # Update the permissions for the file
-        cursor.execute("""
-            UPDATE files
-            SET read_permission = ?, write_permission = ?, execute_permission = ?,
-                world_read = ?, world_write = ?, world_execute = ?
-            WHERE name = ? AND pid = ?;
-        """, (permissions['read_permission'], permissions['write_permission'], permissions['execute_permission'],
-            permissions['world_read'], permissions['world_write'], permissions['world_execute'], file_name, pid))
-
-        conn.commit()
+        with self._write(conn):
+            cursor = conn.execute("""
+                UPDATE files
+                SET read_permission = ?, write_permission = ?, execute_permission = ?,
+                    world_read = ?, world_write = ?, world_execute = ?
+                WHERE name = ? AND pid = ?;
+            """, (permissions['read_permission'], permissions['write_permission'], permissions['execute_permission'],
+                permissions['world_read'], permissions['world_write'], permissions['world_execute'], file_name, pid))
 
         if cursor.rowcount == 0:
             raise Exception(f"File {file_name} not found.")
         
-        conn.close()
-        
     def chmod_directory(self, file_name, pid, permissions):
         """Change directory permissions."""
         conn = self._connect()
-        cursor = conn.cursor()
 
         # Update the permissions for the directory
-        cursor.execute("""
-            UPDATE directories
-            SET read_permission = ?, write_permission = ?, execute_permission = ?,
-                world_read = ?, world_write = ?, world_execute = ?
-            WHERE name = ? AND pid = ?;
-        """, (permissions['read_permission'], permissions['write_permission'], permissions['execute_permission'],
-            permissions['world_read'], permissions['world_write'], permissions['world_execute'], file_name, pid))
-
-        conn.commit()
+        with self._write(conn):
+            cursor = conn.execute("""
+                UPDATE directories
+                SET read_permission = ?, write_permission = ?, execute_permission = ?,
+                    world_read = ?, world_write = ?, world_execute = ?
+                WHERE name = ? AND pid = ?;
+            """, (permissions['read_permission'], permissions['write_permission'], permissions['execute_permission'],
+                permissions['world_read'], permissions['world_write'], permissions['world_execute'], file_name, pid))
 
         if cursor.rowcount == 0:
             raise Exception(f"Directory {file_name} not found.")
-        
-        conn.close()
 
     
     def check_if_dir_or_file(self, file_name, pid):
         """Check whether the target is a file or directory."""
         conn = self._connect()
-        cursor = conn.cursor()
 
         # First check if it's a directory
-        cursor.execute("""
+        result = conn.execute("""
             SELECT name FROM directories WHERE name = ? AND pid = ?;
-        """, (file_name, pid))
-        result = cursor.fetchone()
+        """, (file_name, pid)).fetchone()
 
         if result:
             return "directory"
 
         # If not a directory, check if it's a file
-        cursor.execute("""
+        result = conn.execute("""
             SELECT name FROM files WHERE name = ? AND pid = ?;
-        """, (file_name, pid))
-        result = cursor.fetchone()
+        """, (file_name, pid)).fetchone()
 
         if result:
             return "file"
 
         raise Exception(f"{file_name} not found in the directory.")
 
-        conn.close()
+    ### Blob storage
+    def blob_stats(self):
+        """Report how much content-addressed storage and compression save.
 
+        logical_bytes is what the files would take if each held its own copy,
+        unique_bytes the distinct contents once each, and stored_bytes what the
+        blobs take on disk after compression. dedup_ratio is logical over
+        unique, compression_ratio unique over stored.
+        """
+        conn = self._connect()
+        files, logical = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM files f JOIN blobs b ON b.id = f.blob_id;
+        """).fetchone()
+        blobs, unique, stored, shared, compressed = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(contents)), 0),
+                COALESCE(SUM(refcount > 1), 0), COALESCE(SUM(codec IS NOT NULL), 0)
+            FROM blobs;
+        """).fetchone()
+        return {
+            "files": files,
+            "blobs": blobs,
+            "shared_blobs": shared,
+            "compressed_blobs": compressed,
+            "logical_bytes": logical,
+            "unique_bytes": unique,
+            "stored_bytes": stored,
+            "bytes_saved": logical - stored,
+            "dedup_ratio": logical / unique if unique else 1.0,
+            "compression_ratio": unique / stored if stored else 1.0,
+        }
 
     def close(self):
-        """Close the database connection (not used since each method handles its own connection)."""
-        pass
+        """Close every pooled database connection."""
+        self.pool.close()
@@ -0,0 +1,70 @@
+# test_dbexecutor.py
+
+"""
+Tests for DbExecutor.iterate(): a stream whose consumer goes away halfway
+must end with the cancellation and leave the blocking generator closed.
+
+Usage: python -m pytest test_dbexecutor.py
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from dbexecutor import DbExecutor
+
+
+def blocking_chunks(started, release, state):
+    """Yield one chunk, then block inside next() until release is set."""
+    try:
+        yield b"first"
+        started.set()
+        release.wait(5)
+        yield b"second"
+        yield b"third"
+    finally:
+        state["closed"] = True
+
+
+def test_cancel_while_worker_is_inside_next():
+    started, release = threading.Event(), threading.Event()
+    state = {"closed": False}
+    executor = DbExecutor(workers=2)
+
+    async def consume(received):
+        async for chunk in executor.iterate(blocking_chunks(started, release, state)):
+            received.append(chunk)
+
+    async def main():
+        received = []
+        task = asyncio.create_task(consume(received))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()  # the client disconnects while the worker is blocked in next()
+        await asyncio.sleep(0.05)
+        assert not task.done()  # waiting for next() to return before closing
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return received
+
+    try:
+        received = asyncio.run(main())
+    finally:
+        release.set()
+        executor.close()
+    assert received == [b"first"]
+    assert state["closed"]
+    assert executor.stats()["pending"] == 0
+
+
+def test_stream_runs_to_the_end():
+    executor = DbExecutor(workers=2)
+
+    async def main():
+        return [chunk async for chunk in executor.iterate(iter([b"a", b"b", b"c"]))]
+
+    try:
+        assert asyncio.run(main()) == [b"a", b"b", b"c"]
+    finally:
+        executor.close()
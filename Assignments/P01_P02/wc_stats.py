@@ -0,0 +1,81 @@
+# wc_stats.py
+
+"""
+Maintenance jobs for the wc counts stored with each file (see schema.py, v5).
+'backfill' counts every file whose columns are still NULL (rows written before
+the migration, or whose contents changed), a batch at a time. 'check' recounts
+every file and reports rows whose stored counts disagree with their contents;
+'check --fix' also rewrites them.
+
+Usage: python wc_stats.py backfill|check [--fix] [db_path]
+"""
+
+import sqlite3
+import sys
+
+from schema import migrate
+from sqliteCRUD import wc_counts
+
+COLUMNS = ("line_count", "word_count", "char_count", "byte_count")
+
+
+def backfill(conn, batch_size=500):
+    """Fill in missing counts; return the number of files counted."""
+    total = 0
+    while True:
+        rows = conn.execute("""
+            SELECT f.id, blob_text(b.codec, b.contents, b.frames) FROM files f JOIN blobs b ON b.id = f.blob_id
+            WHERE f.line_count IS NULL LIMIT ?;
+        """, (batch_size,)).fetchall()
+        if not rows:
+            return total
+        with conn:
+            conn.executemany("""
+                UPDATE files SET line_count = ?, word_count = ?, char_count = ?, byte_count = ? WHERE id = ?;
+            """, [(*wc_counts(contents or b""), file_id) for file_id, contents in rows])
+        total += len(rows)
+
+
+def check(conn, fix=False):
+    """Return {'id', 'name', 'stored', 'actual'} for each file whose stored counts are wrong.
+
+    Files not counted yet are left to backfill(). With fix, wrong rows are rewritten.
+    """
+    mismatches = []
+    for file_id, name, contents, *stored in conn.execute("""
+        SELECT f.id, f.name, blob_text(b.codec, b.contents, b.frames), f.line_count, f.word_count, f.char_count, f.byte_count
+        FROM files f JOIN blobs b ON b.id = f.blob_id WHERE f.line_count IS NOT NULL;
+    """):
+        actual = wc_counts(contents or b"")
+        if tuple(stored) != actual:
+            mismatches.append({"id": file_id, "name": name,
+                               "stored": dict(zip(COLUMNS, stored)), "actual": dict(zip(COLUMNS, actual))})
+
+    if fix and mismatches:
+        with conn:
+            conn.executemany("""
+                UPDATE files SET line_count = ?, word_count = ?, char_count = ?, byte_count = ? WHERE id = ?;
+            """, [(*m["actual"].values(), m["id"]) for m in mismatches])
+    return mismatches
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--fix"]
+    if not args or args[0] not in ("backfill", "check"):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    job = args[0]
+    db_path = args[1] if len(args) > 1 else "filesystem.db"
+
+    conn = sqlite3.connect(db_path)
+    migrate(conn)  # make sure the count columns exist
+    if job == "backfill":
+        print(f"Counted {backfill(conn)} files")
+    else:
+        fix = "--fix" in sys.argv
+        mismatches = check(conn, fix)
+        for m in mismatches:
+            print(f"{m['id']} {m['name']}: stored {m['stored']}, actual {m['actual']}")
+        print(f"{len(mismatches)} files with wrong counts" + (" (fixed)" if fix and mismatches else ""))
+        sys.exit(1 if mismatches and not fix else 0)
+    conn.close()
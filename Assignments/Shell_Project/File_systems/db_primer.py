@@ -1,16 +1,37 @@
 """
 This script creates a SQLite database and populates it with file system data. You provide
 the root directory and the script will recursively traverse the directory and gather file
-information. The file information is then inserted into the SQLite database.
+information. The file information is then inserted into the SQLite database. File
+contents are stored once per distinct content in the blobs table, keyed by their
+SHA-256, and each file points at its blob; triggers keep the blob reference counts.
+Text files of COMPRESS_MIN_SIZE bytes or more are stored zlib-compressed in the same
+framed format as P01_P02's 'blobcodec.py' (codec 'zlib'), and size stays the real size.
 """
 
 from rich import print  # For pretty printing
 from sqliteCRUD import SqliteCRUD  # Custom SQLite CRUD class
-import base64  # For encoding binary data
+from array import array  # For packing compressed frame offsets
+import hashlib  # For content-addressed blob keys
 import os  # For file system operations
+import queue  # For the bounded queues between pipeline stages
 import stat  # For file permissions
 import sys  # For command line arguments
+import threading  # For the pipeline's walker and reader threads
 import time  # For file creation and modification times
+import zlib  # For compressing file contents
+
+COMPRESS_MIN_SIZE = 4 * 1024  # smaller files are stored as they are
+FRAME_SIZE = 64 * 1024  # zlib frame size, must match the 'zlib' codec in blobcodec.py
+
+BULK_BATCH = 1000  # files inserted per executemany call in bulk mode
+PIPELINE_WORKERS = 8  # threads that stat, read, hash and compress files in pipeline mode
+PIPELINE_QUEUE = 1000  # items each pipeline queue holds before its producer waits
+
+BLOB_ID_INDEX = """CREATE INDEX IF NOT EXISTS idx_files_blob_id ON files (blob_id);"""
+BLOB_REF_ON_INSERT = """CREATE TRIGGER IF NOT EXISTS blobs_ref_on_insert AFTER INSERT ON files WHEN new.blob_id IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+END;"""
 
 tables = [
     """
@@ -22,7 +43,7 @@ CREATE TABLE IF NOT EXISTS files (
     size INTEGER DEFAULT 0,
     creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     modified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    contents BLOB,
+    blob_id INTEGER REFERENCES blobs (id),
     read_permission INTEGER DEFAULT 1,
     write_permission INTEGER DEFAULT 0,
     execute_permission INTEGER DEFAULT 1,
@@ -31,6 +52,29 @@ CREATE TABLE IF NOT EXISTS files (
     world_execute INTEGER DEFAULT 1
 )
 """,
+    """CREATE TABLE IF NOT EXISTS blobs (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,              -- sha256 of contents
+    size INTEGER NOT NULL,                  -- length of contents in bytes
+    refcount INTEGER NOT NULL DEFAULT 0,    -- files pointing at this blob
+    contents BLOB NOT NULL,
+    codec TEXT,                             -- NULL when stored uncompressed
+    frames BLOB                             -- packed end offset of each compressed frame
+);""",
+    BLOB_ID_INDEX,
+    BLOB_REF_ON_INSERT,
+    """CREATE TRIGGER IF NOT EXISTS blobs_ref_on_delete AFTER DELETE ON files WHEN old.blob_id IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+    DELETE FROM blobs WHERE id = old.blob_id AND refcount <= 0;
+END;""",
+    """CREATE TRIGGER IF NOT EXISTS blobs_ref_on_write AFTER UPDATE OF blob_id ON files
+WHEN old.blob_id IS NOT new.blob_id
+BEGIN
+    UPDATE blobs SET refcount = refcount + 1 WHERE id = new.blob_id;
+    UPDATE blobs SET refcount = refcount - 1 WHERE id = old.blob_id;
+    DELETE FROM blobs WHERE id = old.blob_id AND refcount <= 0;
+END;""",
     """CREATE TABLE IF NOT EXISTS directories (
     id INTEGER PRIMARY KEY AUTOINCREMENT,   -- parent directory
     pid INTEGER,                            -- parent directory
@@ -44,6 +88,11 @@ CREATE TABLE IF NOT EXISTS files (
     world_read INTEGER DEFAULT 1,
     world_write INTEGER DEFAULT 0,
     world_execute INTEGER DEFAULT 1
+);""",
+    """CREATE TABLE IF NOT EXISTS import_checkpoint (
+    path TEXT PRIMARY KEY,                  -- absolute host path already imported
+    kind TEXT NOT NULL,                     -- 'dir' or 'file'
+    id INTEGER                              -- directories id of an imported directory
 );""",
     """CREATE TABLE  IF NOT EXISTS users (
     user_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -51,7 +100,7 @@ CREATE TABLE IF NOT EXISTS files (
     password TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );""",
-    """INSERT INTO users (username, password) VALUES
+    """INSERT OR IGNORE INTO users (username, password) VALUES
     ('root', 'password0'),
     ('bob', 'password1'),
     ('mia', 'password2'),
@@ -72,6 +121,51 @@ def printResults(res):
             print(f"{k}: {v}")
 
 
+def compressContents(contents):
+    """
+    Description:
+        Function to compress text contents in independent zlib frames
+    Args:
+        contents: (bytes) file contents
+    Returns:
+        (tuple) codec name or None, stored bytes, packed frame end offsets or None
+    """
+    if len(contents) < COMPRESS_MIN_SIZE or b"\0" in contents[:4096]:
+        return None, contents, None
+    frames = [zlib.compress(contents[i : i + FRAME_SIZE], 6) for i in range(0, len(contents), FRAME_SIZE)]
+    stored = b"".join(frames)
+    if len(stored) > len(contents) * 0.9:
+        return None, contents, None
+    ends = array("I")
+    for frame in frames:
+        ends.append((ends[-1] if ends else 0) + len(frame))
+    if sys.byteorder == "big":
+        ends.byteswap()
+    return "zlib", stored, ends.tobytes()
+
+
+def storeBlob(contents):
+    """
+    Description:
+        Function to store file contents in the blobs table, once per distinct content
+    Args:
+        contents: (bytes) file contents
+    Returns:
+        (str) hash the contents are stored under
+    """
+    global conn
+    digest = hashlib.sha256(contents).hexdigest()
+    codec, stored, frames = compressContents(contents)
+    codec = f'"{codec}"' if codec else "NULL"
+    frames = f"X'{frames.hex()}'" if frames else "NULL"
+    query = f"""
+            INSERT OR IGNORE INTO blobs (hash, size, contents, codec, frames)
+            VALUES ("{digest}", "{len(contents)}", X'{stored.hex()}', {codec}, {frames})
+            """
+    conn.runQuery(query)
+    return digest
+
+
 def getDirId(dir_name):
     """
     Description:
@@ -128,12 +222,14 @@ def insertFileData(
         res: (dict) result of the query
     """
     global conn
+    digest = storeBlob(contents)
     query = f"""
             INSERT INTO files (
-            pid, oid, name, size, creation_date, modified_date, contents,
+            pid, oid, name, size, creation_date, modified_date, blob_id,
             read_permission, write_permission, execute_permission,
             world_read, world_write, world_execute) 
-            VALUES ("{pid}", "{oid}", "{name}", "{size}", "{creation_date}", "{modified_date}", "{contents}",
+            VALUES ("{pid}", "{oid}", "{name}", "{size}", "{creation_date}", "{modified_date}",
+            (SELECT id FROM blobs WHERE hash = "{digest}"),
             "{read_permission}", "{write_permission}", "{execute_permission}",
             "{world_read}", "{world_write}", "{world_execute}")
             """
@@ -189,36 +285,23 @@ def load_directory(directory_path, oid=1):
             # print(f"{fcount} {pid} {file} ")
             file_path = os.path.join(root, file)
 
-            # Get file stats
-            stats = os.stat(file_path)
-
-            # File metadata
+            # File metadata and permissions
             name = file
-            size = stats.st_size
-            creation_date = time.strftime(
-                "%Y-%m-%d %H:%M:%S", time.localtime(stats.st_ctime)
-            )
-            modified_date = time.strftime(
-                "%Y-%m-%d %H:%M:%S", time.localtime(stats.st_mtime)
-            )
-
-            # File permissions
-            permissions = stats.st_mode
-            # print(f"Permissions: {permissions}")
-            read_permission = int(bool(permissions & stat.S_IRUSR))
-            write_permission = int(bool(permissions & stat.S_IWUSR))
-            execute_permission = int(bool(permissions & stat.S_IXUSR))
-            world_read = int(bool(permissions & stat.S_IROTH))
-            world_write = int(bool(permissions & stat.S_IWOTH))
-            world_execute = int(bool(permissions & stat.S_IXOTH))
-
-            # Use the following line to read the file contents of a base64 encoded file
-            # base64_output = base64_encoded_data.decode('utf-8')
+            (
+                size,
+                creation_date,
+                modified_date,
+                read_permission,
+                write_permission,
+                execute_permission,
+                world_read,
+                world_write,
+                world_execute,
+            ) = fileMetadata(file_path)
 
-            # Read file contents (if it's a small text file, for example)
+            # Read file contents; they are stored as raw bytes (compressed if large text)
             with open(file_path, "rb") as binary_file:
                 binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
 
             # Insert data into SQLite
             res = insertFileData(
@@ -228,7 +311,7 @@ def load_directory(directory_path, oid=1):
                 size,
                 creation_date,
                 modified_date,
-                base64_encoded_data,
+                binary_file_data,
                 read_permission,
                 write_permission,
                 execute_permission,
@@ -239,9 +322,486 @@ def load_directory(directory_path, oid=1):
             print(res)
 
 
+def fileMetadata(file_path):
+    """
+    Description:
+        Function to read the metadata stored with a file from the host file system
+    Args:
+        file_path: (str) file path
+    Returns:
+        (tuple) size, creation date, modified date and the six permission flags
+    """
+    stats = os.stat(file_path)
+    permissions = stats.st_mode
+    return (
+        stats.st_size,
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stats.st_ctime)),
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stats.st_mtime)),
+        int(bool(permissions & stat.S_IRUSR)),
+        int(bool(permissions & stat.S_IWUSR)),
+        int(bool(permissions & stat.S_IXUSR)),
+        int(bool(permissions & stat.S_IROTH)),
+        int(bool(permissions & stat.S_IWOTH)),
+        int(bool(permissions & stat.S_IXOTH)),
+    )
+
+
+def bulk_load_directory(directory_path, oid=1):
+    """
+    Description:
+        Function to load a directory tree in one walk and one transaction. Directory
+        and blob ids are handed out in memory (directories are keyed by their full
+        path, so names may repeat), rows go in with parameterized executemany calls
+        of BULK_BATCH files, and the blob_id index and refcount trigger are dropped
+        while loading and rebuilt, with every refcount, once at the end
+    Args:
+        directory_path: (str) directory path
+        oid: (int) owner id
+    Returns:
+        (dict) files and directories loaded, seconds taken and files per second
+    """
+    global conn
+    db = conn.conn
+    start = time.perf_counter()
+    root_path = os.path.normpath(directory_path)
+
+    next_dir = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM directories").fetchone()[0]
+    next_blob = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM blobs").fetchone()[0]
+    blob_ids = dict(db.execute("SELECT hash, id FROM blobs"))  # dedup against what is stored already
+    dir_ids = {}
+    directories, blobs, files = [], [], []
+    file_count = 0
+
+    def flush():
+        db.executemany("INSERT INTO directories (id, pid, oid, name) VALUES (?, ?, ?, ?)", directories)
+        db.executemany(
+            "INSERT INTO blobs (id, hash, size, contents, codec, frames) VALUES (?, ?, ?, ?, ?, ?)", blobs
+        )
+        db.executemany(
+            """
+            INSERT INTO files (
+            pid, oid, name, size, creation_date, modified_date,
+            read_permission, write_permission, execute_permission,
+            world_read, world_write, world_execute, blob_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            files,
+        )
+        directories.clear()
+        blobs.clear()
+        files.clear()
+
+    db.execute("BEGIN")
+    try:
+        db.execute("DROP TRIGGER IF EXISTS blobs_ref_on_insert")
+        db.execute("DROP INDEX IF EXISTS idx_files_blob_id")
+
+        for root, dirs, names in os.walk(root_path):
+            did = dir_ids[root] = next_dir
+            next_dir += 1
+            if root == root_path:
+                directories.append((did, 0, 1, os.path.basename(root)))
+            else:
+                directories.append((did, dir_ids[os.path.dirname(root)], oid, os.path.basename(root)))
+
+            for name in names:
+                file_path = os.path.join(root, name)
+                with open(file_path, "rb") as binary_file:
+                    contents = binary_file.read()
+
+                digest = hashlib.sha256(contents).hexdigest()
+                blob_id = blob_ids.get(digest)
+                if blob_id is None:
+                    blob_id = blob_ids[digest] = next_blob
+                    next_blob += 1
+                    codec, stored, frames = compressContents(contents)
+                    blobs.append((blob_id, digest, len(contents), stored, codec, frames))
+
+                files.append((did, oid, name, *fileMetadata(file_path), blob_id))
+                file_count += 1
+                if len(files) >= BULK_BATCH:
+                    flush()
+        flush()
+
+        db.execute(BLOB_ID_INDEX)
+        db.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM files WHERE blob_id = blobs.id)")
+        db.execute(BLOB_REF_ON_INSERT)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+    seconds = time.perf_counter() - start
+    return {
+        "files": file_count,
+        "directories": len(dir_ids),
+        "seconds": round(seconds, 2),
+        "files_per_sec": round(file_count / seconds) if seconds else file_count,
+    }
+
+
+def pipeline_load_directory(directory_path, oid=1, workers=PIPELINE_WORKERS, progress_every=1.0):
+    """
+    Description:
+        Function to load a directory tree with a producer/consumer pipeline. A walker
+        thread hands out directory ids and queues every file, a pool of reader threads
+        stats, reads, hashes and (for contents not stored yet) compresses them, and
+        the calling thread is the only writer, inserting BULK_BATCH files per
+        transaction. The queues between the stages are bounded, so a slow stage holds
+        the others back instead of filling memory. Every directory and file written is
+        recorded in import_checkpoint in the same transaction, so an interrupted import
+        run again with the same root skips what was committed; the checkpoint rows are
+        removed once the import finishes. An exception in the walker or a reader is
+        passed to the writer and raised there, leaving the checkpoint for a rerun
+    Args:
+        directory_path: (str) directory path
+        oid: (int) owner id
+        workers: (int) number of reader threads
+        progress_every: (float) seconds between progress lines
+    Returns:
+        (dict) files and directories loaded, files resumed and skipped, seconds taken and files per second
+    """
+    global conn
+    db = conn.conn
+    start = time.perf_counter()
+    root_path = os.path.abspath(directory_path)
+
+    done_dirs = dict(db.execute("SELECT path, id FROM import_checkpoint WHERE kind = 'dir'"))
+    done_files = {path for (path,) in db.execute("SELECT path FROM import_checkpoint WHERE kind = 'file'")}
+    stored = {digest for (digest,) in db.execute("SELECT hash FROM blobs")}
+    claimed = set(stored)  # hashes some reader has already compressed, or that are stored
+    claim_lock = threading.Lock()
+    next_dir = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM directories").fetchone()[0]
+
+    jobs = queue.Queue(PIPELINE_QUEUE)  # walker -> readers: (did, name, path)
+    rows = queue.Queue(PIPELINE_QUEUE)  # walker and readers -> writer
+    stop = threading.Event()  # set when the writer stops, so the other stages give up
+    found = {"files": 0, "resumed": 0}
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def walk():
+        nonlocal next_dir
+        dir_ids = {}
+        try:
+            for root, dirs, names in os.walk(root_path):
+                if stop.is_set():
+                    return
+                did = done_dirs.get(root)
+                if did is None:
+                    did, next_dir = next_dir, next_dir + 1
+                    if root == root_path:
+                        put(rows, ("dir", root, (did, 0, 1, os.path.basename(root))))
+                    else:
+                        put(rows, ("dir", root, (did, dir_ids[os.path.dirname(root)], oid, os.path.basename(root))))
+                dir_ids[root] = did
+                for name in names:
+                    path = os.path.join(root, name)
+                    if path in done_files:
+                        found["resumed"] += 1
+                    else:
+                        found["files"] += 1
+                        put(jobs, (did, name, path))
+        except BaseException as e:
+            put(rows, ("failed", root_path, e))  # queued before any reader can see its end marker
+        finally:
+            for _ in range(workers):
+                put(jobs, None)
+
+    def read():
+        try:
+            while (job := get(jobs)) is not None:
+                did, name, path = job
+                try:
+                    metadata = fileMetadata(path)
+                    with open(path, "rb") as binary_file:
+                        contents = binary_file.read()
+                except OSError as e:
+                    put(rows, ("error", path, str(e)))
+                    continue
+                digest = hashlib.sha256(contents).hexdigest()
+                with claim_lock:
+                    new = digest not in claimed
+                    claimed.add(digest)
+                blob = (digest, len(contents), *compressContents(contents)) if new else None
+                put(rows, ("file", path, (did, oid, name, *metadata, digest), blob))
+        except BaseException as e:
+            put(rows, ("failed", root_path, e))
+        finally:
+            put(rows, None)  # one end marker per reader
+
+    threads = [threading.Thread(target=walk, daemon=True)]
+    threads += [threading.Thread(target=read, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    directories, blobs, files, checkpoint = [], [], [], []
+    waiting = {}  # hash -> files whose blob another reader has not delivered yet
+    written = {"files": 0, "directories": 0, "skipped": 0}
+    last_report = time.perf_counter()
+
+    def flush():
+        db.executemany("INSERT INTO directories (id, pid, oid, name) VALUES (?, ?, ?, ?)", directories)
+        db.executemany(
+            "INSERT INTO blobs (hash, size, codec, contents, frames) VALUES (?, ?, ?, ?, ?)", blobs
+        )
+        db.executemany(
+            """
+            INSERT INTO files (
+            pid, oid, name, size, creation_date, modified_date,
+            read_permission, write_permission, execute_permission,
+            world_read, world_write, world_execute, blob_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT id FROM blobs WHERE hash = ?))
+            """,
+            files,
+        )
+        db.executemany("INSERT OR REPLACE INTO import_checkpoint (path, kind, id) VALUES (?, ?, ?)", checkpoint)
+        db.commit()
+        written["files"] += len(files)
+        written["directories"] += len(directories)
+        for batch in (directories, blobs, files, checkpoint):
+            batch.clear()
+
+    try:
+        ended = 0
+        while ended < workers:
+            item = rows.get()
+            if item is None:
+                ended += 1
+                continue
+            kind, path = item[0], item[1]
+            if kind == "dir":
+                directories.append(item[2])
+                checkpoint.append((path, "dir", item[2][0]))
+            elif kind == "error":
+                written["skipped"] += 1
+                print(f"Skipped {path}: {item[2]}")
+            elif kind == "failed":
+                # A stage died: stop here so the checkpoint is kept and a rerun resumes
+                raise item[2]
+            else:
+                row, blob = item[2], item[3]
+                digest = row[-1]
+                if blob is not None:
+                    blobs.append(blob)
+                    stored.add(digest)
+                    for held_path, held_row in waiting.pop(digest, []):
+                        files.append(held_row)
+                        checkpoint.append((held_path, "file", None))
+                if digest in stored:
+                    files.append(row)
+                    checkpoint.append((path, "file", None))
+                else:
+                    waiting.setdefault(digest, []).append((path, row))
+
+            if len(files) >= BULK_BATCH:
+                flush()
+                if time.perf_counter() - last_report >= progress_every:
+                    last_report = time.perf_counter()
+                    rate = written["files"] / (last_report - start)
+                    print(f"{written['files']} of {found['files']} files found so far, {rate:.0f} files/sec")
+        flush()
+    except BaseException:
+        db.rollback()  # batches already committed stay, with their checkpoint rows
+        raise
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    db.execute("DELETE FROM import_checkpoint WHERE path = ? OR substr(path, 1, ?) = ?",
+               (root_path, len(root_path) + 1, root_path + os.sep))
+    db.commit()
+
+    seconds = time.perf_counter() - start
+    return {
+        "files": written["files"],
+        "directories": written["directories"],
+        "resumed": found["resumed"],
+        "skipped": written["skipped"],
+        "seconds": round(seconds, 2),
+        "files_per_sec": round(written["files"] / seconds) if seconds else written["files"],
+    }
+
+
+def sync_directory(directory_path, oid=1):
+    """
+    Description:
+        Function to bring the database copy of a directory tree (the directory with
+        pid 0 named after the root) up to date with the host, in one transaction.
+        A file whose size and modified date match its row is left alone without
+        being read. A file whose size differs is read and stored again; one whose
+        size matches but modified date does not is read and hashed, and only its
+        dates are updated if the hash matches its blob. Permission changes are
+        picked up from the stat alone. Files and directories gone from the host are
+        deleted, as are duplicate rows left by loading the same tree twice
+    Args:
+        directory_path: (str) directory path
+        oid: (int) owner id
+    Returns:
+        (dict) files added, updated, retouched (dates or permissions only), deleted,
+        unchanged and read, directories added and deleted, and seconds taken
+    """
+    global conn
+    db = conn.conn
+    start = time.perf_counter()
+    root_path = os.path.normpath(directory_path)
+    counts = dict.fromkeys(
+        ["added", "updated", "retouched", "deleted", "unchanged", "read", "dirs_added", "dirs_deleted"], 0
+    )
+
+    def blobId(contents):
+        digest = hashlib.sha256(contents).hexdigest()
+        codec, stored, frames = compressContents(contents)
+        db.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, codec, contents, frames) VALUES (?, ?, ?, ?, ?)",
+            (digest, len(contents), codec, stored, frames),
+        )
+        return db.execute("SELECT id FROM blobs WHERE hash = ?", (digest,)).fetchone()[0]
+
+    db.execute("BEGIN")
+    try:
+        root_name = os.path.basename(root_path)
+        if db.execute("SELECT 1 FROM directories WHERE pid = 0 AND name = ?", (root_name,)).fetchone() is None:
+            db.execute("INSERT INTO directories (pid, oid, name) VALUES (0, 1, ?)", (root_name,))
+            counts["dirs_added"] += 1
+
+        # Every directory under the root by its path relative to it ('' for the root);
+        # of two with the same path (a tree loaded twice), the older one is kept and
+        # the other deleted
+        tree = """
+            WITH RECURSIVE tree (id, path) AS (
+                SELECT id, '' FROM directories WHERE pid = 0 AND name = ?
+                UNION ALL
+                SELECT d.id, CASE WHEN tree.path = '' THEN d.name ELSE tree.path || '/' || d.name END
+                FROM directories d JOIN tree ON d.pid = tree.id
+            )
+            """
+        all_dirs = db.execute(tree + "SELECT path, id FROM tree ORDER BY id DESC", (root_name,)).fetchall()
+        db_dirs = dict(all_dirs)
+        db_files = {}
+        duplicates = []
+        for file_row in db.execute(
+            tree
+            + """
+            SELECT f.id, f.pid, f.name, f.size, f.modified_date,
+                   f.read_permission, f.write_permission, f.execute_permission,
+                   f.world_read, f.world_write, f.world_execute, b.hash
+            FROM files f JOIN tree ON f.pid = tree.id LEFT JOIN blobs b ON b.id = f.blob_id
+            ORDER BY f.id
+            """,
+            (root_name,),
+        ):
+            key = (file_row[1], file_row[2])
+            if key in db_files:
+                duplicates.append(file_row[0])
+            else:
+                db_files[key] = file_row
+
+        seen_dirs = set()
+        for root, dirs, names in os.walk(root_path):
+            rel = os.path.relpath(root, root_path).replace(os.sep, "/")
+            rel = "" if rel == "." else rel
+            seen_dirs.add(rel)
+            did = db_dirs.get(rel)
+            if did is None:
+                parent = rel.rpartition("/")[0]
+                did = db_dirs[rel] = db.execute(
+                    "INSERT INTO directories (pid, oid, name) VALUES (?, ?, ?)",
+                    (db_dirs[parent], oid, os.path.basename(root)),
+                ).lastrowid
+                counts["dirs_added"] += 1
+
+            for name in names:
+                file_path = os.path.join(root, name)
+                metadata = fileMetadata(file_path)
+                size, creation_date, modified_date, *permissions = metadata
+                old = db_files.pop((did, name), None)
+
+                if old is None:
+                    with open(file_path, "rb") as binary_file:
+                        contents = binary_file.read()
+                    counts["read"] += 1
+                    db.execute(
+                        """
+                        INSERT INTO files (
+                        pid, oid, name, size, creation_date, modified_date,
+                        read_permission, write_permission, execute_permission,
+                        world_read, world_write, world_execute, blob_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (did, oid, name, *metadata, blobId(contents)),
+                    )
+                    counts["added"] += 1
+                    continue
+
+                file_id, old_size, old_modified, old_permissions, old_hash = (
+                    old[0], old[3], old[4], list(old[5:11]), old[11]
+                )
+                if size == old_size and modified_date == old_modified:
+                    if permissions == old_permissions:
+                        counts["unchanged"] += 1
+                        continue
+                    contents = None  # only the permission bits changed
+                else:
+                    with open(file_path, "rb") as binary_file:
+                        contents = binary_file.read()
+                    counts["read"] += 1
+                    if size == old_size and hashlib.sha256(contents).hexdigest() == old_hash:
+                        contents = None  # touched, same contents
+
+                db.execute(
+                    """
+                    UPDATE files SET size = ?, modified_date = ?,
+                    read_permission = ?, write_permission = ?, execute_permission = ?,
+                    world_read = ?, world_write = ?, world_execute = ?
+                    WHERE id = ?
+                    """,
+                    (size, modified_date, *permissions, file_id),
+                )
+                if contents is None:
+                    counts["retouched"] += 1
+                else:
+                    db.execute("UPDATE files SET blob_id = ? WHERE id = ?", (blobId(contents), file_id))
+                    counts["updated"] += 1
+
+        # Whatever is left was not found on the host
+        gone = [file_row[0] for file_row in db_files.values()] + duplicates
+        gone_dirs = [did for rel, did in all_dirs if rel not in seen_dirs or db_dirs[rel] != did]
+        db.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in gone])
+        db.executemany("DELETE FROM directories WHERE id = ?", [(did,) for did in gone_dirs])
+        counts["deleted"] = len(gone)
+        counts["dirs_deleted"] = len(gone_dirs)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
+
 def usage():
-    print("Usage: python create_and_load_db.py <root_dir> <db_name>")
-    print("Example: python create_and_load_db.py /home/user1/files/ files.db")
+    print("Usage: python db_primer.py <root_dir> <db_name> [--bulk | --pipeline | --sync]")
+    print("Example: python db_primer.py /home/user1/files/ files.db --bulk")
+    print("--bulk loads the whole tree in one transaction and reports files/sec")
+    print("--pipeline reads files on several threads and commits in batches; if it is")
+    print("interrupted, run it again on the same root (keeping the database) to resume")
+    print("--sync updates a tree loaded before with only what changed on the host")
     sys.exit(1)
 
 
@@ -249,6 +809,9 @@ if __name__ == "__main__":
     if len(sys.argv) > 2:
         root_dir = sys.argv[1]
         db = sys.argv[2]
+        bulk = "--bulk" in sys.argv[3:]
+        pipeline = "--pipeline" in sys.argv[3:]
+        sync = "--sync" in sys.argv[3:]
     else:
         usage()
 
@@ -265,7 +828,14 @@ if __name__ == "__main__":
         printResults(res)
 
     # Traverse the directory
-    load_directory(root_dir)
+    if bulk:
+        printResults(bulk_load_directory(root_dir))
+    elif pipeline:
+        printResults(pipeline_load_directory(root_dir))
+    elif sync:
+        printResults(sync_directory(root_dir))
+    else:
+        load_directory(root_dir)
 
     # Close the connection
     conn.closeConnection()
\ No newline at end of file
@@ -33,7 +33,7 @@ __all__ = [
     'less',
     'ls',
     'mkdir',
-    'more'
+    'more',
     'mv',
     'pwd',
     'rm',